@@ -0,0 +1,1362 @@
+"""
+性能基准与压力测试脚本
+
+所有测试都在临时目录中运行，不会修改 data/ 下的真实数据。
+
+用法:
+    python benchmark.py stress [--threads 16] [--users 8] [--trades 300]
+    python benchmark.py stock-update [--sizes 100 1000 5000]
+    python benchmark.py fetch [--symbols 200] [--latency 0.05] [--concurrency 8] [--rate 50] [--fail-rate 0.05]
+    python benchmark.py startup [--symbols 5000] [--budget 3.0]
+    python benchmark.py importtime [--top 15] [--threshold 0.6] [--forbid akshare matplotlib ...]
+    python benchmark.py recommend [--symbols 2000] [--max-bars 40]
+    python benchmark.py recommend-pool [--symbols 20000] [--max-bars 40] [--workers 1 2 4] [--shard-size 500]
+    python benchmark.py recommend-stream [--symbols 2000] [--latency 0.2]
+    python benchmark.py backtest [--symbols 2000] [--bars 750] [--top-n 10] [--holding 5] [--fee 0.0015]
+    python benchmark.py optimize [--symbols 1000] [--bars 500] [--method grid] [--step 0.2] [--workers 1 2]
+    python benchmark.py streaming [--symbols 500] [--bars 80] [--seed-bars 25] [--rsi-method sma]
+    python benchmark.py indicators [--symbols 2000] [--max-bars 60] [--repeat 5]
+    python benchmark.py quotes [--symbols 5000] [--callers 8] [--latency 0.5] [--max-age 5]
+    python benchmark.py outage [--symbols 2000] [--cached 0.8] [--refreshes 6] [--threshold 3]
+    python benchmark.py gateway [--prefetch 200] [--latency 0.05] [--concurrency 8] [--rate 100]
+    python benchmark.py providers [--symbols 2000] [--days 365] [--charts 50] [--trades 2000] [--seed 0]
+    python benchmark.py replay [--symbols 500] [--days 60] [--interval d] [--users 20] [--trades-per-tick 20]
+"""
+import os
+import sys
+import re
+import json
+import time
+import random
+import argparse
+import subprocess
+import tempfile
+import threading
+
+# 切换工作目录后仍能导入 modules 包
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT_DIR)
+
+
+def use_temp_data_dir():
+    """切换到临时目录，数据库会在其中创建 data/ 目录"""
+    tmp_dir = tempfile.mkdtemp(prefix="stock_bench_")
+    os.chdir(tmp_dir)
+    return tmp_dir
+
+
+def print_lock_stats(stats):
+    """打印锁等待统计"""
+    print(f"{'锁':<16}{'次数':>10}{'平均等待(ms)':>16}{'最大等待(ms)':>16}")
+    for name, stat in sorted(stats.items()):
+        print(f"{name:<16}{stat['count']:>10}{stat['avg_wait'] * 1000:>16.3f}{stat['max_wait'] * 1000:>16.3f}")
+
+
+def run_stress(args):
+    """
+    多线程压力测试：交易线程并发买卖，同时有线程不断更新和读取股价，
+    结束后用交易日志核对每个用户的余额和持仓是否守恒
+    """
+    use_temp_data_dir()
+    from modules.database import db
+
+    initial_balance = 1000000.0
+    usernames = [f"stress{i}" for i in range(args.users)]
+    for username in usernames:
+        db.add_user(username, "pwd", "user", initial_balance)
+    codes = list(db.get_stocks().keys())
+
+    errors = []
+    stop_event = threading.Event()
+
+    def trader(seed):
+        rng = random.Random(seed)
+        for _ in range(args.trades):
+            username = rng.choice(usernames)
+            code = rng.choice(codes)
+            trade_type = rng.choice(["buy", "sell"])
+            try:
+                db.execute_trade(username, trade_type, code, rng.randint(1, 10))
+            except Exception as e:
+                errors.append(e)
+
+    def price_writer(seed):
+        rng = random.Random(seed)
+        while not stop_event.is_set():
+            code = rng.choice(codes)
+            stock = db.get_stock(code)
+            db.update_stock(code, {"price": round(stock["price"] * rng.uniform(0.98, 1.02), 2)})
+
+    def price_reader():
+        while not stop_event.is_set():
+            db.get_stocks()
+
+    background = [threading.Thread(target=price_writer, args=(i,)) for i in range(2)]
+    background += [threading.Thread(target=price_reader) for _ in range(2)]
+    traders = [threading.Thread(target=trader, args=(i,)) for i in range(args.threads)]
+
+    start = time.perf_counter()
+    for t in background + traders:
+        t.start()
+    for t in traders:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stop_event.set()
+    for t in background:
+        t.join()
+    db.flush()
+
+    # 用交易日志重新计算余额和持仓
+    failures = []
+    total_trades = 0
+    for username in usernames:
+        balance = initial_balance
+        quantities = {}
+        transactions = db.get_user_transactions(username)
+        total_trades += len(transactions)
+        for t in transactions:
+            sign = 1 if t["type"] == "buy" else -1
+            balance -= sign * t["amount"]
+            quantities[t["stock_code"]] = quantities.get(t["stock_code"], 0) + sign * t["quantity"]
+        user = db.get_user(username)
+        held = {code: h["quantity"] for code, h in user["holdings"].items()}
+        expected = {code: q for code, q in quantities.items() if q}
+        if abs(user["balance"] - balance) > 1e-6 or held != expected:
+            failures.append(username)
+
+    print(f"交易线程: {args.threads}, 用户: {args.users}, 成交: {total_trades} 笔, "
+          f"耗时: {elapsed:.2f}s, 吞吐: {total_trades / elapsed:.1f} 笔/秒")
+    print_lock_stats(db.get_lock_stats())
+    if errors:
+        print(f"交易异常: {errors[:5]}")
+    if failures or errors:
+        print(f"守恒校验失败: {failures}")
+        return 1
+    print("守恒校验通过：所有用户的余额和持仓与交易日志一致")
+    return 0
+
+
+def make_stock_universe(size):
+    """生成指定数量的模拟股票 {code: info}"""
+    rng = random.Random(size)
+    return {
+        f"{'sh' if i % 2 else 'sz'}.{600000 + i:06d}": {
+            "name": f"股票{i}", "price": round(rng.uniform(2, 200), 2), "change": 0.0
+        }
+        for i in range(size)
+    }
+
+
+def run_stock_update(args):
+    """对比逐只 update_stock（每次重写 stocks.json）与批量 update_stocks 的单次刷新耗时"""
+    use_temp_data_dir()
+    from modules.database import db
+
+    print(f"{'股票数':>8}{'逐只写入(s)':>16}{'批量写入(s)':>16}{'加速比':>10}")
+    for size in args.sizes:
+        universe = make_stock_universe(size)
+        db.update_stocks(universe)
+        db.flush()
+        updates = {code: {"price": info["price"] * 1.01, "change": 1.0} for code, info in universe.items()}
+
+        # 旧方式：每只股票一次整文件写入
+        start = time.perf_counter()
+        for code, data in updates.items():
+            db.update_stock(code, data)
+            db.flush()
+        per_symbol = time.perf_counter() - start
+
+        # 新方式：整批一次写入
+        start = time.perf_counter()
+        db.update_stocks(updates)
+        db.flush()
+        bulk = time.perf_counter() - start
+
+        print(f"{size:>8}{per_symbol:>16.3f}{bulk:>16.4f}{per_symbol / bulk:>10.0f}x")
+    return 0
+
+
+def run_fetch(args):
+    """
+    用模拟上游（固定延迟 + 随机失败）对比逐只串行获取与经请求网关并发获取（获取引擎限流和重试）的总耗时
+    """
+    from modules.fetch_engine import FetchEngine, FetchReport
+    from modules.market_gateway import MarketGateway
+
+    codes = list(make_stock_universe(args.symbols).keys())
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+
+    def upstream(code):
+        time.sleep(args.latency * random.uniform(0.5, 1.5))
+        with rng_lock:
+            failed = rng.random() < args.fail_rate
+        if failed:
+            raise ConnectionError(f"模拟 {code} 请求失败")
+        return code
+
+    # 串行：不限流、不重试
+    start = time.perf_counter()
+    for code in codes:
+        try:
+            upstream(code)
+        except ConnectionError:
+            pass
+    sequential = time.perf_counter() - start
+
+    engine = FetchEngine({
+        "default": {"rate": args.rate, "burst": args.concurrency, "retries": 2, "backoff": 0.05},
+    })
+    gateway = MarketGateway(args.concurrency)
+
+    def fetch(code):
+        fetch_start = time.perf_counter()
+        return engine.call("mock", upstream, code), time.perf_counter() - fetch_start
+
+    # 与价格同步相同的路径：每只股票一个网关请求，网关控制并发，获取引擎按上游限流和重试
+    results, errors, latencies = {}, {}, {}
+    start = time.perf_counter()
+    for code, result, error in gateway.imap(fetch, codes):
+        if error is not None:
+            errors[code] = error
+            latencies[code] = time.perf_counter() - start
+        else:
+            results[code], latencies[code] = result
+    report = FetchReport(results, errors, latencies, time.perf_counter() - start)
+    gateway.close()
+
+    print(f"串行获取: {sequential:.2f}s")
+    print(f"并发获取: {report.summary()}")
+    print(f"加速比: {sequential / report.wall_time:.1f}x")
+    return 1 if report.errors else 0
+
+
+# 在子进程中测量启动耗时：有图形界面时计到登录界面绘制完成，否则计到模块导入完成
+STARTUP_PROBE = """
+import os, sys, json, time
+start = time.perf_counter()
+import stock_simulation_system as app_module
+from modules.stock_data import stock_manager
+result = {"import": time.perf_counter() - start}
+if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+    root = app_module.tb.Window(themename="darkly")
+    app = app_module.StockSimulationApp(root)
+    root.update()
+    result["login_shown"] = time.perf_counter() - start
+    root.destroy()
+warmup_start = time.perf_counter()
+stock_manager.start_warmup()
+result["start_warmup"] = time.perf_counter() - warmup_start
+with open(os.environ["STARTUP_RESULT"], "w") as f:
+    json.dump(result, f)
+os._exit(0)
+"""
+
+
+def run_startup(args):
+    """
+    在全新子进程中测量登录界面出现前的耗时，并检查后台预热不会阻塞启动
+    """
+    use_temp_data_dir()
+    os.makedirs("data", exist_ok=True)
+    with open(os.path.join("data", "stocks.json"), "w", encoding="utf-8") as f:
+        json.dump(make_stock_universe(args.symbols), f, ensure_ascii=False)
+
+    result_path = os.path.abspath("startup_result.json")
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR, STARTUP_RESULT=result_path)
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", STARTUP_PROBE], env=env,
+                          capture_output=True, text=True, timeout=600)
+    total = time.perf_counter() - start
+    if proc.returncode != 0:
+        print(proc.stderr)
+        return 1
+    with open(result_path, "r") as f:
+        result = json.load(f)
+
+    measured = result.get("login_shown", result["import"])
+    stage = "登录界面显示" if "login_shown" in result else "模块导入（无图形界面）"
+    print(f"股票数: {args.symbols}")
+    print(f"{stage}: {measured:.2f}s（预算 {args.budget:.2f}s）")
+    print(f"启动后台预热: {result['start_warmup'] * 1000:.1f}ms")
+    print(f"子进程总耗时（含解释器启动）: {total:.2f}s")
+    if measured > args.budget:
+        print("超出启动预算")
+        return 1
+    return 0
+
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_importtime(args):
+    """
+    用 -X importtime 导入主程序模块，按顶层包汇总导入耗时；
+    总耗时超过阈值或加载了登录前不应加载的模块时返回失败
+    """
+    use_temp_data_dir()
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import stock_simulation_system"],
+                          env=env, capture_output=True, text=True, timeout=600)
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        return 1
+
+    total = 0.0
+    package_self = {}
+    project_modules = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        package = name.split(".")[0]
+        package_self[package] = package_self.get(package, 0) + int(self_us) / 1e6
+        if package == "modules":
+            project_modules[name] = int(cumulative_us) / 1e6
+        if name == "stock_simulation_system":
+            total = int(cumulative_us) / 1e6
+
+    print(f"导入 stock_simulation_system 总耗时: {total * 1000:.1f}ms（阈值 {args.threshold * 1000:.0f}ms）")
+    print(f"\n{'顶层包':<28}{'自身耗时合计(ms)':>18}")
+    for package, seconds in sorted(package_self.items(), key=lambda x: -x[1])[:args.top]:
+        print(f"{package:<28}{seconds * 1000:>18.1f}")
+    print(f"\n{'项目模块':<28}{'累计耗时(ms)':>18}")
+    for name, seconds in sorted(project_modules.items(), key=lambda x: -x[1]):
+        print(f"{name:<28}{seconds * 1000:>18.1f}")
+
+    failed = False
+    loaded = sorted(set(args.forbid) & set(package_self))
+    if loaded:
+        print(f"\n登录前加载了不应加载的模块: {', '.join(loaded)}")
+        failed = True
+    if total > args.threshold:
+        print(f"\n导入耗时超过阈值 {args.threshold * 1000:.0f}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+def make_bar_frames(symbols, max_bars, seed=0):
+    """
+    生成模拟日K线 {code: DataFrame}：长度、波动率各不相同，包含价格不变、零成交量和放量的股票
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    frames = {}
+    for i, code in enumerate(make_stock_universe(symbols)):
+        length = int(rng.integers(1, max_bars + 1))
+        if i % 17 == 0:
+            close = np.full(length, round(float(rng.uniform(2, 200)), 2))
+        else:
+            returns = rng.normal(0, rng.uniform(0.005, 0.08), length)
+            close = np.round(rng.uniform(2, 200) * np.cumprod(1 + returns), 2)
+        volume = rng.integers(1000, 100000, length)
+        if i % 13 == 0:
+            volume[:] = 0
+        elif i % 5 == 0:
+            volume[-1] *= 3
+        dates = pd.bdate_range(end="2026-10-16", periods=length).strftime("%Y-%m-%d")
+        frames[code] = pd.DataFrame({"date": dates, "close": close, "volume": volume})
+    return frames
+
+
+def run_recommend(args):
+    """
+    推荐引擎：逐只分析与面板批量分析的结果一致性校验和耗时对比
+    """
+    use_temp_data_dir()
+    from modules.recommendation import StockRecommendationEngine
+
+    engine = StockRecommendationEngine()
+    frames = make_bar_frames(args.symbols, args.max_bars)
+    frames[next(iter(frames))] = frames[next(iter(frames))].iloc[0:0]  # 一只没有数据的股票
+
+    start = time.perf_counter()
+    expected = {code: engine.analyze_dataframe(df) for code, df in frames.items()}
+    per_stock = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = engine.analyze_frames(frames)
+    batch = time.perf_counter() - start
+
+    mismatches = [
+        code for code, (probability, reason) in expected.items()
+        if abs(float(probability) - float(actual[code][0])) > 1e-9 or reason != actual[code][1]
+    ]
+    print(f"股票数: {args.symbols}, 最多K线数: {args.max_bars}")
+    print(f"逐只分析: {per_stock:.3f}s, 批量分析: {batch:.4f}s, 加速比: {per_stock / batch:.0f}x")
+    if mismatches:
+        for code in mismatches[:10]:
+            print(f"不一致 {code}: 逐只 {expected[code]} 批量 {actual[code]}")
+        print(f"一致性校验失败: {len(mismatches)} 只股票结果不同")
+        return 1
+    print("一致性校验通过：所有股票的概率和推荐理由与逐只分析相同")
+    return 0
+
+
+def run_recommend_pool(args):
+    """
+    多进程推荐打分：不同进程数下的耗时、首个分片的延迟和与单进程批量分析的一致性
+    """
+    use_temp_data_dir()
+    from modules.recommendation import StockRecommendationEngine
+    from modules.score_pool import ParallelScorer
+
+    engine = StockRecommendationEngine()
+    frames = make_bar_frames(args.symbols, args.max_bars)
+
+    start = time.perf_counter()
+    expected = engine.analyze_frames(frames)
+    single = time.perf_counter() - start
+    print(f"股票数: {args.symbols}, 最多K线数: {args.max_bars}, 分片大小: {args.shard_size}, CPU核心数: {os.cpu_count()}")
+    print(f"{'进程数':<8}{'耗时(s)':>10}{'首个分片(s)':>14}{'加速比':>10}")
+    print(f"{'单进程':<8}{single:>10.3f}{'-':>14}{1:>10.2f}")
+
+    status = 0
+    for workers in args.workers:
+        scorer = ParallelScorer(workers, args.shard_size)
+        scorer.score(dict(list(frames.items())[:1]), engine.indicators_weights)  # 预先启动进程池
+        first, actual = [], {}
+        start = time.perf_counter()
+        for shard in scorer.iter_scores(frames, engine.indicators_weights):
+            first = first or [time.perf_counter() - start]
+            actual.update(shard)
+        elapsed = time.perf_counter() - start
+        scorer.close()
+        print(f"{workers:<8}{elapsed:>10.3f}{first[0]:>14.3f}{single / elapsed:>10.2f}")
+        mismatches = [code for code, (probability, reason) in expected.items()
+                      if abs(float(probability) - actual[code][0]) > 1e-9 or reason != actual[code][1]]
+        if mismatches:
+            print(f"一致性校验失败: {workers} 个进程时 {len(mismatches)} 只股票结果不同")
+            status = 1
+    if not status:
+        print("一致性校验通过：多进程结果与单进程批量分析相同")
+    return status
+
+
+def run_recommend_stream(args):
+    """
+    冷缓存下逐只产出推荐结果：首个结果、前100个结果和全部结果的耗时（历史数据获取用固定延迟模拟）
+    """
+    use_temp_data_dir()
+    from modules.database import db
+    from modules.recommendation import StockRecommendationEngine
+
+    db.update_stocks(make_stock_universe(args.symbols))
+    frames = dict(zip(db.get_stocks(), make_bar_frames(len(db.get_stocks()), 40).values()))
+
+    def load_history(code):
+        time.sleep(args.latency * random.uniform(0.5, 1.5))
+        return frames[code]
+
+    engine = StockRecommendationEngine()
+    engine.load_history = load_history
+    marks = {}
+    start = time.perf_counter()
+    count = 0
+    for _ in engine.iter_recommendations():
+        count += 1
+        if count in (1, 100):
+            marks[count] = time.perf_counter() - start
+    total = time.perf_counter() - start
+
+    print(f"股票数: {count}, 模拟获取延迟: {args.latency}s")
+    print(f"首个结果: {marks.get(1, 0):.3f}s, 前100个结果: {marks.get(100, total):.3f}s, 全部结果: {total:.2f}s")
+    print("（一次性返回时要等全部结果完成才能显示）")
+    return 0 if marks.get(1, total) < 1.0 else 1
+
+
+def run_backtest(args):
+    """
+    推荐信号回测：多年日K线上的向量化滚动回测耗时，并抽样校验每日信号与推荐引擎逐只分析一致
+    """
+    use_temp_data_dir()
+    import numpy as np
+    import pandas as pd
+    from modules.backtest import DatePanel, window_signals, run_backtest as backtest
+    from modules.recommendation import StockRecommendationEngine
+    from modules.streaming import LOOKBACK_DAYS
+
+    engine = StockRecommendationEngine()
+    frames = make_bar_frames(args.symbols, args.bars)
+
+    start = time.perf_counter()
+    panel = DatePanel(frames)
+    signals = window_signals(panel)
+    prepared = time.perf_counter() - start
+    start = time.perf_counter()
+    result = backtest(panel, engine.indicators_weights, args.top_n, args.holding, args.fee, args.side, signals)
+    simulated = time.perf_counter() - start
+
+    symbol_years = sum(len(df) for df in frames.values()) / 252
+    print(f"股票数: {len(panel.codes)}, 交易日: {len(panel.dates)}, 合计 {symbol_years:.0f} 股票·年")
+    print(f"构建面板与信号: {prepared:.2f}s, 模拟交易: {simulated:.3f}s, "
+          f"{symbol_years / (prepared + simulated):.0f} 股票·年/秒")
+    for name, value in result.metrics(args.holding).items():
+        print(f"  {name:<20}{value:>12.4f}" if isinstance(value, float) else f"  {name:<20}{value:>12}")
+
+    # 抽样校验：在某天用最近30天数据逐只分析，与回测中该天的概率比较
+    from modules.indicators import combine_signals
+    probability = combine_signals(signals, engine.indicators_weights)
+    rng = np.random.default_rng(1)
+    mismatches = 0
+    for _ in range(args.samples):
+        col = int(rng.integers(len(panel.codes)))
+        df = frames[panel.codes[col]]
+        i = int(rng.integers(len(df)))
+        today = pd.Timestamp(df["date"].iloc[i])
+        cutoff = (today - pd.Timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+        window = df.iloc[:i + 1]
+        expected, _ = engine.analyze_dataframe(window[window["date"] >= cutoff])
+        row = int(np.searchsorted(panel.dates, np.datetime64(df["date"].iloc[i])))
+        if abs(float(expected) - float(probability[row, col])) > 1e-9:
+            mismatches += 1
+    if mismatches:
+        print(f"信号校验: {mismatches}/{args.samples} 个抽样与逐只分析不同（可能是均线恰好相等时的末位舍入）")
+    else:
+        print(f"信号校验通过：{args.samples} 个抽样与逐只分析相同")
+    return 1 if mismatches > args.samples // 100 else 0
+
+
+def run_optimize(args):
+    """
+    权重优化：矩阵乘法批量评估与逐个候选回测的耗时对比、结果一致性、不同进程数的耗时和配置文件读写
+    """
+    use_temp_data_dir()
+    import numpy as np
+    from modules.backtest import DatePanel, run_backtest as backtest, window_signals
+    from modules.indicators import DEFAULT_THRESHOLDS
+    from modules.weight_optimizer import (SIGNAL_KEYS, SignalFeatures, WeightOptimizer, simplex_grid,
+                                          save_weight_config, weights_to_dict)
+    from modules.config import get_config
+
+    frames = make_bar_frames(args.symbols, args.bars)
+    panel = DatePanel(frames)
+    start = time.perf_counter()
+    features = SignalFeatures.from_panel(panel, args.holding)
+    prepared = time.perf_counter() - start
+    weights = simplex_grid(args.step)
+    print(f"股票数: {len(panel.codes)}, 交易日: {len(panel.dates)}, 权重候选: {len(weights)}, 预计算: {prepared:.2f}s")
+
+    # 逐个候选完整回测（每次重新计算信号）与矩阵乘法批量评估对比
+    sample = weights[:args.compare]
+    start = time.perf_counter()
+    expected = [backtest(panel, weights_to_dict(vector), args.top_n, args.holding, args.fee, "long_short",
+                         window_signals(panel, DEFAULT_THRESHOLDS)).metrics(args.holding)["sharpe"]
+                for vector in sample]
+    naive = (time.perf_counter() - start) / len(sample)
+    optimizer = WeightOptimizer(features, args.top_n, args.holding, args.fee, max_workers=1)
+    start = time.perf_counter()
+    actual = [score for score, _, _, _ in optimizer.evaluate([(dict(DEFAULT_THRESHOLDS), sample)])]
+    batched = (time.perf_counter() - start) / len(sample)
+    print(f"每个候选: 逐个回测 {naive * 1000:.1f}ms, 批量评估 {batched * 1000:.1f}ms, 加速比 {naive / batched:.1f}x")
+    status = 0
+    if not np.allclose(expected, actual, rtol=1e-9, atol=1e-12):
+        print("一致性校验失败：批量评估与逐个回测的目标值不同")
+        status = 1
+    else:
+        print(f"一致性校验通过：{len(sample)} 个候选的目标值与逐个回测相同")
+
+    print(f"{'进程数':<8}{'评估数':>10}{'耗时(s)':>10}{'候选/秒':>10}")
+    best = None
+    for workers in args.workers:
+        optimizer = WeightOptimizer(features, args.top_n, args.holding, args.fee, max_workers=workers)
+        start = time.perf_counter()
+        results = optimizer.search(args.method, step=args.step, samples=args.samples, rounds=args.rounds)
+        elapsed = time.perf_counter() - start
+        print(f"{workers:<8}{optimizer.evaluated:>10}{elapsed:>10.2f}{optimizer.evaluated / elapsed:>10.0f}")
+        if best is not None and abs(best[0] - results[0][0]) > 1e-9:
+            print("不同进程数得到的最优结果不同")
+            status = 1
+        best = results[0]
+    score, weights_best, thresholds, _ = best
+    print(f"最优 sharpe={score:.4f} 权重={weights_best} 阈值={thresholds}")
+
+    # 写入配置文件后推荐引擎启动时应读到同样的权重
+    path = get_config()["recommendation_weights_path"]
+    save_weight_config(path, weights_best, thresholds, {"objective": "sharpe"})
+    version = save_weight_config(path, weights_best, thresholds, {"objective": "sharpe"})
+    from modules.recommendation import StockRecommendationEngine
+    engine = StockRecommendationEngine()
+    if (engine.weights_version != version or engine.indicators_weights != weights_best
+            or any(engine.signal_thresholds[key] != value for key, value in thresholds.items())):
+        print("配置文件校验失败：推荐引擎读取的权重与写入的不同")
+        status = 1
+    else:
+        print(f"配置文件校验通过：推荐引擎读取到第 {version} 版权重")
+    return status
+
+
+def run_streaming(args):
+    """
+    流式指标：逐根K线（含盘中替换）增量更新后与逐只分析结果的一致性、单次更新耗时和持久化恢复
+    """
+    use_temp_data_dir()
+    from datetime import datetime, timedelta
+    from modules.bar_cache import BarStore
+    from modules.recommendation import StockRecommendationEngine
+    from modules.streaming import IndicatorBook, LOOKBACK_DAYS
+
+    engine = StockRecommendationEngine()
+    frames = {code: df for code, df in make_bar_frames(args.symbols, args.bars).items()
+              if len(df) > args.seed_bars}
+    store = BarStore(os.path.join("data", "bars.db"))
+    book = IndicatorBook(store, args.rsi_method)
+    for code, df in frames.items():
+        book.seed(code, df.iloc[:args.seed_bars])
+
+    def expected(df, upto):
+        """对分析窗口重新计算：(当天, 批量面板结果, 逐只 pandas 结果)"""
+        today = datetime.strptime(df["date"].iloc[upto - 1], "%Y-%m-%d")
+        cutoff = (today - timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+        window = df.iloc[:upto]
+        window = window[window["date"] >= cutoff]
+        return today, engine.analyze_frames({"": window})[""], engine.analyze_dataframe(window)
+
+    def same(a, b):
+        return abs(float(a[0]) - float(b[0])) <= 1e-9 and a[1] == b[1]
+
+    rng = random.Random(0)
+    updates, elapsed, mismatches, rounding = 0, 0.0, [], 0
+    checked = set(list(frames)[:20])  # 这些股票每根K线之后都校验
+    for code, df in frames.items():
+        for i in range(args.seed_bars, len(df)):
+            date, close, volume = df["date"].iloc[i], float(df["close"].iloc[i]), float(df["volume"].iloc[i])
+            start = time.perf_counter()
+            if rng.random() < 0.3:
+                # 盘中先收到一个不同的价格，随后被收盘数据替换
+                book.update(code, date, round(close * rng.uniform(0.95, 1.05), 2), volume / 2)
+                updates += 1
+            book.update(code, date, close, volume)
+            elapsed += time.perf_counter() - start
+            updates += 1
+            if code in checked or i == len(df) - 1:
+                today, want, per_stock = expected(df, i + 1)
+                got = book.analyze(code, engine.indicators_weights, today)
+                if not same(want, got):
+                    mismatches.append((code, df["date"].iloc[i], want, got))
+                # 收盘价恰好等于均线等边界情况下，pandas 滚动求和与直接求和的末位舍入可能不同
+                rounding += not same(want, per_stock)
+
+    book.save()
+    restored = IndicatorBook(store, args.rsi_method)
+    restore_mismatches = []
+    for code, df in frames.items():
+        today = datetime.strptime(df["date"].iloc[-1], "%Y-%m-%d")
+        if not same(book.analyze(code, engine.indicators_weights, today),
+                    restored.analyze(code, engine.indicators_weights, today)):
+            restore_mismatches.append(code)
+
+    print(f"股票数: {len(frames)}, 每只K线数: ≤{args.bars}, 初始化K线数: {args.seed_bars}, RSI: {args.rsi_method}")
+    print(f"增量更新 {updates} 次, 平均每次 {elapsed / max(updates, 1) * 1e6:.1f}µs")
+    status = 0
+    if args.rsi_method != "sma":
+        print("Wilder RSI 与逐只分析的简单平均RSI口径不同，跳过一致性校验")
+    elif mismatches:
+        for code, date, want, got in mismatches[:10]:
+            print(f"不一致 {code} {date}: 批量 {want} 增量 {got}")
+        print(f"一致性校验失败: {len(mismatches)} 处结果不同")
+        status = 1
+    else:
+        print("一致性校验通过：增量结果与对分析窗口重新批量计算相同")
+        print(f"其中 {rounding} 处与逐只 pandas 分析因末位舍入落在阈值两侧而不同")
+    if restore_mismatches:
+        print(f"持久化恢复失败: {len(restore_mismatches)} 只股票结果不同")
+        status = 1
+    else:
+        print("持久化恢复校验通过")
+    store.close()
+    return status
+
+
+def add_high_low(frames, seed=1):
+    """给模拟K线加上最高价/最低价（使用单独的随机数序列，不改变收盘价和成交量）"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    for df in frames.values():
+        close = df["close"].to_numpy()
+        spread = rng.uniform(0, 0.03, (2, len(df)))
+        df["high"] = np.round(close * (1 + spread[0]), 2)
+        df["low"] = np.round(close * (1 - spread[1]), 2)
+    return frames
+
+
+def run_indicators(args):
+    """
+    指标登记表：原有五项信号与旧实现逐元素一致，全部指标的批量/逐只结果一致，并统计共用中间量的收益
+    """
+    use_temp_data_dir()
+    import numpy as np
+    from modules.config import get_config
+    from modules.indicators import BarPanel, compute_signals
+    from modules.indicator_registry import (INDICATORS, DEFAULT_INDICATORS, IndicatorContext, compute_indicators,
+                                            required_fields, history_days)
+    from modules.recommendation import StockRecommendationEngine
+
+    names = list(INDICATORS)
+    frames = add_high_low(make_bar_frames(args.symbols, args.max_bars))
+    panel = BarPanel(frames, required_fields(names))
+    status = 0
+
+    expected = compute_signals(panel)
+    actual = compute_indicators(panel, DEFAULT_INDICATORS)
+    different = [name for name in DEFAULT_INDICATORS if not np.array_equal(expected[name], actual[name])]
+    if different:
+        print(f"原有五项信号与 compute_signals 不一致: {different}")
+        status = 1
+    else:
+        print("原有五项信号与 compute_signals 在所有位置上完全一致")
+
+    # 全部指标一起计算与逐个单独计算的耗时对比
+    timings = {}
+    for name in names:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            compute_indicators(panel, [name])
+        timings[name] = (time.perf_counter() - start) / args.repeat
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        compute_indicators(panel, names)
+    together = (time.perf_counter() - start) / args.repeat
+    ctx = IndicatorContext(panel)
+    for name in names:
+        INDICATORS[name].compute(ctx)
+    print(f"股票数: {args.symbols}, 最多K线数: {args.max_bars}, 指标数: {len(names)}")
+    for name in names:
+        indicator = INDICATORS[name]
+        print(f"  {name:<18} 回看 {indicator.lookback:>2} 根K线  单独计算 {timings[name] * 1000:7.2f}ms")
+    print(f"逐个单独计算合计: {sum(timings.values()) * 1000:.2f}ms, 一起计算: {together * 1000:.2f}ms")
+    print(f"共用中间量: 计算 {ctx.computed} 个, 复用 {ctx.reused} 次")
+    print(f"获取历史数据天数: 原有五项 {history_days(DEFAULT_INDICATORS)} 天, 全部指标 {history_days(names)} 天")
+
+    get_config()["recommend_indicators"] = names
+    engine = StockRecommendationEngine()
+    start = time.perf_counter()
+    per_stock = {code: engine.analyze_dataframe(df) for code, df in frames.items()}
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = engine.analyze_frames(frames)
+    batch_elapsed = time.perf_counter() - start
+    mismatches = [code for code, (probability, reason) in per_stock.items()
+                  if abs(float(probability) - float(batch[code][0])) > 1e-9 or reason != batch[code][1]]
+    print(f"全部指标 逐只分析: {elapsed:.3f}s, 批量分析: {batch_elapsed:.4f}s")
+    if mismatches:
+        for code in mismatches[:10]:
+            print(f"不一致 {code}: 逐只 {per_stock[code]} 批量 {batch[code]}")
+        print(f"一致性校验失败: {len(mismatches)} 只股票结果不同")
+        status = 1
+    else:
+        print("一致性校验通过：全部指标下逐只分析与批量分析结果相同")
+    return status
+
+
+def run_quotes(args):
+    """
+    全市场行情快照：多个并发的实时行情请求只下载一次，有效期内的请求直接复用快照（下载用固定延迟模拟）
+    """
+    use_temp_data_dir()
+    import io
+    import contextlib
+    import pandas as pd
+    from modules.database import db
+    from modules.stock_data import stock_manager
+    from modules.quote_service import QuoteService
+
+    universe = make_stock_universe(args.symbols)
+    db.update_stocks(universe)
+    codes = list(universe)
+    board = pd.DataFrame({
+        "代码": [stock_manager._convert_bs_to_ak_code(code) for code in codes],
+        "最新价": [info["price"] for info in universe.values()],
+        "涨跌幅": [round(random.uniform(-10, 10), 2) for _ in codes],
+        "成交量": [random.randint(1000, 100000) for _ in codes],
+    })
+    downloads = []
+
+    def fetch():
+        downloads.append(time.perf_counter())
+        time.sleep(args.latency)
+        return board.copy()
+
+    stock_manager.quotes = QuoteService(fetch, args.max_age)
+    results = [None] * args.callers
+
+    def caller(i):
+        results[i] = stock_manager.get_realtime_quotes(codes)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(args.callers)]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # 逐只打印的日志太多
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    concurrent = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        repeated = stock_manager.get_realtime_quotes(codes)
+    cached = time.perf_counter() - start
+
+    status = 0
+    print(f"股票数: {args.symbols}, 并发请求: {args.callers}, 模拟下载延迟: {args.latency}s, 快照有效期: {args.max_age}s")
+    print(f"并发请求耗时: {concurrent:.3f}s, 下载次数: {len(downloads)}（每个请求各自下载时为 {args.callers} 次）")
+    print(f"有效期内再次请求耗时: {cached:.3f}s, 下载次数: {len(downloads)}")
+    print(f"快照统计: {stock_manager.quotes.stats()}")
+    if len(downloads) != 1:
+        print("合并校验失败：并发请求触发了多次下载")
+        status = 1
+    if any(result != repeated for result in results) or \
+            any(quote["source"] != "spot" for quote in repeated.values()) or len(repeated) != len(codes):
+        print("一致性校验失败：各请求得到的行情不同或不完整")
+        status = 1
+    if status == 0:
+        print("校验通过：并发请求共用一次下载，各请求得到相同的实时行情")
+    return status
+
+
+def run_outage(args):
+    """
+    实时行情上游故障：备用价格一次性从本地K线缓存和数据库读取，熔断后不再访问上游
+    """
+    use_temp_data_dir()
+    import io
+    import contextlib
+    from modules.database import db
+    from modules.stock_data import stock_manager
+    from modules.fetch_engine import FetchEngine
+    from modules.quote_service import QuoteService
+
+    universe = make_stock_universe(args.symbols)
+    db.update_stocks(universe)
+    codes = list(universe)
+    frames = dict(zip(codes, make_bar_frames(len(codes), 40).values()))
+    cached_codes = codes[:int(len(codes) * args.cached)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for code in cached_codes:
+            df = frames[code]
+            if not df.empty:
+                stock_manager.bar_store.get_bars(code, "d", "3", df["date"].iloc[0], df["date"].iloc[-1],
+                                                 lambda start, end, df=df: df)
+
+    upstream_calls = []
+
+    def stock_zh_a_spot_em():
+        upstream_calls.append(time.perf_counter())
+        raise ConnectionError("模拟上游故障")
+
+    stock_manager.fetch_engine = FetchEngine({"default": {"rate": 0, "retries": 0,
+                                                             "breaker_failures": args.threshold,
+                                                             "breaker_reset": 3600}})
+    stock_manager.quotes = QuoteService(lambda: stock_manager.fetch_engine.call("eastmoney", stock_zh_a_spot_em), 0)
+
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.refreshes):
+            start = time.perf_counter()
+            quotes = stock_manager.get_realtime_quotes(codes)
+            timings.append(time.perf_counter() - start)
+
+    tiers = stock_manager.quote_tiers
+    print(f"股票数: {len(codes)}, 有K线缓存: {len(cached_codes)}, 刷新次数: {args.refreshes}, 熔断阈值: {args.threshold}")
+    print(f"每次刷新耗时: 平均 {sum(timings) / len(timings) * 1000:.1f}ms, 最长 {max(timings) * 1000:.1f}ms")
+    print(f"数据源: {tiers}")
+    print(f"上游调用次数: {len(upstream_calls)}, 熔断器: {stock_manager.fetch_engine.breaker_stats()}")
+
+    status = 0
+    expected_cache = sum(1 for code in cached_codes if not frames[code].empty)
+    wrong = [code for code in cached_codes if not frames[code].empty and
+             abs(quotes[code]["price"] - float(frames[code]["close"].iloc[-1])) > 1e-9]
+    if tiers["cache"] != expected_cache or tiers["missing"] or wrong:
+        print(f"数据源校验失败: 缓存价格不一致 {len(wrong)} 只")
+        status = 1
+    if len(upstream_calls) != min(args.threshold, args.refreshes):
+        print("熔断校验失败：熔断后仍在访问上游")
+        status = 1
+    if status == 0:
+        print("校验通过：备用价格来自本地缓存和数据库，熔断后不再访问上游")
+    return status
+
+
+def run_gateway(args):
+    """
+    行情请求网关：后台预取排队时图表请求的等待时间、重复请求合并、并发数与限流（请求用固定延迟模拟）
+    """
+    from modules.market_gateway import MarketGateway, PRIORITY_CHART, PRIORITY_QUOTES, PRIORITY_PREFETCH
+
+    lock = threading.Lock()
+    running = [0, 0]  # 当前执行数, 最大执行数
+    starts = []
+
+    def request(name):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+            starts.append(time.perf_counter())
+        time.sleep(args.latency)
+        with lock:
+            running[0] -= 1
+        return name
+
+    status = 0
+    gateway = MarketGateway(args.concurrency, args.rate)
+    start = time.perf_counter()
+    futures = [gateway.submit(("history", i), request, f"history-{i}", priority=PRIORITY_PREFETCH)
+               for i in range(args.prefetch)]
+    time.sleep(args.latency)  # 预取已经开始执行
+    chart_start = time.perf_counter()
+    chart = gateway.submit(("chart",), request, "chart", priority=PRIORITY_CHART)
+    chart.result()
+    chart_wait = time.perf_counter() - chart_start
+    # 同一只股票的预取被行情请求提前
+    promoted = gateway.submit(("history", args.prefetch - 1), request, "dup", priority=PRIORITY_QUOTES)
+    duplicates = [gateway.submit(("quotes",), request, "quotes") for _ in range(20)]
+    for future in futures + duplicates + [promoted]:
+        future.result()
+    total = time.perf_counter() - start
+    stats = gateway.stats()
+    gateway.close()
+
+    fifo_wait = args.prefetch / args.concurrency * args.latency
+    if args.rate > 0:
+        fifo_wait = max(fifo_wait, args.prefetch / args.rate)
+    print(f"预取请求: {args.prefetch}, 单个请求耗时: {args.latency}s, 并发上限: {args.concurrency}, 限流: {args.rate}/s")
+    print(f"图表请求等待: {chart_wait * 1000:.0f}ms（先进先出时约 {fifo_wait * 1000:.0f}ms）, 全部完成: {total:.2f}s")
+    print(f"最大同时执行数: {running[1]}, 网关统计: {stats}")
+    if args.rate > 0 and len(starts) > args.rate:
+        starts.sort()
+        window = max(sum(1 for t in starts if s0 <= t < s0 + 1) for s0 in starts)
+        print(f"任意1秒内开始执行的请求数最多: {window}")
+        if window > args.rate + max(1, args.rate):  # 令牌桶允许 burst 次突发
+            print("限流校验失败")
+            status = 1
+    if running[1] > args.concurrency:
+        print("并发校验失败：同时执行的请求数超过上限")
+        status = 1
+    if stats["submitted"] != args.prefetch + 2 or stats["deduplicated"] != 20:
+        print("合并校验失败：重复请求被执行了多次")
+        status = 1
+    if chart_wait > args.latency * 3 + 0.05:
+        print("优先级校验失败：图表请求排在预取请求之后")
+        status = 1
+
+    # 提前停止的 imap 只放弃自己的等待，不取消与其他提交者合并的请求
+    gateway = MarketGateway(1, 0)
+    blocker = gateway.submit(("blocker",), request, "blocker", priority=PRIORITY_CHART)
+    shared = gateway.submit(("history", 0), request, "shared", priority=PRIORITY_PREFETCH)
+    for _ in gateway.imap(request, ["blocker"] + [f"history-{i}" for i in range(5)],
+                          key=lambda name: ("blocker",) if name == "blocker" else ("history", int(name.split("-")[1]))):
+        break
+    blocker.result()
+    if shared.cancelled() or shared.result(timeout=10) != "shared":
+        print("合并校验失败：提前停止的 imap 取消了其他提交者的请求")
+        status = 1
+    gateway.close()
+
+    # fanout 请求等待子请求时不占用执行名额，子请求计入并发上限；并发上限为 1 时也不会死锁
+    gateway = MarketGateway(1, 0)
+    running[:] = [0, 0]
+    children = args.concurrency * 2
+
+    def fan_out():
+        return sorted(item for item, _, _ in gateway.imap(request, [f"child-{i}" for i in range(children)]))
+
+    outer = [gateway.submit(("fanout",), fan_out, fanout=True) for _ in range(3)]
+    try:
+        results = [future.result(timeout=children * args.latency * 3 + 5) for future in outer]
+    except Exception as e:
+        print(f"fanout 校验失败：{type(e).__name__} {e}")
+        status = 1
+    else:
+        if any(len(result) != children for result in results) or running[1] > 1:
+            print(f"fanout 校验失败：子请求 {[len(r) for r in results]}，最大同时执行数 {running[1]}")
+            status = 1
+        else:
+            print(f"fanout 请求: 3 次合并为 1 次，{children} 个子请求最大同时执行数 {running[1]}（上限 1）")
+    gateway.close()
+    if status == 0:
+        print("校验通过：图表请求优先执行，重复请求只执行一次，并发数未超过上限")
+    return status
+
+
+def run_providers(args):
+    """
+    离线行情数据提供者：用确定性模拟行情跑价格同步、图表、实时行情、交易和推荐的完整路径，
+    并校验模拟行情的确定性以及本地 CSV 文件回放与模拟行情一致
+    """
+    tmp_dir = use_temp_data_dir()
+    import io
+    import contextlib
+    import pandas as pd
+    from datetime import datetime, timedelta
+    from modules.config import get_config
+    from modules.data_providers import SyntheticProvider, LocalFileProvider
+
+    config = get_config()
+    config["market_data_provider"] = "synthetic"
+    config["synthetic_seed"] = args.seed
+    from modules.database import db
+    from modules.stock_data import stock_manager
+    from modules.recommendation import StockRecommendationEngine
+
+    status = 0
+    universe = make_stock_universe(args.symbols)
+    db.update_stocks(universe)
+    codes = list(universe)
+    provider = stock_manager.provider
+    today = datetime.now()
+    end = today.strftime("%Y-%m-%d")
+    start = (today - timedelta(days=args.days)).strftime("%Y-%m-%d")
+    timings = {}
+
+    # 确定性：区间不同的请求在重叠部分相同，种子相同的新实例结果相同，种子不同时结果不同
+    code = codes[0]
+    full = provider.fetch_daily_bars(code, start, end)
+    mid = full["date"].iloc[len(full) // 2]
+    head = provider.fetch_daily_bars(code, start, mid)
+    again = SyntheticProvider(args.seed).fetch_daily_bars(code, start, end)
+    other = SyntheticProvider(args.seed + 1).fetch_daily_bars(code, start, end)
+    if not (full.iloc[:len(head)].reset_index(drop=True).equals(head) and full.equals(again)) \
+            or full["close"].equals(other["close"]):
+        print("确定性校验失败：同一只股票同一天的K线随请求变化")
+        status = 1
+
+    with contextlib.redirect_stdout(io.StringIO()):  # 逐只打印的日志太多
+        begin = time.perf_counter()
+        stock_manager.sync_stock_prices()
+        timings["价格同步"] = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        for code in codes[:args.charts]:
+            for frequency in ("d", "w", "m"):
+                stock_manager.get_stock_data(code, start, end, frequency)
+            stock_manager.get_stock_hourly_data(code, 24)
+        timings[f"图表({args.charts}只×4种)"] = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        quotes = stock_manager.get_realtime_quotes(codes)
+        stock_manager.update_stock_prices()
+        timings["实时行情刷新"] = time.perf_counter() - begin
+
+        usernames = [f"trader{i}" for i in range(8)]
+        for username in usernames:
+            db.add_user(username, "pwd", "user", 1000000.0)
+        rng = random.Random(args.seed)
+        orders = [(rng.choice(usernames), "buy", rng.choice(codes), rng.randint(1, 10)) for _ in range(args.trades)]
+        begin = time.perf_counter()
+        trades = db.execute_trades(orders)
+        timings[f"交易({args.trades}笔)"] = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        recommendations = StockRecommendationEngine().get_all_recommendations()
+        timings["推荐打分"] = time.perf_counter() - begin
+
+    for name, seconds in timings.items():
+        print(f"{name:<16}{seconds:>10.3f}s")
+    print(f"股票数: {len(codes)}, 行情来源: {stock_manager.quote_tiers}, 交易成功: {sum(ok for ok, _ in trades)}, "
+          f"推荐结果: {len(recommendations)}")
+
+    stocks = db.get_stocks()
+    if stock_manager.quote_tiers.get("spot") != len(stocks):
+        print("实时行情校验失败：部分股票没有模拟实时行情")
+        status = 1
+    wrong = [code for code in codes if abs(stocks[code]["price"] - quotes[code]["price"]) > 1e-9]
+    if wrong or not all(ok for ok, _ in trades) or len(recommendations) != len(stocks):
+        print(f"路径校验失败: 价格不一致 {len(wrong)} 只，交易或推荐不完整")
+        status = 1
+
+    # 把模拟行情写成 CSV 文件后用本地文件提供者回放，结果应与模拟行情相同
+    local = LocalFileProvider(os.path.join(tmp_dir, "market"))
+    sample = codes[:args.charts]
+    for code in sample:
+        local.save_bars(code, provider.fetch_daily_bars(code, start, end))
+        local.save_bars(code, provider.fetch_hourly_bars(code, today - timedelta(days=10), today), hourly=True)
+    mismatched = []
+    for code in sample:
+        for frequency in ("d", "w", "m"):
+            expected = provider.fetch_daily_bars(code, start, end, frequency)
+            replayed = local.fetch_daily_bars(code, start, end, frequency)
+            if not expected.empty and not (expected["date"].equals(replayed["date"]) and
+                                           (expected[["open", "high", "low", "close"]] -
+                                            replayed[["open", "high", "low", "close"]]).abs().max().max() < 1e-9):
+                mismatched.append((code, frequency))
+        hourly = provider.fetch_hourly_bars(code, today - timedelta(days=10), today)
+        if len(local.fetch_hourly_bars(code, today - timedelta(days=10), today)) != len(hourly):
+            mismatched.append((code, "60min"))
+    board = local.fetch_spot_board()
+    print(f"本地文件回放: {len(sample)} 只股票，全市场行情 {len(board)} 只，不一致 {len(mismatched)} 项")
+    if mismatched or len(board) != len(sample):
+        print(f"回放校验失败: {mismatched[:5]}")
+        status = 1
+    if status == 0:
+        print("校验通过：模拟行情确定、各业务路径离线可用，本地文件回放与模拟行情一致")
+    return status
+
+
+def run_replay(args):
+    """
+    行情回放：把模拟行情录制成本地 CSV 后按最快速度回放，价格经 apply_quotes 写入，回放过程中交易、
+    计算账户市值并在结束后生成推荐；再按给定速度回放一小段，校验推送节奏和中途停止
+    """
+    tmp_dir = use_temp_data_dir()
+    import io
+    import contextlib
+    from datetime import datetime, timedelta
+    from modules.config import get_config
+    from modules.data_providers import SyntheticProvider, LocalFileProvider
+
+    market_dir = os.path.join(tmp_dir, "market")
+    config = get_config()
+    config["market_data_provider"] = "local"
+    config["market_data_dir"] = market_dir
+    from modules.database import db
+    from modules.stock_data import stock_manager
+    from modules.recommendation import StockRecommendationEngine
+    from modules.replay import ReplayClock, BAR_SECONDS
+    from modules.streaming import IndicatorBook
+
+    status = 0
+    universe = make_stock_universe(args.symbols)
+    db.update_stocks(universe)
+    codes = list(universe)
+    end = datetime.now()
+    start = end - timedelta(days=args.days)
+
+    # 录制：模拟行情写成每只股票一个 CSV 文件
+    synthetic, recorder = SyntheticProvider(args.seed), LocalFileProvider(market_dir)
+    begin = time.perf_counter()
+    for code in codes:
+        recorder.save_bars(code, synthetic.fetch_daily_bars(code, (start - timedelta(days=60)).strftime("%Y-%m-%d"),
+                                                            end.strftime("%Y-%m-%d")))
+        if args.interval == "60min":
+            recorder.save_bars(code, synthetic.fetch_hourly_bars(code, start - timedelta(days=10), end), hourly=True)
+    record_time = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    clock = ReplayClock(LocalFileProvider(market_dir), codes, start, end, args.interval, speed=0)
+    load_time = time.perf_counter() - begin
+
+    usernames = [f"trader{i}" for i in range(args.users)]
+    for username in usernames:
+        db.add_user(username, "pwd", "user", 1000000.0)
+    rng = random.Random(args.seed)
+    counters = {"trades": 0, "valuations": 0}
+    # 回放行情计入单独的内存指标簿，保存的指标状态不应变化
+    saved_states = stock_manager.bar_store.load_indicator_states()
+    replay_indicators = IndicatorBook(None, config["rsi_method"], persist=False)
+
+    def on_tick(market_time, quotes):
+        stock_manager.apply_quotes(quotes, market_time, verbose=False, indicators=replay_indicators)
+        orders = [(rng.choice(usernames), rng.choice(["buy", "sell"]), rng.choice(codes), rng.randint(1, 10))
+                  for _ in range(args.trades_per_tick)]
+        counters["trades"] += sum(ok for ok, _ in db.execute_trades(orders))
+        users = db.get_users()
+        db.get_price_snapshot().value_many([user.get("holdings", {}) for user in users.values()])
+        counters["valuations"] += len(users)
+
+    with contextlib.redirect_stdout(io.StringIO()):  # 逐只打印的日志太多
+        clock.run(on_tick)
+        states_after_replay = stock_manager.bar_store.load_indicator_states()
+        begin = time.perf_counter()
+        recommendations = StockRecommendationEngine().get_all_recommendations()
+        recommend_time = time.perf_counter() - begin
+
+    stats = clock.stats()
+    quotes = sum(len(tick[1]) for tick in clock.timeline)
+    print(f"股票数: {len(codes)}, 周期: {args.interval}, 回放K线: {stats['ticks']} 根（{quotes} 条行情），"
+          f"市场时间到 {stats['market_time']}")
+    print(f"录制: {record_time:.2f}s, 加载时间线: {load_time:.2f}s, 最快速度回放: {stats['elapsed']:.2f}s "
+          f"（{stats['ticks'] / max(stats['elapsed'], 1e-9):.0f} 根/s，{quotes / max(stats['elapsed'], 1e-9):.0f} 条行情/s）")
+    print(f"每根K线处理耗时: p50={stats['tick_p50_ms']:.1f}ms p99={stats['tick_p99_ms']:.1f}ms，"
+          f"成交 {counters['trades']} 笔，账户估值 {counters['valuations']} 次，回放后推荐 {len(recommendations)} 只 "
+          f"{recommend_time:.2f}s")
+
+    # 最终价格应为每只股票最后一根录制K线的收盘价，涨跌幅相对前一根K线
+    stocks = db.get_stocks()
+    wrong = []
+    for code in codes:
+        if args.interval == "d":
+            bars = recorder.fetch_daily_bars(code, "1900-01-01", end.strftime("%Y-%m-%d"))
+            expected_change = round((bars["close"].iloc[-1] / bars["close"].iloc[-2] - 1) * 100, 2)
+        else:
+            bars = recorder.fetch_hourly_bars(code, start - timedelta(days=10), end)
+            expected_change = None
+        if abs(stocks[code]["price"] - bars["close"].iloc[-1]) > 1e-9 or \
+                (expected_change is not None and abs(stocks[code]["change"] - expected_change) > 1e-9):
+            wrong.append(code)
+    if wrong or not clock.finished or len(recommendations) != len(stocks):
+        print(f"回放校验失败: 价格或涨跌幅不一致 {len(wrong)} 只，回放完成 {clock.finished}")
+        status = 1
+    replayed_states = len(replay_indicators.states)
+    if states_after_replay != saved_states or replayed_states != len(codes):
+        print(f"指标状态校验失败：回放覆盖了保存的指标状态，或回放指标簿只有 {replayed_states} 只股票")
+        status = 1
+
+    # 节奏：按给定间隔推送，中途停止后不再推送
+    tick_seconds = args.tick_ms / 1000
+    paced = ReplayClock(LocalFileProvider(market_dir), codes[:10], start, end, args.interval,
+                        speed=BAR_SECONDS[args.interval] / tick_seconds)
+    limit = min(20, len(paced))
+    pushed = []
+
+    def paced_tick(market_time, quotes):
+        pushed.append(time.perf_counter())
+        if len(pushed) == limit:
+            paced.stop()
+
+    begin = time.perf_counter()
+    paced.run(paced_tick)
+    expected = (limit - 1) * tick_seconds
+    print(f"按 {paced.speed:g}x 回放 {len(pushed)} 根: 耗时 {pushed[-1] - begin:.3f}s（计划 {expected:.3f}s），"
+          f"最大延迟 {paced.max_lag * 1000:.1f}ms")
+    if len(pushed) != limit or abs(pushed[-1] - begin - expected) > max(0.05, expected * 0.2):
+        print("节奏校验失败：推送时刻与速度不符或停止后仍在推送")
+        status = 1
+    # 时钟创建前就已设置的停止事件同样有效
+    stop = threading.Event()
+    stop.set()
+    if ReplayClock(LocalFileProvider(market_dir), codes[:10], start, end, args.interval, stop=stop).run(paced_tick):
+        print("停止校验失败：创建前已停止的回放仍在推送")
+        status = 1
+    if status == 0:
+        print("校验通过：回放价格与录制行情一致，交易、估值和推荐在加速的市场时间下正常运行")
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="股票模拟交易系统性能基准")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stress = subparsers.add_parser("stress", help="多线程交易压力测试")
+    stress.add_argument("--threads", type=int, default=16, help="交易线程数")
+    stress.add_argument("--users", type=int, default=8, help="用户数")
+    stress.add_argument("--trades", type=int, default=300, help="每个线程的交易次数")
+    stress.set_defaults(func=run_stress)
+
+    stock_update = subparsers.add_parser("stock-update", help="股价刷新写入耗时")
+    stock_update.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000], help="股票数量")
+    stock_update.set_defaults(func=run_stock_update)
+
+    fetch = subparsers.add_parser("fetch", help="经请求网关并发获取与串行获取对比")
+    fetch.add_argument("--symbols", type=int, default=200, help="股票数量")
+    fetch.add_argument("--latency", type=float, default=0.05, help="模拟单次请求延迟（秒）")
+    fetch.add_argument("--concurrency", type=int, default=8, help="网关并发上限")
+    fetch.add_argument("--rate", type=float, default=50, help="每秒请求数上限")
+    fetch.add_argument("--fail-rate", type=float, default=0.05, help="模拟请求失败率")
+    fetch.set_defaults(func=run_fetch)
+
+    startup = subparsers.add_parser("startup", help="登录界面启动耗时")
+    startup.add_argument("--symbols", type=int, default=5000, help="股票数量")
+    startup.add_argument("--budget", type=float, default=3.0, help="启动耗时预算（秒）")
+    startup.set_defaults(func=run_startup)
+
+    importtime = subparsers.add_parser("importtime", help="启动导入耗时报告与回归检查")
+    importtime.add_argument("--top", type=int, default=15, help="显示耗时最多的前N个顶层包")
+    importtime.add_argument("--threshold", type=float, default=0.6, help="导入总耗时阈值（秒）")
+    importtime.add_argument("--forbid", nargs="*", default=["akshare", "matplotlib", "mplfinance", "bs4"],
+                            help="登录前不应加载的模块")
+    importtime.set_defaults(func=run_importtime)
+
+    recommend = subparsers.add_parser("recommend", help="推荐引擎批量分析一致性与耗时")
+    recommend.add_argument("--symbols", type=int, default=2000, help="股票数量")
+    recommend.add_argument("--max-bars", type=int, default=40, help="每只股票最多的K线数量")
+    recommend.set_defaults(func=run_recommend)
+
+    recommend_pool = subparsers.add_parser("recommend-pool", help="多进程推荐打分随进程数的扩展性")
+    recommend_pool.add_argument("--symbols", type=int, default=20000, help="股票数量")
+    recommend_pool.add_argument("--max-bars", type=int, default=40, help="每只股票最多的K线数量")
+    recommend_pool.add_argument("--workers", type=int, nargs="+",
+                                default=sorted({1, 2, 4, os.cpu_count() or 1}), help="要测试的进程数")
+    recommend_pool.add_argument("--shard-size", type=int, default=500, help="每个分片的股票数量")
+    recommend_pool.set_defaults(func=run_recommend_pool)
+
+    recommend_stream = subparsers.add_parser("recommend-stream", help="冷缓存下推荐结果逐只产出的延迟")
+    recommend_stream.add_argument("--symbols", type=int, default=2000, help="股票数量")
+    recommend_stream.add_argument("--latency", type=float, default=0.2, help="模拟获取一只股票历史数据的平均延迟（秒）")
+    recommend_stream.set_defaults(func=run_recommend_stream)
+
+    backtest = subparsers.add_parser("backtest", help="推荐信号向量化回测耗时与信号校验")
+    backtest.add_argument("--symbols", type=int, default=2000, help="股票数量")
+    backtest.add_argument("--bars", type=int, default=750, help="每只股票最多的K线数量")
+    backtest.add_argument("--top-n", type=int, default=10, help="每期做多/做空的股票数量")
+    backtest.add_argument("--holding", type=int, default=5, help="持有期（交易日）")
+    backtest.add_argument("--fee", type=float, default=0.0015, help="单边手续费率")
+    backtest.add_argument("--side", choices=("long", "short", "long_short"), default="long_short", help="持仓方向")
+    backtest.add_argument("--samples", type=int, default=300, help="抽样校验的次数")
+    backtest.set_defaults(func=run_backtest)
+
+    optimize = subparsers.add_parser("optimize", help="推荐权重优化耗时、一致性与进程数扩展性")
+    optimize.add_argument("--symbols", type=int, default=1000, help="股票数量")
+    optimize.add_argument("--bars", type=int, default=500, help="每只股票最多的K线数量")
+    optimize.add_argument("--method", choices=("grid", "random", "cem"), default="grid", help="搜索方式")
+    optimize.add_argument("--step", type=float, default=0.2, help="网格搜索的权重步长")
+    optimize.add_argument("--samples", type=int, default=100, help="随机/交叉熵搜索每批的权重候选数")
+    optimize.add_argument("--rounds", type=int, default=3, help="交叉熵搜索的轮数")
+    optimize.add_argument("--top-n", type=int, default=10, help="每期做多/做空的股票数量")
+    optimize.add_argument("--holding", type=int, default=5, help="持有期（交易日）")
+    optimize.add_argument("--fee", type=float, default=0.0015, help="单边手续费率")
+    optimize.add_argument("--compare", type=int, default=10, help="与逐个回测对比的候选数")
+    optimize.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}), help="要测试的进程数")
+    optimize.set_defaults(func=run_optimize)
+
+    streaming = subparsers.add_parser("streaming", help="流式指标增量更新一致性与耗时")
+    streaming.add_argument("--symbols", type=int, default=500, help="股票数量")
+    streaming.add_argument("--bars", type=int, default=80, help="每只股票最多的K线数量")
+    streaming.add_argument("--seed-bars", type=int, default=25, help="用于初始化状态的K线数量")
+    streaming.add_argument("--rsi-method", choices=("sma", "wilder"), default="sma", help="RSI 计算方式")
+    streaming.set_defaults(func=run_streaming)
+
+    indicators = subparsers.add_parser("indicators", help="指标登记表一致性与共用中间量的耗时")
+    indicators.add_argument("--symbols", type=int, default=2000, help="股票数量")
+    indicators.add_argument("--max-bars", type=int, default=60, help="每只股票最多的K线数量")
+    indicators.add_argument("--repeat", type=int, default=5, help="计时重复次数")
+    indicators.set_defaults(func=run_indicators)
+
+    quotes = subparsers.add_parser("quotes", help="全市场行情快照的并发请求合并与复用")
+    quotes.add_argument("--symbols", type=int, default=5000, help="股票数量")
+    quotes.add_argument("--callers", type=int, default=8, help="并发请求数")
+    quotes.add_argument("--latency", type=float, default=0.5, help="模拟的全市场行情下载耗时（秒）")
+    quotes.add_argument("--max-age", type=float, default=5, help="快照有效期（秒）")
+    quotes.set_defaults(func=run_quotes)
+
+    outage = subparsers.add_parser("outage", help="实时行情上游故障时的备用数据源与熔断")
+    outage.add_argument("--symbols", type=int, default=2000, help="股票数量")
+    outage.add_argument("--cached", type=float, default=0.8, help="有本地K线缓存的股票比例")
+    outage.add_argument("--refreshes", type=int, default=6, help="刷新次数")
+    outage.add_argument("--threshold", type=int, default=3, help="熔断器连续失败阈值")
+    outage.set_defaults(func=run_outage)
+
+    gateway = subparsers.add_parser("gateway", help="行情请求网关的优先级、合并、并发与限流")
+    gateway.add_argument("--prefetch", type=int, default=200, help="排队的后台预取请求数")
+    gateway.add_argument("--latency", type=float, default=0.05, help="模拟的单个请求耗时（秒）")
+    gateway.add_argument("--concurrency", type=int, default=8, help="并发上限")
+    gateway.add_argument("--rate", type=float, default=100, help="每秒开始执行的请求数上限，0 表示不限")
+    gateway.set_defaults(func=run_gateway)
+
+    providers = subparsers.add_parser("providers", help="离线行情数据提供者跑完整业务路径与回放一致性")
+    providers.add_argument("--symbols", type=int, default=2000)
+    providers.add_argument("--days", type=int, default=365, help="图表请求的历史天数")
+    providers.add_argument("--charts", type=int, default=50, help="请求图表并写入本地文件的股票数")
+    providers.add_argument("--trades", type=int, default=2000)
+    providers.add_argument("--seed", type=int, default=0)
+    providers.set_defaults(func=run_providers)
+
+    replay = subparsers.add_parser("replay", help="录制行情回放驱动交易、估值和推荐的耗时与节奏")
+    replay.add_argument("--symbols", type=int, default=500)
+    replay.add_argument("--days", type=int, default=60, help="回放的自然日天数")
+    replay.add_argument("--interval", choices=["d", "60min"], default="d")
+    replay.add_argument("--users", type=int, default=20)
+    replay.add_argument("--trades-per-tick", type=int, default=20)
+    replay.add_argument("--tick-ms", type=float, default=20, help="节奏校验时每根K线的间隔（毫秒）")
+    replay.add_argument("--seed", type=int, default=0)
+    replay.set_defaults(func=run_replay)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,40 @@
 """
 股票模拟交易系统模块包
+
+包内的页面和数据模块在第一次访问时才导入（PEP 562），
+导入本包不会加载 akshare、matplotlib 等重量级依赖。
 """
+import importlib
 
-# 导出模块
-from .database import db
-from .stock_data import stock_manager
-from .login import LoginFrame
-from .market import MarketFrame
-from .trading import TradingFrame
-from .recommendation import RecommendationFrame, StockRecommendationEngine
-from .news import NewsFrame
-from .account import AccountFrame
-from .admin import AdminFrame
+# 导出名称 -> 所在子模块
+_EXPORTS = {
+    'db': 'database',
+    'stock_manager': 'stock_data',
+    'LoginFrame': 'login',
+    'MarketFrame': 'market',
+    'TradingFrame': 'trading',
+    'RecommendationFrame': 'recommendation',
+    'StockRecommendationEngine': 'recommendation',
+    'NewsFrame': 'news',
+    'AccountFrame': 'account',
+    'AdminFrame': 'admin',
+}
 
 __all__ = [
     'db', 'stock_manager', 'LoginFrame', 'MarketFrame', 
     'TradingFrame', 'RecommendationFrame', 'StockRecommendationEngine',
     'NewsFrame', 'AccountFrame', 'AdminFrame'
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    # 缓存到包的命名空间，之后的访问不再经过 __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -31,6 +31,7 @@ class AccountFrame(tb.Frame):
     def __init__(self, parent, username):
         super().__init__(parent, bootstyle="dark")
         self.username = username
+        self.data_version = None  # 页面隐藏时的数据版本
         
         # 使用bootstyle而不是background
         # self.configure(background=BACKGROUND_COLOR)
@@ -215,6 +216,15 @@ class AccountFrame(tb.Frame):
         self.holdings_canvas = FigureCanvasTkAgg(self.holdings_fig, master=self.holdings_chart_frame)
         self.holdings_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
     
+    def on_hide(self):
+        """页面隐藏：记录当前数据版本"""
+        self.data_version = db.get_data_version()
+    
+    def on_show(self):
+        """页面重新显示：隐藏期间股价或账户有变化时刷新一次"""
+        if db.get_data_version() != self.data_version:
+            self.load_account_data()
+    
     def load_account_data(self):
         """加载账户数据"""
         # 更新状态
@@ -236,35 +246,35 @@ class AccountFrame(tb.Frame):
         # 获取用户持仓
         holdings = user.get("holdings", {})
         
-        # 计算持仓市值和盈亏
-        holdings_value = 0
-        total_profit = 0
-        holdings_data = []
-        
         # 清空持仓列表
         for item in self.holdings_tree.get_children():
             self.holdings_tree.delete(item)
         
-        # 获取所有股票的当前价格
-        stocks = db.get_stocks()
+        # 使用共享的价格快照，一次性计算所有持仓的市值和盈亏
+        snapshot = db.get_price_snapshot()
+        codes = list(holdings.keys())
+        quantities = np.array([h.get("quantity", 0) for h in holdings.values()], dtype=np.float64)
+        costs = np.array([h.get("cost", 0) for h in holdings.values()], dtype=np.float64)
+        current_prices = snapshot.prices(codes)
+        market_values = quantities * current_prices
+        cost_values = quantities * costs
+        profits = market_values - cost_values
+        profit_rates = np.divide(profits * 100, cost_values, out=np.zeros_like(profits), where=cost_values > 0)
+        
+        # 累计总市值和盈亏
+        holdings_value = float(market_values.sum())
+        total_profit = float(profits.sum())
+        holdings_data = []
         
         # 处理每个持仓
-        for code, holding in holdings.items():
-            # 获取股票信息
-            stock = stocks.get(code, {})
+        for i, (code, holding) in enumerate(holdings.items()):
             name = holding.get("name", "")
             quantity = holding.get("quantity", 0)
-            cost = holding.get("cost", 0)
-            current_price = stock.get("price", 0)
-            
-            # 计算市值和盈亏
-            market_value = quantity * current_price
-            profit = market_value - (quantity * cost)
-            profit_rate = (profit / (quantity * cost)) * 100 if cost > 0 and quantity > 0 else 0
-            
-            # 累计总市值和盈亏
-            holdings_value += market_value
-            total_profit += profit
+            cost = costs[i]
+            current_price = current_prices[i]
+            market_value = market_values[i]
+            profit = profits[i]
+            profit_rate = profit_rates[i]
             
             # 添加到持仓数据列表
             holdings_data.append({
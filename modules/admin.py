@@ -24,6 +24,7 @@ class AdminFrame(tb.Frame):
     
     def __init__(self, parent):
         super().__init__(parent, bootstyle="dark")
+        self.data_version = None  # 页面隐藏时的数据版本
         
         # 创建标题
         self.title_label = tb.Label(self, text="管理员控制面板", font=("微软雅黑", 16, "bold"), bootstyle="inverse-dark")
@@ -217,6 +218,19 @@ class AdminFrame(tb.Frame):
         # 保存按钮
         save_btn = tb.Button(settings_frame, text="保存设置", command=self.save_settings, bootstyle="success")
         save_btn.grid(row=1, column=0, columnspan=2, pady=20)
+        
+        # 交易日志整理
+        compact_btn = tb.Button(settings_frame, text="整理交易日志", command=self.compact_transactions, bootstyle="info-outline")
+        compact_btn.grid(row=2, column=0, columnspan=2, pady=10)
+    
+    def on_hide(self):
+        """页面隐藏：记录当前数据版本"""
+        self.data_version = db.get_data_version()
+    
+    def on_show(self):
+        """页面重新显示：隐藏期间用户数据有变化时刷新一次用户列表"""
+        if db.get_data_version()[1] != self.data_version[1]:
+            self.load_users()
     
     def load_users(self):
         """加载用户数据"""
@@ -249,28 +263,12 @@ class AdminFrame(tb.Frame):
         users = db.get_users()
         
         # 准备用户资产数据
-        usernames = []
-        balances = []
-        holdings_values = []
+        usernames = list(users.keys())
+        balances = [user.get("balance", 0) for user in users.values()]
         
-        # 获取所有股票的当前价格
-        stocks = db.get_stocks()
-        
-        for username, user in users.items():
-            usernames.append(username)
-            balance = user.get("balance", 0)
-            balances.append(balance)
-            
-            # 计算持仓市值
-            holdings = user.get("holdings", {})
-            holdings_value = 0
-            for code, holding in holdings.items():
-                stock = stocks.get(code, {})
-                quantity = holding.get("quantity", 0)
-                price = stock.get("price", 0)
-                holdings_value += quantity * price
-            
-            holdings_values.append(holdings_value)
+        # 使用共享的价格快照一次计算所有用户的持仓市值
+        snapshot = db.get_price_snapshot()
+        holdings_values = snapshot.value_many([user.get("holdings", {}) for user in users.values()]).tolist()
         
         # 更新用户资产图表
         self.update_user_assets_chart(usernames, balances, holdings_values)
@@ -279,8 +277,7 @@ class AdminFrame(tb.Frame):
         # 这里简化处理，只统计每个用户的交易次数
         transaction_counts = {}
         for username in users.keys():
-            transactions = db.get_user_transactions(username)
-            transaction_counts[username] = len(transactions)
+            transaction_counts[username] = db.count_user_transactions(username)
         
         # 更新交易统计图表
         self.update_transaction_stats_chart(transaction_counts)
@@ -558,6 +555,14 @@ class AdminFrame(tb.Frame):
         except:
             messagebox.showerror("错误", "初始资金必须是数字")
     
+    def compact_transactions(self):
+        """整理交易日志"""
+        success, message = db.compact_transactions()
+        if success:
+            messagebox.showinfo("成功", message)
+        else:
+            messagebox.showerror("错误", message)
+    
     def show_holdings_window(self, event):
         """显示用户持仓窗口"""
         selected_items = self.user_tree.selection()
@@ -600,18 +605,14 @@ class AdminFrame(tb.Frame):
         
         # 获取用户持仓数据
         holdings = user.get("holdings", {})
-        stocks = db.get_stocks()
+        snapshot = db.get_price_snapshot()
         
         # 计算持仓市值
-        holdings_value = 0
-        stock_values = {}
-        for code, holding in holdings.items():
-            stock = stocks.get(code, {})
-            current_price = stock.get("price", 0)
-            quantity = holding.get("quantity", 0)
-            value = current_price * quantity
-            holdings_value += value
-            stock_values[code] = value
+        current_prices = snapshot.prices(list(holdings.keys()))
+        quantities = np.array([h.get("quantity", 0) for h in holdings.values()], dtype=np.float64)
+        market_values = current_prices * quantities
+        holdings_value = float(market_values.sum())
+        stock_values = dict(zip(holdings.keys(), market_values.tolist()))
         
         # 创建持仓列表
         columns = ('代码', '名称', '持仓', '成本价', '现价', '市值', '盈亏', '盈亏率')
@@ -637,12 +638,11 @@ class AdminFrame(tb.Frame):
         # 计算总盈亏
         total_profit = 0
         
-        for code, holding in holdings.items():
-            stock = stocks.get(code, {})
+        for i, (code, holding) in enumerate(holdings.items()):
             name = holding.get("name", "")
             quantity = holding.get("quantity", 0)
             cost_price = holding.get("cost", 0)  # 成本价
-            current_price = stock.get("price", 0)  # 现价
+            current_price = current_prices[i]  # 现价
             market_value = quantity * current_price  # 市值 = 现价 * 持仓
             cost_value = quantity * cost_price  # 成本 = 成本价 * 持仓
             profit = market_value - cost_value  # 盈亏 = 市值 - 成本
@@ -0,0 +1,189 @@
+import numpy as np
+
+from .indicators import (DEFAULT_THRESHOLDS, combine_signals, ma_signal, rsi_signal, volume_signal,
+                         price_momentum, volatility_signal)
+from .streaming import LOOKBACK_DAYS
+
+# 每年的交易日数量，用于年化
+TRADING_DAYS_PER_YEAR = 252
+
+
+class DatePanel:
+    """
+    按日期对齐的多只股票K线面板（行 = 交易日，列 = 股票）
+
+    行是所有股票出现过的交易日的并集，某只股票在某天没有K线（未上市、停牌）时为 NaN。
+    """
+
+    def __init__(self, frames, fields=("close", "volume")):
+        """
+        :param frames: {code: DataFrame}，包含 date 列，按日期升序
+        """
+        self.codes = [code for code, df in frames.items() if df is not None and not df.empty]
+        frames = [frames[code] for code in self.codes]
+        all_dates = np.concatenate([df["date"].to_numpy(dtype="datetime64[D]") for df in frames]) \
+            if frames else np.array([], dtype="datetime64[D]")
+        self.dates = np.unique(all_dates)
+        self.fields = {field: np.full((len(self.dates), len(self.codes)), np.nan) for field in fields}
+        for col, df in enumerate(frames):
+            rows = np.searchsorted(self.dates, df["date"].to_numpy(dtype="datetime64[D]"))
+            for field in fields:
+                if field in df.columns:
+                    self.fields[field][rows, col] = df[field].to_numpy(dtype=np.float64)
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    def window_counts(self, days=LOOKBACK_DAYS):
+        """每个交易日往前 days 个自然日（含当天）内各股票的K线数量，即推荐引擎分析窗口内的K线数"""
+        valid = ~np.isnan(self.fields["close"])
+        cumulative = np.vstack([np.zeros((1, valid.shape[1]), dtype=np.int64), np.cumsum(valid, axis=0)])
+        start = np.searchsorted(self.dates, self.dates - np.timedelta64(days, "D"), side="left")
+        return cumulative[1:] - cumulative[start]
+
+
+def window_signals(panel, thresholds=DEFAULT_THRESHOLDS):
+    """
+    在每个交易日按推荐引擎的规则计算五项信号：与在当天用最近30天数据调用 analyze_dataframe 的结果相同
+
+    信号在完整序列上计算，再按分析窗口内的K线数量置0；动量和波动率在窗口首根K线上没有前收盘价，
+    因此分别比引擎的数量阈值多需要一根K线。停牌造成的缺口会让跨越缺口的滚动窗口为 NaN，对应信号为0。
+    """
+    close, volume = panel["close"], panel["volume"]
+    counts = panel.window_counts()
+    return {
+        'ma_signal': ma_signal(close, counts),
+        'rsi_signal': rsi_signal(close, counts, thresholds),
+        'volume_signal': volume_signal(close, volume, counts, thresholds),
+        'price_momentum': price_momentum(close, counts - 1),
+        'volatility_signal': volatility_signal(close, counts - 1, thresholds),
+    }
+
+
+def _pick(scores, count, largest):
+    """
+    每行选出分数最大（或最小）的 count 只股票，NaN 不会被选中
+    :return: 与 scores 同形状的布尔矩阵
+    """
+    ranked = np.where(np.isnan(scores), -np.inf, scores if largest else -scores)
+    count = min(count, scores.shape[1])
+    picked = np.zeros(scores.shape, dtype=bool)
+    if count <= 0:
+        return picked
+    top = np.argpartition(-ranked, count - 1, axis=1)[:, :count]
+    np.put_along_axis(picked, top, True, axis=1)
+    return picked & np.isfinite(ranked)
+
+
+class BacktestResult:
+    """回测结果：每期收益、净值曲线和汇总指标"""
+
+    def __init__(self, dates, returns, gross_returns, turnover, hits, picks):
+        self.dates = dates                  # 每期建仓日
+        self.returns = returns              # 每期扣费后收益
+        self.gross_returns = gross_returns  # 每期扣费前收益
+        self.turnover = turnover            # 每期单边换手率
+        self.hits = hits                    # 方向判断正确的选股次数
+        self.picks = picks                  # 选股总次数
+        self.equity = np.cumprod(1 + returns)
+
+    def metrics(self, holding_period):
+        """命中率、收益、回撤和换手等汇总指标"""
+        periods = len(self.returns)
+        if not periods:
+            return {"periods": 0}
+        years = periods * holding_period / TRADING_DAYS_PER_YEAR
+        peak = np.maximum.accumulate(np.concatenate([[1.0], self.equity]))
+        drawdown = 1 - np.concatenate([[1.0], self.equity]) / peak
+        std = self.returns.std(ddof=1) if periods > 1 else 0.0
+        return {
+            "periods": periods,
+            "hit_rate": self.hits / self.picks if self.picks else 0.0,
+            "period_win_rate": float((self.returns > 0).mean()),
+            "total_return": float(self.equity[-1] - 1),
+            "annual_return": float(self.equity[-1] ** (1 / years) - 1) if self.equity[-1] > 0 else -1.0,
+            "mean_period_return": float(self.returns.mean()),
+            "sharpe": float(self.returns.mean() / std * np.sqrt(TRADING_DAYS_PER_YEAR / holding_period)) if std else 0.0,
+            "max_drawdown": float(drawdown.max()),
+            "avg_turnover": float(self.turnover.mean()),
+            "total_fees": float((self.gross_returns - self.returns).sum()),
+        }
+
+
+def rebalance_rows(panel, holding_period):
+    """调仓日所在的行，以及每个调仓日到下一次调仓日的收益率矩阵 (rows, forward)"""
+    close = panel["close"]
+    rows = np.arange(0, len(panel.dates) - holding_period, holding_period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        forward = close[rows + holding_period] / close[rows] - 1
+    return rows, forward
+
+
+def simulate(probability, forward, dates, top_n=5, fee_rate=0.0015, side="long_short"):
+    """
+    按每个调仓日的上涨概率选股并计算各期收益
+
+    :param probability: 调仓日的上涨概率矩阵（行 = 调仓日，列 = 股票）
+    :param forward: 同形状的持有期收益率，NaN 表示无法交易
+    :param dates: 各调仓日
+    :return: BacktestResult
+    """
+    if side not in ("long", "short", "long_short"):
+        raise ValueError(f"未知的持仓方向: {side}")
+    # 建仓日和平仓日都有K线的股票才能交易；
+    # 信号是离散值，很多股票概率相同，先舍去末位误差，保证不同求和顺序得到的概率选出同样的股票
+    scores = np.where(np.isnan(forward), np.nan, np.round(probability, 9))
+
+    positions = np.zeros(scores.shape)
+    hits = picks = 0
+    leg_weight = 0.5 if side == "long_short" else 1.0
+    if side != "short":
+        chosen = _pick(np.where(scores > 50, scores, np.nan), top_n, largest=True)
+        positions += chosen * (leg_weight / np.maximum(chosen.sum(axis=1, keepdims=True), 1))
+        hits += int((chosen & (forward > 0)).sum())
+        picks += int(chosen.sum())
+    if side != "long":
+        chosen = _pick(np.where(scores < 50, scores, np.nan), top_n, largest=False)
+        positions -= chosen * (leg_weight / np.maximum(chosen.sum(axis=1, keepdims=True), 1))
+        hits += int((chosen & (forward < 0)).sum())
+        picks += int(chosen.sum())
+
+    gross = (positions * np.nan_to_num(forward)).sum(axis=1)
+    previous = np.vstack([np.zeros((1, positions.shape[1])), positions[:-1]])
+    turnover = np.abs(positions - previous).sum(axis=1) / 2
+    # 卖出旧仓位和买入新仓位的成交额（单边换手 × 2）都要付手续费
+    net = gross - turnover * 2 * fee_rate
+    return BacktestResult(dates, net, gross, turnover, hits, picks)
+
+
+def run_backtest(panel, weights, top_n=5, holding_period=5, fee_rate=0.0015, side="long_short",
+                 signals=None):
+    """
+    向量化的滚动回测：每隔 holding_period 个交易日按当天收盘时的上涨概率调仓，持有到下一次调仓
+
+    做多概率最高（且 >50%）的 top_n 只，做空概率最低（且 <50%）的 top_n 只，各自等权；
+    side 为 "long_short" 时多空各占一半资金。手续费按每次调仓的买卖成交额 × fee_rate 计算。
+
+    :param panel: DatePanel
+    :param weights: 与 StockRecommendationEngine.indicators_weights 相同的权重
+    :param signals: 预先算好的 window_signals(panel)，多次回测同一面板时可以复用
+    :return: BacktestResult
+    """
+    signals = signals if signals is not None else window_signals(panel)
+    rows, forward = rebalance_rows(panel, holding_period)
+    probability = combine_signals({name: values[rows] for name, values in signals.items()}, weights)
+    return simulate(probability, forward, panel.dates[rows], top_n, fee_rate, side)
+
+
+def load_cached_frames(bar_store, codes, start_date, end_date, period="d", adjust="3"):
+    """
+    从本地K线缓存读取回测用的历史数据 {code: DataFrame}，不联网
+
+    默认读取与推荐分析相同的不复权日K线；缓存中有前复权数据时可传 adjust="1"，避免除权缺口被当成涨跌。
+    """
+    frames = {}
+    for code in codes:
+        df = bar_store.read(code, period, adjust, start_date, end_date)
+        if not df.empty:
+            frames[code] = df
+    return frames
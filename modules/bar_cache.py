@@ -0,0 +1,293 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+DATE_FORMAT = "%Y-%m-%d"
+
+# 存储的K线字段（不含键字段）
+BAR_FIELDS = ("open", "high", "low", "close", "volume", "amount")
+
+
+def is_trading_day(now):
+    """是否为交易日（只排除周末，不处理法定节假日）"""
+    return now.weekday() < 5
+
+
+def is_trading_time(now):
+    """是否处于A股连续竞价时段 9:30-11:30、13:00-15:00"""
+    if not is_trading_day(now):
+        return False
+    hm = now.hour * 100 + now.minute
+    return 930 <= hm < 1130 or 1300 <= hm < 1500
+
+
+# 每个交易日连续竞价时段的开始时刻
+SESSION_OPENS = ((9, 30), (13, 0))
+
+
+def next_session_open(now):
+    """now 之后最近一个连续竞价时段（9:30 或 13:00）的开始时刻"""
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    while True:
+        if is_trading_day(day):
+            for hour, minute in SESSION_OPENS:
+                opens = day.replace(hour=hour, minute=minute)
+                if opens > now:
+                    return opens
+        day += timedelta(days=1)
+
+
+def _shift_date(date_str, days):
+    return (datetime.strptime(date_str, DATE_FORMAT) + timedelta(days=days)).strftime(DATE_FORMAT)
+
+
+class BarStore:
+    """
+    本地K线缓存，按 (code, period, adjust) 存储日期连续的一段历史数据
+
+    coverage 表记录每个键已覆盖的日期区间和最后一次联网获取的时间；
+    请求的区间超出覆盖范围时只获取缺失的部分并合并入库，其余从磁盘读取。
+    当日K线在盘中会变化，超过 today_ttl 秒后或收盘后会重新获取一次。
+    """
+
+    def __init__(self, db_path, today_ttl=300):
+        self.db_path = db_path
+        self.today_ttl = today_ttl
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # 连接会被UI线程和后台线程共用，由 self.lock 串行化访问
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_refreshes = 0
+        self.fetched_rows = 0
+        self._create_tables()
+
+    def _create_tables(self):
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            # 缓存数据丢失可以重新获取，不需要每次提交都落盘
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS bars (
+                    code   TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    adjust TEXT NOT NULL,
+                    date   TEXT NOT NULL,
+                    open   REAL,
+                    high   REAL,
+                    low    REAL,
+                    close  REAL,
+                    volume NUMERIC,
+                    amount REAL,
+                    PRIMARY KEY (code, period, adjust, date)
+                ) WITHOUT ROWID;
+
+                CREATE TABLE IF NOT EXISTS coverage (
+                    code       TEXT NOT NULL,
+                    period     TEXT NOT NULL,
+                    adjust     TEXT NOT NULL,
+                    start_date TEXT NOT NULL,
+                    end_date   TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (code, period, adjust)
+                );
+
+                CREATE TABLE IF NOT EXISTS indicator_state (
+                    code       TEXT PRIMARY KEY,
+                    state      TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+            """)
+
+    def _today_is_stale(self, fetched_at, now):
+        """覆盖到今天的数据是否需要重新获取"""
+        if not is_trading_day(now):
+            return False
+        close_ts = now.replace(hour=15, minute=0, second=0, microsecond=0).timestamp()
+        if fetched_at >= close_ts:
+            # 收盘后获取的当日数据已是最终数据
+            return False
+        if now.timestamp() >= close_ts:
+            # 盘中获取的数据在收盘后需要刷新一次
+            return True
+        return is_trading_time(now) and now.timestamp() - fetched_at > self.today_ttl
+
+    def _missing_ranges(self, key, start, end, now):
+        """计算需要联网获取的日期区间列表 [(start, end, is_tail)]"""
+        today = now.strftime(DATE_FORMAT)
+        row = self.conn.execute(
+            "SELECT start_date, end_date, fetched_at FROM coverage WHERE code=? AND period=? AND adjust=?",
+            key).fetchone()
+        if row is None:
+            return [(start, end, True)]
+        cov_start, cov_end, fetched_at = row
+        ranges = []
+        if start < cov_start:
+            # 一直取到第一根已存K线：上游返回了这根K线而之前没有数据时（如上市日之前），
+            # 说明这一段确实没有K线，可以计入覆盖范围；什么都没返回则可能是暂时故障
+            first = self.conn.execute(
+                "SELECT MIN(date) FROM bars WHERE code=? AND period=? AND adjust=?", key).fetchone()[0]
+            ranges.append((start, first or _shift_date(cov_start, -1), False))
+        stale = end >= today and cov_end >= today and self._today_is_stale(fetched_at, now)
+        if end > cov_end or stale:
+            if stale:
+                self.stale_refreshes += 1
+            # 从最后一根已存K线开始重取，替换掉可能未走完的当日/当周/当月K线
+            last = self.conn.execute(
+                "SELECT MAX(date) FROM bars WHERE code=? AND period=? AND adjust=?", key).fetchone()[0]
+            ranges.append((last or _shift_date(cov_end, 1), end, True))
+        return ranges
+
+    def _store(self, key, ranges, frames, start, end, now):
+        """
+        写入获取到的K线并扩展覆盖区间
+
+        :return: 前复权数据的价格基准发生变化时返回 False，调用方应清空该键后重新获取
+        """
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT start_date, end_date, fetched_at FROM coverage WHERE code=? AND period=? AND adjust=?",
+                key).fetchone()
+            cov_start, cov_end, fetched_at = row if row is not None else (None, None, None)
+            for (range_start, range_end, is_tail), df in zip(ranges, frames):
+                if df.empty:
+                    # 空结果可能是上游暂时没有返回数据（头部区间包含已存的K线，正常时不会为空）：
+                    # 不删除已缓存的K线，也不扩展覆盖区间、不更新获取时间，下次请求会重新获取这一段
+                    continue
+                if key[2] == "1":
+                    # 前复权价格在除权后会整体改变，用与已存数据重叠的那根K线的开盘价检测
+                    overlap = df.iloc[0] if is_tail else df.iloc[-1]
+                    stored = self.conn.execute(
+                        "SELECT open FROM bars WHERE code=? AND period=? AND adjust=? AND date=?",
+                        key + (overlap["date"],)).fetchone()
+                    if stored is not None and abs(stored[0] - float(overlap["open"])) > 1e-6:
+                        return False
+                if is_tail:
+                    # 头部区间只与第一根已存K线重叠，直接覆盖写入；尾部区间先删除，去掉上游已不再返回的K线
+                    self.conn.execute(
+                        "DELETE FROM bars WHERE code=? AND period=? AND adjust=? AND date BETWEEN ? AND ?",
+                        key + (range_start, range_end))
+                # 转成Python原生类型，缺失值写为NULL
+                frame = df.reindex(columns=("date",) + BAR_FIELDS).astype(object)
+                frame = frame.where(frame.notna(), None)
+                records = [key + row for row in frame.itertuples(index=False, name=None)]
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+                self.fetched_rows += len(records)
+
+                # 只按实际取到数据的区间扩展覆盖范围
+                if cov_start is None:
+                    cov_start, cov_end = start, end
+                elif is_tail:
+                    cov_end = max(cov_end, end)
+                else:
+                    cov_start = min(cov_start, start)
+                if is_tail:
+                    fetched_at = now.timestamp()
+
+            if cov_start is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?, ?)",
+                    key + (cov_start, cov_end, fetched_at))
+        return True
+
+    def read(self, code, period, adjust, start, end):
+        """直接从本地读取区间内的K线，返回列为 date + BAR_FIELDS 的 DataFrame"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT date, open, high, low, close, volume, amount FROM bars "
+                "WHERE code=? AND period=? AND adjust=? AND date BETWEEN ? AND ? ORDER BY date",
+                (code, period, str(adjust), start, end)).fetchall()
+        df = pd.DataFrame.from_records(rows, columns=("date",) + BAR_FIELDS)
+        for field in BAR_FIELDS:
+            # 整列都是NULL时保持数值类型
+            df[field] = pd.to_numeric(df[field])
+        return df
+
+    def latest_closes(self, codes, period="d", adjust="3", count=2):
+        """
+        一次读取多只股票缓存中最近 count 根K线的收盘价，不联网
+        :return: {code: [(date, close), ...]}，按日期升序，缓存中没有的股票不在结果中
+        """
+        results = {}
+        with self.lock:
+            for code in codes:
+                rows = self.conn.execute(
+                    "SELECT date, close FROM bars WHERE code=? AND period=? AND adjust=? AND close IS NOT NULL "
+                    "ORDER BY date DESC LIMIT ?", (code, period, str(adjust), count)).fetchall()
+                if rows:
+                    results[code] = rows[::-1]
+        return results
+
+    def get_bars(self, code, period, adjust, start, end, fetch, now=None):
+        """
+        获取区间内的K线，缺失部分通过 fetch(start, end) 联网获取
+
+        :param fetch: 返回包含 date 及 BAR_FIELDS 列的 DataFrame，联网失败时应抛出异常
+        :param now: 当前时间，默认为 datetime.now()
+        """
+        now = now or datetime.now()
+        key = (code, period, str(adjust))
+        end = min(end, now.strftime(DATE_FORMAT))
+        if start > end:
+            return self.read(code, period, adjust, start, end)
+
+        for _ in range(2):
+            with self.lock:
+                ranges = self._missing_ranges(key, start, end, now)
+            if not ranges:
+                self.hits += 1
+                break
+            self.misses += 1
+            frames = [fetch(range_start, range_end) for range_start, range_end, _ in ranges]
+            if self._store(key, ranges, frames, start, end, now):
+                break
+            print(f"K线缓存: {code} 前复权价格基准已变化，重新获取全部数据")
+            self.invalidate(code, period, adjust)
+        return self.read(code, period, adjust, start, end)
+
+    def invalidate(self, code=None, period=None, adjust=None):
+        """删除缓存数据，参数为 None 表示不限制该字段"""
+        conditions, params = [], []
+        for field, value in (("code", code), ("period", period), ("adjust", adjust)):
+            if value is not None:
+                conditions.append(f"{field}=?")
+                params.append(str(value))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.lock, self.conn:
+            self.conn.execute(f"DELETE FROM bars{where}", params)
+            self.conn.execute(f"DELETE FROM coverage{where}", params)
+
+    def load_indicator_states(self):
+        """读取保存的流式指标状态 {code: dict}"""
+        with self.lock:
+            rows = self.conn.execute("SELECT code, state FROM indicator_state").fetchall()
+        return {code: json.loads(state) for code, state in rows}
+
+    def save_indicator_states(self, states):
+        """保存流式指标状态 {code: dict}"""
+        now = datetime.now().timestamp()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO indicator_state VALUES (?, ?, ?)",
+                [(code, json.dumps(state), now) for code, state in states.items()])
+
+    def stats(self):
+        """命中/未命中等统计"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "stale_refreshes": self.stale_refreshes,
+            "fetched_rows": self.fetched_rows,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
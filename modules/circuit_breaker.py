@@ -0,0 +1,78 @@
+import time
+import threading
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于断开状态，调用被直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败 failure_threshold 次后断开，断开期间的调用直接失败，不再访问上游
+
+    断开 reset_timeout 秒后进入半开状态，只放行一次试探调用：成功则恢复闭合，失败则重新断开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.rejected = 0  # 断开期间被拒绝的调用次数
+        self.trips = 0     # 断开的次数
+
+    def allow(self, now=None):
+        """是否允许本次调用；半开状态下只有第一个调用方得到试探机会"""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, now=None):
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                    print(f"熔断器: {self.name} 连续失败 {self._failures} 次，{self.reset_timeout:.0f}s 内不再访问")
+                self.state = self.OPEN
+                self._opened_at = now
+                self._probing = False
+
+    def call(self, func, *args, **kwargs):
+        """通过熔断器调用 func，断开时抛出 CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} 已熔断")
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self):
+        return {"state": self.state, "trips": self.trips, "rejected": self.rejected}
@@ -0,0 +1,86 @@
+import os
+import json
+
+# 系统配置文件路径（可选，不存在时使用默认配置）
+CONFIG_FILE = os.path.join("data", "config.json")
+
+# 默认配置
+DEFAULT_CONFIG = {
+    # 用户数据存储后端："sqlite" 或 "json"
+    "storage_backend": "sqlite",
+    # SQLite数据库文件路径
+    "sqlite_path": os.path.join("data", "stock_simulator.db"),
+    # 交易日志每追加多少条执行一次fsync，0表示只在退出时fsync
+    "journal_fsync_every": 0,
+    # 股票数据缓存写回磁盘的间隔（秒），0表示每次修改立即写入
+    "cache_flush_interval": 2.0,
+    # 本地K线缓存数据库路径
+    "bar_cache_path": os.path.join("data", "bars.db"),
+    # 盘中当日K线的有效期（秒），超过后重新获取
+    "bar_cache_today_ttl": 300,
+    # 图表数据内存缓存的容量上限（MB）
+    "chart_cache_max_mb": 64,
+    # 图表数据内存缓存的有效期（秒），盘中使用较短的有效期
+    "chart_cache_ttl": 3600,
+    "chart_cache_trading_ttl": 60,
+    # 行情数据提供者："akshare"（联网）、"local"（回放 market_data_dir 中的 Parquet/CSV K线文件）
+    # 或 "synthetic"（按 synthetic_seed 生成的确定性模拟行情），后两种不联网，可用于离线测试
+    "market_data_provider": "akshare",
+    "market_data_dir": os.path.join("data", "market"),
+    "synthetic_seed": 0,
+    # 各上游数据源的限流（每秒请求数rate、突发burst）与重试（次数retries、初始退避秒数backoff），
+    # 以及每个接口的熔断（连续失败breaker_failures次后断开，breaker_reset秒后试探恢复）
+    "fetch_upstreams": {
+        "default": {"rate": 5, "burst": 5, "retries": 2, "backoff": 0.5,
+                    "breaker_failures": 5, "breaker_reset": 30},
+    },
+    # 行情请求网关：同时执行的请求数，以及每秒开始执行的请求数上限（0 表示只按上游分别限流）与突发数
+    "gateway_max_concurrency": 8,
+    "gateway_rate": 0,
+    "gateway_burst": None,
+    # 全市场实时行情快照的有效期（秒），有效期内的刷新直接复用快照，不重新下载
+    "spot_snapshot_max_age": 5,
+    # 行情页自动刷新："live"（每 auto_refresh_interval 秒获取一次实时行情）或 "replay"（回放录制的K线）
+    "auto_refresh_mode": "live",
+    "auto_refresh_interval": 30,
+    # 行情回放：K线目录（为空时使用 market_data_dir）、周期（"d" 或 "60min"）、
+    # 速度倍数（市场时间/真实时间，0 表示尽快推送）、回放区间（为空时回放最近 replay_days 天）
+    "replay_dir": None,
+    "replay_interval": "d",
+    "replay_speed": 3600,
+    "replay_days": 30,
+    "replay_start": None,
+    "replay_end": None,
+    # 显示页面后是否在空闲时预先创建下一个可能访问的页面
+    "prefetch_frames": True,
+    # 流式RSI的计算方式："sma"（简单平均，与逐只分析一致）或 "wilder"（Wilder平滑）
+    "rsi_method": "sma",
+    # 推荐打分方式："stream"（流式指标状态）或 "process"（多进程分片批量计算，适合股票很多时）
+    "recommend_mode": "stream",
+    # 多进程打分的进程数，0 表示使用全部CPU核心
+    "recommend_workers": 0,
+    # 多进程打分每个分片的股票数量，分片完成后结果立即显示
+    "recommend_shard_size": 500,
+    # 推荐权重优化结果（python -m modules.weight_optimizer 生成），推荐引擎启动时读取
+    "recommendation_weights_path": "data/recommendation_weights.json",
+    # 推荐使用的技术指标（名称见 modules/indicator_registry.py 的 INDICATORS），
+    # 只选原有五项时使用流式指标状态，选了其他指标时按需获取更长的历史数据批量计算
+    "recommend_indicators": ["ma_signal", "rsi_signal", "volume_signal", "price_momentum", "volatility_signal"],
+}
+
+_config = None
+
+
+def get_config():
+    """获取系统配置（默认配置与 data/config.json 合并后的结果）"""
+    global _config
+    if _config is None:
+        config = dict(DEFAULT_CONFIG)
+        if os.path.exists(CONFIG_FILE):
+            try:
+                with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+                    config.update(json.load(f))
+            except Exception as e:
+                print(f"读取配置文件出错，使用默认配置: {e}")
+        _config = config
+    return _config
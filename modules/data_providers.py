@@ -0,0 +1,367 @@
+import os
+import zlib
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .config import get_config
+from .bar_cache import BAR_FIELDS, DATE_FORMAT
+
+# 提供者返回的K线列：日K线的 date 为 YYYY-MM-DD 字符串，60分钟线的 date 为 datetime
+BAR_COLUMNS = ("date",) + BAR_FIELDS
+
+# 全市场实时行情沿用 stock_zh_a_spot_em 的列名，QuoteService 按这些列建立快照
+SPOT_COLUMNS = ("代码", "名称", "最新价", "涨跌幅", "成交量")
+
+
+def to_ak_code(bs_code):
+    """将BaoStock的股票代码 (如 sh.600000) 转换为AKShare的6位代码 (如 600000)"""
+    if isinstance(bs_code, str) and '.' in bs_code:
+        return bs_code.split('.')[1]
+    return bs_code
+
+
+def resample_bars(df, frequency):
+    """把日K线合并为周K线(w)或月K线(m)，日期取每个周期最后一个交易日"""
+    if frequency not in ("w", "m") or df.empty:
+        return df
+    dates = pd.to_datetime(df["date"])
+    groups = dates.dt.to_period("W" if frequency == "w" else "M")
+    bars = df.assign(date=dates).groupby(groups.to_numpy(), sort=True).agg(
+        date=("date", "last"), open=("open", "first"), high=("high", "max"), low=("low", "min"),
+        close=("close", "last"), volume=("volume", "sum"), amount=("amount", "sum"))
+    bars["date"] = bars["date"].dt.strftime(DATE_FORMAT)
+    return bars.reset_index(drop=True)
+
+
+class MarketDataProvider:
+    """
+    行情数据提供者接口，StockDataManager 通过它获取全部行情，本地缓存、限流等逻辑与数据来源无关
+
+    三个方法在网络或数据异常时直接抛出，由调用方决定使用哪种备用数据；
+    没有数据时返回空 DataFrame。
+    """
+
+    name = "base"
+
+    def fetch_daily_bars(self, code, start_date, end_date, frequency="d", adjustflag="3"):
+        """
+        获取历史K线
+        :param code: 股票代码，如"sh.600000"
+        :param frequency: d=日k线，w=周k线，m=月k线
+        :param adjustflag: 1=前复权，2=后复权，3=不复权
+        :return: 列为 BAR_COLUMNS 的 DataFrame，按日期升序
+        """
+        raise NotImplementedError
+
+    def fetch_hourly_bars(self, code, start_time, end_time):
+        """
+        获取 [start_time, end_time] 之间的60分钟线
+        :return: 列为 BAR_COLUMNS 的 DataFrame，date 为 datetime，按时间升序
+        """
+        raise NotImplementedError
+
+    def fetch_spot_board(self):
+        """获取全市场实时行情，列至少包含 代码、最新价，另可包含 涨跌幅、成交量"""
+        raise NotImplementedError
+
+
+class AKShareProvider(MarketDataProvider):
+    """通过 AKShare（东方财富接口）联网获取行情，所有请求经过获取引擎限流、重试和熔断"""
+
+    name = "akshare"
+
+    # AKShare 列名 → 统一列名
+    RENAME = {
+        "日期": "date",
+        "时间": "date",
+        "开盘": "open",
+        "收盘": "close",
+        "最高": "high",
+        "最低": "low",
+        "成交量": "volume",
+        "成交额": "amount",
+    }
+    # 需要用指数接口获取60分钟线的完整代码，如上证指数 "sh.000001"、深证成指 "sz.399001"
+    INDEX_CODES = ()
+
+    def __init__(self, fetch_engine):
+        self.fetch_engine = fetch_engine
+
+    def fetch_daily_bars(self, code, start_date, end_date, frequency="d", adjustflag="3"):
+        import akshare as ak  # 按需导入，避免拖慢程序启动
+        ak_code = to_ak_code(code)
+
+        # AKShare 日期格式 YYYYMMDD
+        ak_start_date = start_date.replace("-", "")
+        ak_end_date = end_date.replace("-", "")
+        ak_period = {"d": "daily", "w": "weekly", "m": "monthly"}.get(frequency, "daily")
+        ak_adjust = {"1": "qfq", "2": "hfq", "3": ""}.get(str(adjustflag), "")
+
+        print(f"AKShare: 获取 {ak_code} 从 {ak_start_date} 到 {ak_end_date}, period: {ak_period}, adjust: {ak_adjust}")
+        df = self.fetch_engine.call("eastmoney", ak.stock_zh_a_hist,
+                                    symbol=ak_code,
+                                    period=ak_period,
+                                    start_date=ak_start_date,
+                                    end_date=ak_end_date,
+                                    adjust=ak_adjust)
+
+        if df.empty:
+            print(f"AKShare: 未获取到股票 {ak_code} 在该区间的数据")
+            return pd.DataFrame(columns=BAR_COLUMNS)
+
+        # AKShare 列名: 日期, 开盘, 收盘, 最高, 最低, 成交量, 成交额, 振幅, 涨跌幅, 涨跌额, 换手率
+        # 有些数据可能不存在，例如刚上市的股票可能没有成交额
+        df = df.rename(columns=self.RENAME).reindex(columns=BAR_COLUMNS)
+        for field in BAR_FIELDS:
+            df[field] = pd.to_numeric(df[field], errors='coerce')
+        df['date'] = pd.to_datetime(df['date']).dt.strftime(DATE_FORMAT)
+
+        print(f"AKShare: 成功获取并处理了 {code} 的数据, 共 {len(df)} 条")
+        return df
+
+    def fetch_hourly_bars(self, code, start_time, end_time):
+        import akshare as ak  # 按需导入，避免拖慢程序启动
+        start_str = start_time.strftime('%Y-%m-%d %H:%M:%S')
+        end_str = end_time.strftime('%Y-%m-%d %H:%M:%S')
+        if code in self.INDEX_CODES:
+            symbol = code.replace('.', '')
+            print(f"AKShare (Index): 获取 {symbol} ({code}) 60分钟线数据, 从 {start_str} 到 {end_str}")
+            df = self.fetch_engine.call("eastmoney", ak.index_zh_a_hist_min_em, symbol=symbol,
+                                        start_date=start_str, end_date=end_str, period='60')
+        else:
+            symbol = to_ak_code(code)
+            print(f"AKShare (Stock): 获取 {symbol} ({code}) 60分钟线数据, 从 {start_str} 到 {end_str}")
+            df = self.fetch_engine.call("eastmoney", ak.stock_zh_a_hist_min_em, symbol=symbol,
+                                        start_date=start_str, end_date=end_str, period='60', adjust='qfq')
+
+        if df is None or df.empty:
+            return pd.DataFrame(columns=BAR_COLUMNS)
+        df = df.rename(columns=self.RENAME)
+        if 'date' not in df.columns:
+            raise ValueError(f"60分钟数据缺少 '时间' 列 ({symbol})")
+        df = df.reindex(columns=BAR_COLUMNS)
+        df['date'] = pd.to_datetime(df['date'])
+        return df.sort_values(by='date').reset_index(drop=True)
+
+    def fetch_spot_board(self):
+        import akshare as ak  # 按需导入，避免拖慢程序启动
+        return self.fetch_engine.call("eastmoney", ak.stock_zh_a_spot_em)
+
+
+class LocalFileProvider(MarketDataProvider):
+    """
+    从本地目录回放K线，不联网：每只股票一个文件 <代码>.parquet 或 <代码>.csv（如 sh.600000.csv），
+    列为 BAR_COLUMNS；60分钟线放在 <代码>.60min.parquet / .csv
+
+    日K线按请求区间截取，周K线、月K线由日K线合并；不区分复权类型，文件里是什么价格就返回什么价格。
+    全市场实时行情由每只股票的最后两根日K线生成。文件按修改时间缓存在内存中。
+    """
+
+    name = "local"
+
+    def __init__(self, directory, universe=None):
+        """
+        :param directory: K线文件所在目录
+        :param universe: 无参函数，返回全市场行情包含的股票代码，默认为目录中的全部股票
+        """
+        self.directory = directory
+        self.universe = universe
+        self._frames = {}  # 路径 → (修改时间, DataFrame)
+        self._lock = threading.Lock()
+
+    def _path(self, code, suffix=""):
+        for ext in (".parquet", ".csv"):
+            path = os.path.join(self.directory, f"{code}{suffix}{ext}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _load(self, code, suffix=""):
+        path = self._path(code, suffix)
+        if path is None:
+            return pd.DataFrame(columns=BAR_COLUMNS)
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            cached = self._frames.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        # 读取 parquet 需要安装 pyarrow 或 fastparquet
+        df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path, dtype={"date": str})
+        df = df.reindex(columns=BAR_COLUMNS)
+        for field in BAR_FIELDS:
+            df[field] = pd.to_numeric(df[field], errors="coerce")
+        if suffix:
+            df["date"] = pd.to_datetime(df["date"])
+        else:
+            df["date"] = pd.to_datetime(df["date"]).dt.strftime(DATE_FORMAT)
+        df = df.sort_values("date").reset_index(drop=True)
+        with self._lock:
+            self._frames[path] = (mtime, df)
+        return df
+
+    def save_bars(self, code, df, fmt="csv", hourly=False):
+        """把K线写入目录（录制行情供之后回放），fmt 为 "csv" 或 "parquet"，返回文件路径"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{code}{'.60min' if hourly else ''}.{fmt}")
+        frame = df.reindex(columns=BAR_COLUMNS)
+        if fmt == "parquet":
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_csv(path, index=False)
+        return path
+
+    def codes(self):
+        """目录中有日K线文件的全部股票代码"""
+        if not os.path.isdir(self.directory):
+            return []
+        codes = set()
+        for filename in os.listdir(self.directory):
+            code, ext = os.path.splitext(filename)
+            if ext in (".parquet", ".csv") and not code.endswith(".60min"):
+                codes.add(code)
+        return sorted(codes)
+
+    def fetch_daily_bars(self, code, start_date, end_date, frequency="d", adjustflag="3"):
+        df = self._load(code)
+        df = df[(df["date"] >= start_date) & (df["date"] <= end_date)].reset_index(drop=True)
+        return resample_bars(df, frequency)
+
+    def fetch_hourly_bars(self, code, start_time, end_time):
+        df = self._load(code, ".60min")
+        return df[(df["date"] >= start_time) & (df["date"] <= end_time)].reset_index(drop=True)
+
+    def fetch_spot_board(self):
+        codes = self.universe() if self.universe else self.codes()
+        rows = []
+        for code in codes:
+            df = self._load(code)
+            if df.empty:
+                continue
+            last = df.iloc[-1]
+            prev_close = df["close"].iloc[-2] if len(df) >= 2 else np.nan
+            change = (last["close"] / prev_close - 1) * 100 if prev_close > 0 else 0.0
+            rows.append((to_ak_code(code), code, last["close"], round(change, 2), last["volume"]))
+        return pd.DataFrame.from_records(rows, columns=SPOT_COLUMNS)
+
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    确定性的模拟行情，不联网、不读文件，用于压力测试和基准测试
+
+    每只股票的日K线是从 EPOCH 开始、以 (seed, 代码) 为随机种子的随机游走（只有工作日有K线），
+    同一只股票同一天的K线与请求的区间无关，多次请求结果相同。
+    60分钟线由日K线在4个整点之间插值得到；实时行情按交易时段的进度从昨收走向当日收盘价。
+    """
+
+    name = "synthetic"
+    EPOCH = np.datetime64("2015-01-05")
+    # A股60分钟线的时间点
+    HOURS = ((10, 30), (11, 30), (14, 0), (15, 0))
+
+    def __init__(self, seed=0, universe=None):
+        """
+        :param seed: 随机种子，种子相同时所有行情完全相同
+        :param universe: 无参函数，返回全市场行情包含的股票代码，默认为空
+        """
+        self.seed = seed
+        self.universe = universe
+
+    def _rng(self, code, *extra):
+        return np.random.default_rng([self.seed, zlib.crc32(str(code).encode("utf-8"))] + list(extra))
+
+    def _series(self, code, end):
+        """从 EPOCH 到 end（含）每个工作日的 (日期, open, high, low, close, volume, amount)"""
+        days = np.busday_count(self.EPOCH, np.datetime64(end, "D") + 1)
+        if days <= 0:
+            return (np.array([], dtype="datetime64[D]"),) + (np.array([]),) * 6
+        rng = self._rng(code)
+        base = 3 + rng.random() * 97
+        # 按天取随机数（每天5个），前面各天的K线不随 end 变化
+        draws = rng.standard_normal((days, 5)).T
+        close = base * np.exp(np.cumsum(0.0002 + 0.02 * draws[0]))
+        prev_close = np.concatenate(([base], close[:-1]))
+        open_ = prev_close * (1 + 0.005 * draws[1])
+        high = np.maximum(open_, close) * (1 + 0.01 * np.abs(draws[2]))
+        low = np.minimum(open_, close) * (1 - 0.01 * np.abs(draws[3]))
+        volume = np.round(np.exp(11 + 0.4 * draws[4]))
+        amount = volume * 100 * (open_ + close) / 2  # 成交量以手为单位
+        dates = np.busday_offset(self.EPOCH, np.arange(days), roll="forward")
+        return dates, open_, high, low, close, volume, amount
+
+    def fetch_daily_bars(self, code, start_date, end_date, frequency="d", adjustflag="3"):
+        dates, *fields = self._series(code, end_date)
+        first = np.searchsorted(dates, np.datetime64(start_date, "D"))
+        columns = {"date": np.datetime_as_string(dates[first:], unit="D").astype(object)}
+        for field, values in zip(BAR_FIELDS, fields):
+            columns[field] = values[first:] if field == "volume" else np.round(values[first:], 2)
+        return resample_bars(pd.DataFrame(columns), frequency)
+
+    def fetch_hourly_bars(self, code, start_time, end_time):
+        daily = self.fetch_daily_bars(code, start_time.strftime(DATE_FORMAT), end_time.strftime(DATE_FORMAT))
+        rows = []
+        for day in daily.itertuples(index=False):
+            day_dt = datetime.strptime(day.date, DATE_FORMAT)
+            # 同一天的走势只由 (代码, 日期) 决定
+            noise = self._rng(code, day_dt.toordinal()).standard_normal(len(self.HOURS))
+            path = np.linspace(day.open, day.close, len(self.HOURS) + 1)
+            prices = np.clip(path[1:] * (1 + 0.003 * noise), day.low, day.high)
+            prices[-1] = day.close
+            opens = np.concatenate(([day.open], prices[:-1]))
+            for (hour, minute), open_, close in zip(self.HOURS, opens, prices):
+                when = day_dt.replace(hour=hour, minute=minute)
+                if start_time <= when <= end_time:
+                    volume = round(day.volume / len(self.HOURS))
+                    rows.append((when, round(open_, 2), round(max(open_, close), 2), round(min(open_, close), 2),
+                                 round(close, 2), volume, volume * 100 * close))
+        df = pd.DataFrame.from_records(rows, columns=BAR_COLUMNS)
+        df["date"] = pd.to_datetime(df["date"])
+        return df
+
+    @staticmethod
+    def _session_progress(now):
+        """当日交易时段已走过的比例（9:30 为0，15:00 为1，午间休市不计）"""
+        minutes = now.hour * 60 + now.minute + now.second / 60
+        elapsed = min(max(minutes - 570, 0), 120) + min(max(minutes - 780, 0), 120)
+        return elapsed / 240
+
+    def fetch_spot_board(self, now=None):
+        now = now or datetime.now()
+        today = np.datetime64(now.strftime(DATE_FORMAT), "D")
+        progress = self._session_progress(now)
+        rows = []
+        for code in (self.universe() if self.universe else []):
+            # 只需要最后两根日K线，不构造 DataFrame
+            dates, _, _, _, close, volume, _ = self._series(code, today)
+            if len(dates) < 2:
+                continue
+            prev_close, close, volume = round(close[-2], 2), round(close[-1], 2), float(volume[-1])
+            if dates[-1] == today:
+                # 盘中价格从昨收按进度走向当日收盘价
+                close = prev_close + (close - prev_close) * progress
+                volume = round(volume * progress)
+            price = round(float(close), 2)
+            rows.append((to_ak_code(code), code, price, round((price / prev_close - 1) * 100, 2), volume))
+        return pd.DataFrame.from_records(rows, columns=SPOT_COLUMNS)
+
+
+def create_provider(fetch_engine=None, universe=None):
+    """
+    按系统配置的 market_data_provider 创建行情数据提供者
+    :param fetch_engine: AKShare 使用的获取引擎，默认按配置新建
+    :param universe: 无参函数，返回本地/模拟全市场行情包含的股票代码
+    """
+    config = get_config()
+    kind = config["market_data_provider"]
+    if kind == "local":
+        return LocalFileProvider(config["market_data_dir"], universe)
+    if kind == "synthetic":
+        return SyntheticProvider(config["synthetic_seed"], universe)
+    if kind != "akshare":
+        print(f"未知的行情数据提供者 {kind}，使用 akshare")
+    if fetch_engine is None:
+        from .fetch_engine import create_fetch_engine
+        fetch_engine = create_fetch_engine()
+    return AKShareProvider(fetch_engine)
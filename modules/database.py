@@ -1,13 +1,29 @@
 import os
 import json
-import pandas as pd
+import uuid
+import time
+import atexit
+import threading
 from datetime import datetime
+from .config import get_config
+from .storage import create_user_storage, atomic_write_json
+from .journal import TransactionJournal
+from .wal import WriteAheadLog
+from .locks import LockStats, RWLock, KeyedLocks
+from .price_snapshot import PriceSnapshot
 
 class Database:
     """数据库类，用于管理用户数据和股票数据"""
     
-    def __init__(self):
-        """初始化数据库"""
+    # 交易写入预写日志后应用到存储失败时的重试次数
+    APPLY_RETRIES = 3
+    
+    def __init__(self, backend=None):
+        """
+        初始化数据库
+        :param backend: 用户数据存储后端，"sqlite" 或 "json"，默认读取配置
+        """
+        config = get_config()
         self.data_dir = "data"
         self.users_file = os.path.join(self.data_dir, "users.json")
         self.stocks_file = os.path.join(self.data_dir, "stocks.json")
@@ -19,6 +35,39 @@ class Database:
         
         # 初始化数据文件
         self._initialize_data_files()
+        
+        # 并发控制：交易按用户加锁，股票表使用读写锁，并统计锁等待时间
+        self.lock_stats = LockStats()
+        self.user_locks = KeyedLocks("user", self.lock_stats)
+        self.stocks_lock = RWLock("stocks", self.lock_stats)
+        
+        # 内存缓存：用户数据直写存储，股票数据标记脏键后定期写回
+        self.cache_lock = threading.RLock()  # 保护用户缓存
+        self.flush_interval = config["cache_flush_interval"]
+        self._users_cache = None
+        self._users_version = None
+        self._user_changes = 0     # 用户数据每次变化（含其他进程的修改）加一
+        self._stocks_cache = None
+        self._stocks_mtime = None
+        self._dirty_stocks = set()
+        self._stocks_version = 0   # 股票数据每次变化加一
+        self._snapshot = None      # 当前版本的只读价格快照
+        self._flush_event = threading.Event()
+        self._flush_thread = None
+        atexit.register(self.flush)
+        
+        # 创建用户存储后端（首次使用SQLite时自动导入 users.json）
+        self.storage = create_user_storage(backend or config["storage_backend"],
+                                           self.users_file, config["sqlite_path"])
+        
+        # 只追加的交易日志
+        self.journal = TransactionJournal(self.transactions_dir, config["journal_fsync_every"])
+        
+        # 交易预写日志，启动时重放上次未完成的交易
+        self.wal = WriteAheadLog(os.path.join(self.data_dir, "trade.wal"))
+        # 已提交到预写日志但应用失败的交易 {用户: [(序号, 记录)]}，只在持有该用户的锁时读写
+        self._unapplied = {}
+        self._recover_trades()
     
     def _initialize_data_files(self):
         """初始化数据文件"""
@@ -56,19 +105,54 @@ class Database:
             with open(self.stocks_file, "w", encoding="utf-8") as f:
                 json.dump(default_stocks, f, ensure_ascii=False, indent=4)
     
+    @staticmethod
+    def _copy_user(user):
+        """复制用户数据，避免调用方修改缓存"""
+        copied = dict(user)
+        copied["holdings"] = {code: dict(h) for code, h in user.get("holdings", {}).items()}
+        return copied
+    
+    def _users(self):
+        """
+        返回用户缓存，存储被其他进程修改后重新加载（调用方需持有 cache_lock）
+        读取失败时不更新缓存和版本号，继续使用旧缓存，下次访问时重试
+        """
+        version = self.storage.version()
+        if self._users_cache is None or version != self._users_version:
+            try:
+                users = self.storage.load_users()
+            except Exception as e:
+                print(f"获取用户信息出错: {e}")
+                return self._users_cache if self._users_cache is not None else {}
+            self._users_cache = users
+            self._users_version = version
+            self._user_changes += 1
+        return self._users_cache
+    
+    def _after_user_write(self):
+        """本进程写入用户数据后同步版本号，避免把自己的写入当成外部修改"""
+        self._users_version = self.storage.version()
+        self._user_changes += 1
+    
+    def get_data_version(self):
+        """
+        返回 (股票数据版本, 用户数据版本)，界面据此判断隐藏期间数据是否变化
+        """
+        self._ensure_stocks_fresh()
+        with self.cache_lock:
+            self._users()
+            return self._stocks_version, self._user_changes
+    
     def get_users(self):
         """获取所有用户信息"""
-        try:
-            with open(self.users_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"获取用户信息出错: {e}")
-            return {}
+        with self.cache_lock:
+            return {username: self._copy_user(user) for username, user in self._users().items()}
     
     def get_user(self, username):
         """获取指定用户信息"""
-        users = self.get_users()
-        return users.get(username)
+        with self.cache_lock:
+            user = self._users().get(username)
+            return self._copy_user(user) if user else None
     
     def authenticate_user(self, username, password):
         """验证用户登录"""
@@ -89,8 +173,8 @@ class Database:
     
     def user_exists(self, username):
         """检查用户名是否已存在"""
-        users = self.get_users()
-        return username in users
+        with self.cache_lock:
+            return username in self._users()
     
     def register_user(self, username, password, user_type="普通用户", initial_balance=100000.0):
         """注册新用户"""
@@ -104,11 +188,7 @@ class Database:
     
     def add_user(self, username, password, user_type="user", initial_balance=100000.0):
         """添加用户"""
-        users = self.get_users()
-        if username in users:
-            return False, "用户名已存在"
-        
-        users[username] = {
+        user = {
             "password": password,
             "type": user_type,
             "balance": initial_balance,
@@ -117,79 +197,190 @@ class Database:
         }
         
         try:
-            with open(self.users_file, "w", encoding="utf-8") as f:
-                json.dump(users, f, ensure_ascii=False, indent=4)
+            # 在用户锁内检查是否存在，并发添加同名用户时只有一个成功
+            with self.user_locks.hold(username), self.cache_lock:
+                users = self._users()
+                if username in users:
+                    return False, "用户名已存在"
+                self.storage.add_user(username, user)
+                users[username] = user
+                self._after_user_write()
             return True, "用户添加成功"
         except Exception as e:
             return False, f"添加用户出错: {e}"
     
     def update_user(self, username, data):
         """更新用户信息"""
-        users = self.get_users()
-        if username not in users:
-            return False, "用户不存在"
-        
-        # 更新用户数据
-        for key, value in data.items():
-            users[username][key] = value
-        
         try:
-            with open(self.users_file, "w", encoding="utf-8") as f:
-                json.dump(users, f, ensure_ascii=False, indent=4)
+            with self.user_locks.hold(username), self.cache_lock:
+                users = self._users()
+                if username not in users:
+                    return False, "用户不存在"
+                self.storage.update_user(username, data)
+                user = users[username]
+                for key, value in data.items():
+                    user[key] = value
+                users[username] = self._copy_user(user)
+                self._after_user_write()
             return True, "用户信息更新成功"
         except Exception as e:
             return False, f"更新用户信息出错: {e}"
     
     def delete_user(self, username):
         """删除用户"""
-        users = self.get_users()
-        if username not in users:
-            return False, "用户不存在"
-        
-        # 删除用户
-        del users[username]
-        
         try:
-            with open(self.users_file, "w", encoding="utf-8") as f:
-                json.dump(users, f, ensure_ascii=False, indent=4)
+            with self.user_locks.hold(username), self.cache_lock:
+                users = self._users()
+                if username not in users:
+                    return False, "用户不存在"
+                self.storage.delete_user(username)
+                users.pop(username, None)
+                self._after_user_write()
             return True, "用户删除成功"
         except Exception as e:
             return False, f"删除用户出错: {e}"
     
+    def _stocks_file_mtime(self):
+        try:
+            return os.stat(self.stocks_file).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _stocks(self):
+        """
+        返回股票缓存（调用方需持有 stocks_lock 写锁）
+        stocks.json 被其他进程修改后重新加载，本进程尚未写回的修改覆盖在新数据之上
+        """
+        mtime = self._stocks_file_mtime()
+        if self._stocks_cache is None or mtime != self._stocks_mtime:
+            try:
+                with open(self.stocks_file, "r", encoding="utf-8") as f:
+                    stocks = json.load(f)
+            except Exception as e:
+                print(f"获取股票信息出错: {e}")
+                stocks = {}
+            if self._stocks_cache is not None:
+                for code in self._dirty_stocks:
+                    stocks[code] = self._stocks_cache[code]
+            self._stocks_cache = stocks
+            self._stocks_version += 1
+            self._stocks_mtime = mtime
+        return self._stocks_cache
+    
+    def _ensure_stocks_fresh(self):
+        """缓存未加载或文件已被修改时，在写锁下重新加载"""
+        if self._stocks_cache is None or self._stocks_file_mtime() != self._stocks_mtime:
+            with self.stocks_lock.write_lock():
+                self._stocks()
+    
     def get_stocks(self):
         """获取所有股票信息"""
-        try:
-            with open(self.stocks_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"获取股票信息出错: {e}")
-            return {}
+        self._ensure_stocks_fresh()
+        with self.stocks_lock.read_lock():
+            return {code: dict(info) for code, info in self._stocks_cache.items()}
     
     def get_stock(self, code):
         """获取指定股票信息"""
-        stocks = self.get_stocks()
-        return stocks.get(code)
+        self._ensure_stocks_fresh()
+        with self.stocks_lock.read_lock():
+            stock = self._stocks_cache.get(code)
+            return dict(stock) if stock else None
+    
+    def get_price_snapshot(self):
+        """
+        获取只读的列式价格快照（PriceSnapshot），股价未变化时返回同一个对象
+        """
+        self._ensure_stocks_fresh()
+        with self.stocks_lock.read_lock():
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != self._stocks_version:
+                snapshot = PriceSnapshot(self._stocks_cache, self._stocks_version)
+                self._snapshot = snapshot
+            return snapshot
     
     def update_stock(self, code, data):
-        """更新股票信息"""
-        stocks = self.get_stocks()
-        if code not in stocks:
-            stocks[code] = {"name": data.get("name", code)}
-        
-        # 更新股票数据
-        for key, value in data.items():
-            stocks[code][key] = value
+        """更新股票信息（先写入缓存，由后台定期写回磁盘）"""
+        with self.stocks_lock.write_lock():
+            stocks = self._stocks()
+            if code not in stocks:
+                stocks[code] = {"name": data.get("name", code)}
+            
+            # 更新股票数据
+            for key, value in data.items():
+                stocks[code][key] = value
+            self._dirty_stocks.add(code)
+            self._stocks_version += 1
         
-        try:
-            with open(self.stocks_file, "w", encoding="utf-8") as f:
-                json.dump(stocks, f, ensure_ascii=False, indent=4)
+        if not self.flush_interval:
+            return self.flush()
+        self._schedule_flush()
+        return True, "股票信息更新成功"
+    
+    def update_stocks(self, mapping):
+        """
+        批量更新股票信息：一次加锁写入缓存，整批只触发一次写回
+        :param mapping: {code: data} 字典
+        """
+        if not mapping:
             return True, "股票信息更新成功"
-        except Exception as e:
-            return False, f"更新股票信息出错: {e}"
+        with self.stocks_lock.write_lock():
+            stocks = self._stocks()
+            for code, data in mapping.items():
+                if code not in stocks:
+                    stocks[code] = {"name": data.get("name", code)}
+                stocks[code].update(data)
+            self._dirty_stocks.update(mapping.keys())
+            self._stocks_version += 1
+        
+        if not self.flush_interval:
+            return self.flush()
+        self._schedule_flush()
+        return True, f"已更新 {len(mapping)} 只股票信息"
     
-    def record_transaction(self, username, transaction_type, stock_code, stock_name, price, quantity, amount):
-        """记录交易"""
-        transaction = {
+    def _schedule_flush(self):
+        """启动后台写回线程（只启动一次）"""
+        with self.stocks_lock.write_lock():
+            if self._flush_thread is None:
+                self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flush_thread.start()
+    
+    def _flush_loop(self):
+        """每隔 flush_interval 秒把脏数据写回磁盘"""
+        while not self._flush_event.wait(self.flush_interval):
+            if self._dirty_stocks:
+                success, message = self.flush()
+                if not success:
+                    print(message)
+    
+    def flush(self):
+        """将缓存中被修改过的股票数据写回 stocks.json"""
+        with self.stocks_lock.write_lock():
+            if not self._dirty_stocks:
+                return True, "股票信息更新成功"
+            try:
+                atomic_write_json(self.stocks_file, self._stocks())
+                self._dirty_stocks.clear()
+                self._stocks_mtime = os.stat(self.stocks_file).st_mtime_ns
+                return True, "股票信息更新成功"
+            except Exception as e:
+                return False, f"更新股票信息出错: {e}"
+    
+    def get_lock_stats(self):
+        """获取锁等待统计，{锁名称: {count, total_wait, avg_wait, max_wait}}"""
+        return self.lock_stats.snapshot()
+    
+    def close(self):
+        """停止后台写回并保存所有未写入的数据"""
+        self._flush_event.set()
+        self.flush()
+        self.journal.close()
+        self.wal.close()
+        self.storage.close()
+    
+    def _new_transaction(self, username, transaction_type, stock_code, stock_name, price, quantity, amount):
+        """生成一条带唯一编号的交易记录"""
+        return {
+            "txn_id": uuid.uuid4().hex,
             "username": username,
             "type": transaction_type,  # "buy" 或 "sell"
             "stock_code": stock_code,
@@ -199,47 +390,139 @@ class Database:
             "amount": amount,
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
-        
-        # 用户交易记录文件
-        user_transactions_file = os.path.join(self.transactions_dir, f"{username}_transactions.json")
-        
-        # 读取现有交易记录
-        transactions = []
-        if os.path.exists(user_transactions_file):
-            try:
-                with open(user_transactions_file, "r", encoding="utf-8") as f:
-                    transactions = json.load(f)
-            except:
-                transactions = []
-        
-        # 添加新交易记录
-        transactions.append(transaction)
-        
-        # 保存交易记录
+    
+    def record_transaction(self, username, transaction_type, stock_code, stock_name, price, quantity, amount):
+        """记录交易"""
+        transaction = self._new_transaction(username, transaction_type, stock_code, stock_name,
+                                            price, quantity, amount)
         try:
-            with open(user_transactions_file, "w", encoding="utf-8") as f:
-                json.dump(transactions, f, ensure_ascii=False, indent=4)
+            self.journal.append(username, transaction)
             return True, "交易记录保存成功"
         except Exception as e:
             return False, f"保存交易记录出错: {e}"
     
-    def get_user_transactions(self, username):
-        """获取用户交易记录"""
-        user_transactions_file = os.path.join(self.transactions_dir, f"{username}_transactions.json")
-        
-        if not os.path.exists(user_transactions_file):
-            return []
-        
+    def get_user_transactions(self, username, offset=0, limit=None, newest_first=False):
+        """
+        获取用户交易记录
+        :param offset: 跳过的记录数
+        :param limit: 最多返回的记录数，默认返回全部
+        :param newest_first: 为True时按时间倒序返回
+        """
         try:
-            with open(user_transactions_file, "r", encoding="utf-8") as f:
-                return json.load(f)
+            return self.journal.read(username, offset, limit, newest_first)
         except Exception as e:
             print(f"获取用户交易记录出错: {e}")
             return []
     
+    def count_user_transactions(self, username):
+        """统计用户交易记录条数"""
+        try:
+            return self.journal.count(username)
+        except Exception as e:
+            print(f"统计用户交易记录出错: {e}")
+            return 0
+    
+    def compact_transactions(self):
+        """整理所有用户的交易日志（合并旧版记录、清理残缺行）"""
+        try:
+            result = self.journal.compact_all()
+            return True, f"已整理 {len(result)} 个用户的交易日志，共 {sum(result.values())} 条记录"
+        except Exception as e:
+            return False, f"整理交易日志出错: {e}"
+    
     def execute_trade(self, username, transaction_type, stock_code, quantity):
         """执行交易"""
-        user = self.get_user(username)
+        return self.execute_trades([(username, transaction_type, stock_code, quantity)])[0]
+    
+    def execute_trades(self, orders):
+        """
+        批量执行交易，所有通过校验的交易只做一次预写日志fsync（组提交）
+        :param orders: (username, transaction_type, stock_code, quantity) 列表
+        :return: 与 orders 一一对应的 (是否成功, 信息) 列表
+        """
+        # 同时持有本批次涉及的所有用户的锁，读-改-写期间不会被其他交易插入
+        with self.user_locks.hold(*[order[0] for order in orders]):
+            return self._execute_trades_locked(orders)
+    
+    def _execute_trades_locked(self, orders):
+        """在持有用户锁的情况下执行一批交易"""
+        results = [None] * len(orders)
+        users = {}  # 同一批次内同一用户的交易基于前一笔的结果继续计算
+        entries = []
+        entry_indexes = []
+        
+        blocked = set()  # 有未应用的已提交交易且补做失败的用户
+        
+        for i, (username, transaction_type, stock_code, quantity) in enumerate(orders):
+            if username not in users and username not in blocked:
+                # 有未应用的已提交交易时用户缓存不是最新状态，先补做；补做不成功则拒绝该用户的新交易
+                if self._apply_unapplied(username):
+                    users[username] = self.get_user(username)
+                else:
+                    blocked.add(username)
+            if username in blocked:
+                results[i] = (False, "有未完成保存的交易，请稍后再试")
+                continue
+            success, result = self._prepare_trade(users[username], username, transaction_type,
+                                                  stock_code, quantity)
+            if success:
+                entries.append(result)
+                entry_indexes.append(i)
+            else:
+                results[i] = (False, result)
+        
+        if entries:
+            # 先写预写日志：fsync完成即视为交易已提交
+            try:
+                seqs = self.wal.commit(entries)
+            except Exception as e:
+                for i in entry_indexes:
+                    results[i] = (False, f"提交交易出错: {e}")
+                return results
+            
+            success, message = self._apply_with_retry(entries)
+            if success:
+                self.wal.mark_done(seqs)
+                message = "交易成功"
+            else:
+                # 交易已提交，在该用户的下一次交易或下次启动时补做；在此之前拒绝该用户的新交易
+                print(f"应用交易出错，将在稍后恢复: {message}")
+                for seq, entry in zip(seqs, entries):
+                    self._unapplied.setdefault(entry["username"], []).append((seq, entry))
+                message = "交易已提交，保存延迟，稍后生效"
+            for i in entry_indexes:
+                results[i] = (True, message)
+        
+        return results
+    
+    def _apply_with_retry(self, entries, replay=False):
+        """应用已提交的交易，失败时短暂等待后重试（重试按重放处理，已写入交易日志的记录不重复写）"""
+        for attempt in range(self.APPLY_RETRIES):
+            success, message = self._apply_trades(entries, replay=replay or attempt > 0)
+            if success:
+                return success, message
+            if attempt + 1 < self.APPLY_RETRIES:
+                time.sleep(0.05 * 2 ** attempt)
+        return success, message
+    
+    def _apply_unapplied(self, username):
+        """补做该用户未应用的已提交交易（调用方持有该用户的锁），返回该用户是否已没有未应用的交易"""
+        pending = self._unapplied.get(username)
+        if not pending:
+            return True
+        success, message = self._apply_with_retry([entry for _, entry in pending], replay=True)
+        if not success:
+            print(f"补做用户 {username} 的交易失败: {message}")
+            return False
+        self.wal.mark_done([seq for seq, _ in pending])
+        del self._unapplied[username]
+        return True
+    
+    def _prepare_trade(self, user, username, transaction_type, stock_code, quantity):
+        """
+        校验交易并在 user 上计算交易后的余额和持仓
+        :return: (True, 预写日志记录) 或 (False, 错误信息)
+        """
         stock = self.get_stock(stock_code)
         
         if not user:
@@ -293,19 +576,66 @@ class Database:
         else:
             return False, "交易类型无效"
         
-        # 更新用户信息
-        success, message = self.update_user(username, user)
-        if not success:
-            return False, message
-        
-        # 记录交易
-        success, message = self.record_transaction(
-            username, transaction_type, stock_code, stock["name"], price, quantity, amount
-        )
-        if not success:
-            return False, message
-        
-        return True, "交易成功"
+        # 预写日志记录交易后的绝对状态，重放时直接覆盖即可保证幂等
+        holding = user["holdings"].get(stock_code)
+        return True, {
+            "username": username,
+            "balance": user["balance"],
+            "stock_code": stock_code,
+            "holding": dict(holding) if holding else None,
+            "transaction": self._new_transaction(username, transaction_type, stock_code, stock["name"],
+                                                 price, quantity, amount)
+        }
+    
+    def _apply_trades(self, entries, replay=False):
+        """将已提交的交易写入用户存储和交易日志"""
+        try:
+            with self.cache_lock:
+                users = self._users()
+                self.storage.save_trades([
+                    (e["username"], e["balance"], e["stock_code"], e["holding"]) for e in entries
+                ])
+                # 同步更新用户缓存
+                for e in entries:
+                    user = users.get(e["username"])
+                    if user is None:
+                        continue
+                    user["balance"] = e["balance"]
+                    if e["holding"] is None:
+                        user["holdings"].pop(e["stock_code"], None)
+                    else:
+                        user["holdings"][e["stock_code"]] = dict(e["holding"])
+                self._after_user_write()
+            for e in entries:
+                transaction = e["transaction"]
+                if replay and self.journal.contains(e["username"], transaction["txn_id"]):
+                    continue
+                self.journal.append(e["username"], transaction)
+            # 交易日志落盘后才能标记预写日志记录已完成
+            self.journal.flush()
+            return True, "交易已保存"
+        except Exception as e:
+            return False, f"保存交易出错: {e}"
+    
+    def _recover_trades(self):
+        """重放预写日志中已提交但未完成的交易，跳过已被同一用户之后的交易取代的记录"""
+        pending, superseded = self.wal.recovery()
+        if superseded:
+            for e in superseded:
+                print(f"跳过已被后续交易取代的未完成记录: 用户 {e['username']} 序号 {e['seq']} {e['stock_code']}")
+            self.wal.mark_done([e["seq"] for e in superseded])
+        if not pending:
+            return
+        print(f"发现 {len(pending)} 笔未完成的交易，正在恢复...")
+        success, message = self._apply_trades(pending, replay=True)
+        if success:
+            self.wal.mark_done([e["seq"] for e in pending])
+            print("交易恢复完成")
+        else:
+            # 重放失败时这些用户的缓存不是最新状态，同样拒绝新交易直到补做成功
+            for e in pending:
+                self._unapplied.setdefault(e["username"], []).append((e["seq"], e))
+            print(f"交易恢复失败: {message}")
 
 # 创建数据库实例
 db = Database() 
\ No newline at end of file
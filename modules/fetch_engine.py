@@ -0,0 +1,133 @@
+import time
+import random
+import threading
+
+import numpy as np
+
+from .config import get_config
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class RateLimiter:
+    """令牌桶限流器：平均每秒 rate 次，允许 burst 次突发"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，令牌不足时阻塞等待"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchReport:
+    """一批并发获取（经请求网关）的结果：成功结果、异常、每项耗时和总耗时"""
+
+    def __init__(self, results, errors, latencies, wall_time):
+        self.results = results
+        self.errors = errors
+        self.latencies = latencies
+        self.wall_time = wall_time
+
+    def percentile(self, q):
+        """单项耗时的百分位数（秒）"""
+        if not self.latencies:
+            return 0.0
+        return float(np.percentile(list(self.latencies.values()), q))
+
+    def summary(self):
+        return (f"共 {len(self.latencies)} 项，成功 {len(self.results)}，失败 {len(self.errors)}，"
+                f"总耗时 {self.wall_time:.2f}s，单项耗时 p50={self.percentile(50) * 1000:.0f}ms "
+                f"p90={self.percentile(90) * 1000:.0f}ms p99={self.percentile(99) * 1000:.0f}ms")
+
+
+class FetchEngine:
+    """
+    上游调用引擎：按上游分别限流和重试，并发数由请求网关控制
+
+    上游配置来自 fetch_upstreams，未单独配置的上游使用 "default" 项。
+    每个上游的每个接口（如 eastmoney 的 stock_zh_a_hist）有各自的熔断器，一个接口故障不影响其他接口。
+    """
+
+    def __init__(self, upstreams=None):
+        self.upstreams = upstreams or {"default": {}}
+        self._limiters = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def _settings(self, upstream):
+        settings = dict(self.upstreams.get("default", {}))
+        settings.update(self.upstreams.get(upstream, {}))
+        return settings
+
+    def _limiter(self, upstream):
+        with self._lock:
+            limiter = self._limiters.get(upstream)
+            if limiter is None:
+                settings = self._settings(upstream)
+                limiter = self._limiters[upstream] = RateLimiter(settings.get("rate", 0), settings.get("burst"))
+            return limiter
+
+    def breaker(self, upstream, endpoint):
+        """上游某个接口的熔断器"""
+        key = f"{upstream}.{endpoint}"
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                settings = self._settings(upstream)
+                breaker = self._breakers[key] = CircuitBreaker(
+                    key, settings.get("breaker_failures", 5), settings.get("breaker_reset", 30))
+            return breaker
+
+    def breaker_stats(self):
+        """各接口熔断器的状态 {上游.接口: {"state", "trips", "rejected"}}"""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {key: breaker.stats() for key, breaker in breakers.items()}
+
+    def call(self, upstream, func, *args, **kwargs):
+        """
+        限流后调用 func，失败时按指数退避（带随机抖动）重试，重试用尽后抛出最后一次的异常
+
+        重试用尽算作该接口熔断器的一次失败；熔断器断开时直接抛出 CircuitOpenError，不限流等待也不重试。
+        """
+        settings = self._settings(upstream)
+        retries = settings.get("retries", 0)
+        backoff = settings.get("backoff", 0.5)
+        limiter = self._limiter(upstream)
+        breaker = self.breaker(upstream, getattr(func, "__name__", "call"))
+        if not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} 已熔断")
+        for attempt in range(retries + 1):
+            limiter.acquire()
+            try:
+                result = func(*args, **kwargs)
+                breaker.record_success()
+                return result
+            except Exception as e:
+                if attempt >= retries:
+                    breaker.record_failure()
+                    raise
+                delay = backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"获取引擎: {upstream} 调用失败 ({e})，{delay:.2f}s 后第 {attempt + 1} 次重试")
+                time.sleep(delay)
+
+
+def create_fetch_engine():
+    """按系统配置创建获取引擎"""
+    config = get_config()
+    return FetchEngine(config["fetch_upstreams"])
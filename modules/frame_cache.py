@@ -0,0 +1,86 @@
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from .bar_cache import is_trading_time, next_session_open
+
+
+class DataFrameLRU:
+    """
+    按 DataFrame 占用字节数限制总大小的 LRU 缓存
+
+    盘中写入的条目使用较短的 trading_ttl；盘后写入的条目使用 ttl，但最晚在下一个交易时段开始时过期，
+    开盘后不会继续返回缺少当天行情的数据。
+    存入和取出时都会复制 DataFrame，调用方可以随意修改拿到的数据。
+    """
+
+    def __init__(self, max_bytes, ttl=3600, trading_ttl=60):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.trading_ttl = trading_ttl
+        self._entries = OrderedDict()  # key -> (df, size, expires_at)
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def get(self, key):
+        """命中时返回数据副本，未命中或已过期返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0].copy()
+
+    def put(self, key, df):
+        """写入一份数据副本，超出字节上限时从最久未使用的条目开始淘汰"""
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        now = datetime.now()
+        if is_trading_time(now):
+            ttl = self.trading_ttl
+        else:
+            ttl = min(self.ttl, (next_session_open(now) - now).total_seconds())
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (df.copy(), size, time.monotonic() + ttl)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """命中率、淘汰次数和当前占用，用于调整容量和有效期"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+            }
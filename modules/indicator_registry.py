@@ -0,0 +1,251 @@
+import math
+
+import numpy as np
+
+from .indicators import (DEFAULT_THRESHOLDS, shift, pct_change, rolling_mean, rolling_std, rolling_max,
+                         rolling_min, ema, recursive_mean, combine_signals, classify_rsi, classify_volume, classify_volatility)
+
+# 推荐引擎默认使用的指标（即最初的五项信号），与 DEFAULT_WEIGHTS 的键一致
+DEFAULT_INDICATORS = ('ma_signal', 'rsi_signal', 'volume_signal', 'price_momentum', 'volatility_signal')
+
+
+class Indicator:
+    """
+    一项已登记的指标：compute(ctx) 返回与面板同形状、取值在 [-1, 1] 的信号数组
+
+    lookback 是得到有效信号至少需要的K线数量，K线不足的位置信号为0，数据层也按它决定获取多少历史数据。
+    """
+
+    def __init__(self, name, compute, lookback, fields, label, reasons, weight):
+        self.name = name
+        self.compute = compute
+        self.lookback = lookback
+        self.fields = fields
+        self.label = label
+        self.reasons = reasons  # (信号为正时的理由, 信号为负时的理由, 给出理由的最小绝对值)
+        self.weight = weight    # 未做权重优化时的默认权重
+
+
+# 指标登记表 {名称: Indicator}，按登记顺序排列
+INDICATORS = {}
+
+
+def register_indicator(name, lookback, fields=("close",), label=None, reasons=None, weight=0.1):
+    """登记指标的装饰器，被装饰的函数接收 IndicatorContext，返回信号数组"""
+    def decorator(compute):
+        INDICATORS[name] = Indicator(name, compute, lookback, tuple(fields), label or name, reasons, weight)
+        return compute
+    return decorator
+
+
+def _window(func):
+    return lambda ctx, source, window: func(ctx.get(source), window)
+
+
+# IndicatorContext.get 支持的中间量运算：键为 (运算名, 参数...)
+OPERATIONS = {
+    "shift": lambda ctx, source, periods: shift(ctx.get(source), periods),
+    "diff": lambda ctx, source: ctx.get(source) - ctx.get(("shift", source, 1)),
+    "pct_change": lambda ctx, source, periods: pct_change(ctx.get(source), periods),
+    "mean": _window(rolling_mean),
+    "std": _window(rolling_std),
+    "max": _window(rolling_max),
+    "min": _window(rolling_min),
+    "ema": lambda ctx, source, span: ema(ctx.get(source), span),
+    "gain": lambda ctx, source: np.where(ctx.get(source) > 0, ctx.get(source), 0.0),
+    "loss": lambda ctx, source: np.where(ctx.get(source) < 0, -ctx.get(source), 0.0),
+}
+
+
+class IndicatorContext:
+    """
+    一次指标计算的上下文：按键缓存中间量，多个指标用到同一个中间量（如1日涨跌幅、20日均线）时只计算一次
+
+    键是面板字段名（"close"、"volume"……）或 (运算名, 参数...) 元组，例如 ("mean", "close", 20)、
+    ("std", ("pct_change", "close", 1), 10)。
+    """
+
+    def __init__(self, panel, thresholds=DEFAULT_THRESHOLDS):
+        self.panel = panel
+        self.thresholds = thresholds
+        self.counts = panel.counts
+        self._cache = {}
+        self.computed = 0  # 实际计算的中间量个数
+        self.reused = 0    # 命中缓存的次数
+
+    def get(self, key):
+        value = self._cache.get(key)
+        if value is not None:
+            self.reused += 1
+            return value
+        if isinstance(key, str):
+            if key in self.panel.fields:
+                value = self.panel[key]
+            else:
+                value = np.full(self.counts.shape, np.nan)
+        else:
+            operation, *args = key
+            value = OPERATIONS[operation](self, *args)
+        self.computed += 1
+        self._cache[key] = value
+        return value
+
+
+def required_fields(names):
+    """计算这些指标需要的面板字段（按出现顺序去重）"""
+    fields = []
+    for name in names:
+        for field in INDICATORS[name].fields:
+            if field not in fields:
+                fields.append(field)
+    return tuple(fields)
+
+
+def required_bars(names):
+    return max((INDICATORS[name].lookback for name in names), default=0)
+
+
+def history_days(names):
+    """得到这些指标的有效信号需要获取的自然日天数（每周5个交易日，另留2天余量）"""
+    return math.ceil(required_bars(names) * 7 / 5) + 2
+
+
+def compute_indicators(panel, names=DEFAULT_INDICATORS, thresholds=DEFAULT_THRESHOLDS):
+    """
+    计算选定指标在面板所有位置上的信号，共用的中间量只计算一次
+    :return: {名称: 信号数组}，按 names 的顺序
+    """
+    ctx = IndicatorContext(panel, thresholds)
+    signals = {}
+    for name in names:
+        indicator = INDICATORS[name]
+        signal = np.nan_to_num(np.asarray(indicator.compute(ctx), dtype=np.float64), nan=0.0)
+        signal[ctx.counts < indicator.lookback] = 0
+        signals[name] = signal
+    return signals
+
+
+def describe_signals(signals):
+    """根据单只股票的信号生成推荐理由，理由的顺序与 signals 相同"""
+    reasons = []
+    for name, value in signals.items():
+        indicator = INDICATORS.get(name)
+        if indicator is None or indicator.reasons is None:
+            continue
+        positive, negative, cutoff = indicator.reasons
+        if abs(value) > cutoff:
+            reasons.append(positive if value > 0 else negative)
+    return ", ".join(reasons) if reasons else "综合技术指标分析"
+
+
+def score_panel(panel, weights, thresholds=DEFAULT_THRESHOLDS):
+    """
+    按每只股票最新一根K线上的信号打分，使用 weights 中的全部指标
+    :return: [(上涨概率, 推荐理由)]，顺序与 panel.codes 相同
+    """
+    latest = {name: values[-1] for name, values in compute_indicators(panel, list(weights), thresholds).items()}
+    probabilities = combine_signals(latest, weights)
+    return [(probabilities[col], describe_signals({name: values[col] for name, values in latest.items()}))
+            for col in range(len(panel.codes))]
+
+
+# ---- 原有的五项信号（规则与 StockRecommendationEngine.calculate_* 相同） ----
+
+@register_indicator("ma_signal", lookback=20, label="均线", reasons=("均线看涨", "均线看跌", 0.5), weight=0.25)
+def _ma_signal(ctx):
+    close, ma5, ma20 = ctx.get("close"), ctx.get(("mean", "close", 5)), ctx.get(("mean", "close", 20))
+    return np.select([(close > ma5) & (ma5 > ma20), close > ma5, (close < ma5) & (ma5 < ma20), close < ma5],
+                     [0.8, 0.6, -0.8, -0.6], 0.0)
+
+
+@register_indicator("rsi_signal", lookback=15, label="RSI", reasons=("RSI超卖", "RSI超买", 0.5), weight=0.20)
+def _rsi_signal(ctx):
+    delta = ("diff", "close")
+    gain, loss = ctx.get(("mean", ("gain", delta), 14)), ctx.get(("mean", ("loss", delta), 14))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = 100 - (100 / (1 + gain / loss))
+    return classify_rsi(values, ctx.counts, ctx.thresholds)
+
+
+@register_indicator("volume_signal", lookback=10, fields=("close", "volume"), label="成交量",
+                    reasons=("成交量放大", "成交量萎缩", 0.4), weight=0.15)
+def _volume_signal(ctx):
+    volume_ma = ctx.get(("mean", "volume", 10))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        volume_ratio = ctx.get("volume") / volume_ma
+    # 只用到涨跌方向，与波动率共用1日涨跌幅
+    return classify_volume(volume_ratio, ctx.get(("pct_change", "close", 1)), volume_ma, ctx.counts, ctx.thresholds)
+
+
+@register_indicator("price_momentum", lookback=6, label="价格动量", weight=0.25)
+def _price_momentum(ctx):
+    return np.clip((ctx.get(("pct_change", "close", 3)) * 0.6 + ctx.get(("pct_change", "close", 5)) * 0.4) * 10, -1, 1)
+
+
+@register_indicator("volatility_signal", lookback=11, label="波动率", weight=0.15)
+def _volatility_signal(ctx):
+    return classify_volatility(ctx.get(("std", ("pct_change", "close", 1), 10)), ctx.counts - 1, ctx.thresholds)
+
+
+# ---- 可选指标 ----
+
+@register_indicator("macd_signal", lookback=35, label="MACD(12,26,9)", reasons=("MACD金叉", "MACD死叉", 0.7))
+def _macd_signal(ctx):
+    dif = ctx.get(("ema", "close", 12)) - ctx.get(("ema", "close", 26))
+    dea = ema(dif, 9)
+    hist = 2 * (dif - dea)
+    prev = shift(hist, 1)
+    return np.select([(hist > 0) & (prev <= 0), (hist < 0) & (prev >= 0), hist > 0, hist < 0],
+                     [0.8, -0.8, 0.4, -0.4], 0.0)
+
+
+@register_indicator("boll_signal", lookback=20, label="布林带(20,2)", reasons=("跌破布林下轨", "突破布林上轨", 0.5))
+def _boll_signal(ctx):
+    close, middle, std = ctx.get("close"), ctx.get(("mean", "close", 20)), ctx.get(("std", "close", 20))
+    upper, lower = middle + 2 * std, middle - 2 * std
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent_b = (close - lower) / (upper - lower)
+    # 价格偏离到轨道外视为超卖/超买，均值回归
+    return np.select([close < lower, close > upper, percent_b < 0.2, percent_b > 0.8], [0.6, -0.6, 0.3, -0.3], 0.0)
+
+
+@register_indicator("kdj_signal", lookback=12, fields=("close", "high", "low"), label="KDJ(9,3,3)",
+                    reasons=("KDJ超卖", "KDJ超买", 0.5))
+def _kdj_signal(ctx):
+    close, highest, lowest = ctx.get("close"), ctx.get(("max", "high", 9)), ctx.get(("min", "low", 9))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsv = np.where(highest > lowest, (close - lowest) / (highest - lowest) * 100, 50.0)
+    rsv[np.isnan(highest) | np.isnan(lowest)] = np.nan
+    k = recursive_mean(rsv, 1 / 3, initial=50)
+    d = recursive_mean(k, 1 / 3, initial=50)
+    j = 3 * k - 2 * d
+    prev_k, prev_d = shift(k, 1), shift(d, 1)
+    golden = (k > d) & (prev_k <= prev_d) & (k < 50)
+    dead = (k < d) & (prev_k >= prev_d) & (k > 50)
+    return np.select([j < 0, j > 100, golden, dead], [0.7, -0.7, 0.4, -0.4], 0.0)
+
+
+@register_indicator("atr_signal", lookback=15, fields=("close", "high", "low"), label="ATR(14)突破",
+                    reasons=("向上突破", "向下突破", 0.4))
+def _atr_signal(ctx):
+    prev_close = ctx.get(("shift", "close", 1))
+    high, low = ctx.get("high"), ctx.get("low")
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    true_range[np.isnan(high - low) | np.isnan(prev_close)] = np.nan
+    atr = rolling_mean(true_range, 14)
+    change = ctx.get(("diff", "close"))
+    # 单日涨跌超过一个ATR视为突破
+    return np.select([change > atr, change < -atr], [0.5, -0.5], 0.0)
+
+
+@register_indicator("obv_signal", lookback=11, fields=("close", "volume"), label="OBV能量潮",
+                    reasons=("资金流入", "资金流出", 0.35))
+def _obv_signal(ctx):
+    direction = np.sign(np.nan_to_num(ctx.get(("diff", "close"))))
+    obv = np.cumsum(direction * np.nan_to_num(ctx.get("volume")), axis=0)
+    obv_change = obv - shift(obv, 10)
+    price_change = ctx.get(("pct_change", "close", 10))
+    # 量价同向为趋势确认，背离时按成交量方向给较弱的信号
+    return np.select([(obv_change > 0) & (price_change > 0), (obv_change < 0) & (price_change < 0),
+                      (obv_change > 0) & (price_change < 0), (obv_change < 0) & (price_change > 0)],
+                     [0.4, -0.4, 0.3, -0.3], 0.0)
@@ -0,0 +1,256 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 各项信号的默认权重（即最初手工设定的权重），权重优化结果可以覆盖
+DEFAULT_WEIGHTS = {
+    'ma_signal': 0.25,    # 移动平均线信号
+    'rsi_signal': 0.20,   # RSI信号
+    'volume_signal': 0.15, # 成交量信号
+    'price_momentum': 0.25, # 价格动量
+    'volatility_signal': 0.15  # 波动率信号
+}
+
+# 信号阈值的默认值（即最初手工设定的规则），权重优化结果可以覆盖
+DEFAULT_THRESHOLDS = {
+    'rsi_oversold': 30,       # RSI 低于此值为超卖
+    'rsi_overbought': 70,     # RSI 高于此值为超买
+    'volume_surge': 1.5,      # 量比（当日成交量 / 10日均量）高于此值为放量
+    'volume_shrink': 0.8,     # 量比低于此值为缩量
+    'volatility_high': 0.05,  # 10日波动率高于此值为高波动
+    'volatility_low': 0.02,   # 10日波动率低于此值为低波动
+}
+
+
+class BarPanel:
+    """
+    多只股票K线的二维面板（行 = 第几根K线，列 = 股票）
+
+    各股票按最后一根K线对齐：最后一行是每只股票的最新K线，K线较少的股票上方用 NaN 填充。
+    按K线序号而不是按日期对齐，与逐只分析时每只股票使用自己连续K线的结果一致。
+    """
+
+    def __init__(self, frames, fields=("close", "volume")):
+        """
+        :param frames: {code: DataFrame}，每个 DataFrame 按日期升序且非空
+        :param fields: 需要放入面板的列，DataFrame 缺少的列整列为 NaN
+        """
+        lengths = np.array([len(df) for df in frames.values()], dtype=np.int64)
+        height = int(lengths.max()) if len(lengths) else 0
+        arrays = {}
+        for field in fields:
+            panel = np.full((height, len(frames)), np.nan)
+            for col, df in enumerate(frames.values()):
+                if field in df.columns:
+                    panel[height - len(df):, col] = df[field].to_numpy(dtype=np.float64)
+            arrays[field] = panel
+        self._set(list(frames.keys()), arrays, lengths)
+
+    @classmethod
+    def from_arrays(cls, codes, arrays, lengths):
+        """用已经对齐好的二维数组构造面板（例如从共享内存映射出的数组），不复制数据"""
+        panel = cls.__new__(cls)
+        panel._set(list(codes), arrays, np.asarray(lengths, dtype=np.int64))
+        return panel
+
+    def _set(self, codes, arrays, lengths):
+        self.codes = codes
+        self.fields = arrays
+        self.lengths = lengths
+        height = next(iter(arrays.values())).shape[0] if arrays else 0
+        # counts[t, j]：第 j 只股票截至第 t 行已有的K线数量
+        rows = np.arange(1, height + 1)[:, None]
+        self.counts = np.maximum(rows - (height - self.lengths)[None, :], 0)
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+
+def shift(x, periods):
+    """沿时间轴向下平移，空出的位置为 NaN（同 Series.shift）"""
+    out = np.full(x.shape, np.nan)
+    if periods < len(x):
+        out[periods:] = x[:len(x) - periods]
+    return out
+
+
+def pct_change(x, periods=1):
+    """同 Series.pct_change(periods)，不填充缺失值"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return x / shift(x, periods) - 1
+
+
+def rolling_mean(x, window):
+    """同 Series.rolling(window).mean()，窗口内有 NaN 时结果为 NaN"""
+    out = np.full(x.shape, np.nan)
+    if len(x) < window:
+        return out
+    windows = sliding_window_view(x, window, axis=0)
+    mean = windows.mean(axis=-1)
+    # pandas 在窗口内数值全部相同时直接返回该值，避免求和带来的舍入误差
+    same = windows.max(axis=-1) == windows.min(axis=-1)
+    out[window - 1:] = np.where(same, windows[..., -1], mean)
+    return out
+
+
+def rolling_std(x, window):
+    """同 Series.rolling(window).std()（ddof=1），窗口内数值全部相同时为 0"""
+    out = np.full(x.shape, np.nan)
+    if len(x) < window:
+        return out
+    windows = sliding_window_view(x, window, axis=0)
+    var = windows.var(axis=-1, ddof=1)
+    same = windows.max(axis=-1) == windows.min(axis=-1)
+    out[window - 1:] = np.sqrt(np.where(same, 0.0, np.maximum(var, 0.0)))
+    return out
+
+
+def rolling_max(x, window):
+    """同 Series.rolling(window).max()，窗口内有 NaN 时结果为 NaN"""
+    out = np.full(x.shape, np.nan)
+    if len(x) >= window:
+        out[window - 1:] = sliding_window_view(x, window, axis=0).max(axis=-1)
+    return out
+
+
+def rolling_min(x, window):
+    """同 Series.rolling(window).min()，窗口内有 NaN 时结果为 NaN"""
+    out = np.full(x.shape, np.nan)
+    if len(x) >= window:
+        out[window - 1:] = sliding_window_view(x, window, axis=0).min(axis=-1)
+    return out
+
+
+def recursive_mean(x, alpha, initial=None):
+    """
+    递推平均 y = y_prev + alpha * (x - y_prev)，沿时间轴逐行计算、各股票同时计算
+
+    从每只股票第一个有效值开始：initial 为 None 时以该值为初值（即 EMA），否则以 initial 为初值（KDJ 的 K、D）。
+    中间的缺失值保持上一个结果。
+    """
+    out = np.full(x.shape, np.nan)
+    prev = np.full(x.shape[1:], np.nan)
+    for t in range(len(x)):
+        value = x[t]
+        start = initial if initial is not None else value
+        base = np.where(np.isnan(prev), start, prev)
+        prev = np.where(np.isnan(value), prev, base + alpha * (value - base))
+        out[t] = prev
+    return out
+
+
+def ema(x, span):
+    """指数移动平均，同 Series.ewm(span=span, adjust=False, ignore_na=True).mean()"""
+    return recursive_mean(x, 2 / (span + 1))
+
+
+def ma_signal(close, counts):
+    """均线信号：与 StockRecommendationEngine.calculate_ma_signal 相同"""
+    ma5 = rolling_mean(close, 5)
+    ma20 = rolling_mean(close, 20)
+    signal = np.select(
+        [(close > ma5) & (ma5 > ma20), close > ma5, (close < ma5) & (ma5 < ma20), close < ma5],
+        [0.8, 0.6, -0.8, -0.6], 0.0)
+    signal[counts < 20] = 0
+    return signal
+
+
+def rsi(close, window=14):
+    """RSI 指标序列"""
+    delta = close - shift(close, 1)
+    gain = rolling_mean(np.where(delta > 0, delta, 0.0), window)
+    loss = rolling_mean(np.where(delta < 0, -delta, 0.0), window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 100 - (100 / (1 + gain / loss))
+
+
+def rsi_signal(close, counts, thresholds=DEFAULT_THRESHOLDS):
+    """RSI信号：与 calculate_rsi_signal 相同"""
+    return classify_rsi(rsi(close), counts, thresholds)
+
+
+def classify_rsi(values, counts, thresholds=DEFAULT_THRESHOLDS):
+    """按超买/超卖阈值把 RSI 值转换为信号"""
+    signal = np.select([values < thresholds['rsi_oversold'], values > thresholds['rsi_overbought'], values < 50],
+                       [0.7, -0.7, 0.3], -0.3)
+    signal[np.isnan(values) | (counts < 15)] = 0
+    return signal
+
+
+def volume_features(close, volume):
+    """成交量信号的原始量：(量比, 当日涨跌幅, 10日均量)"""
+    volume_ma = rolling_mean(volume, 10)
+    prev_close = shift(close, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        volume_ratio = volume / volume_ma
+        price_change = (close - prev_close) / prev_close
+    return volume_ratio, price_change, volume_ma
+
+
+def volume_signal(close, volume, counts, thresholds=DEFAULT_THRESHOLDS):
+    """成交量信号：与 calculate_volume_signal 相同"""
+    return classify_volume(*volume_features(close, volume), counts, thresholds)
+
+
+def classify_volume(volume_ratio, price_change, volume_ma, counts, thresholds=DEFAULT_THRESHOLDS):
+    """按放量/缩量阈值把量比和涨跌幅转换为信号"""
+    surge = volume_ratio > thresholds['volume_surge']
+    signal = np.select(
+        [surge & (price_change > 0), surge & (price_change < 0), volume_ratio < thresholds['volume_shrink']],
+        [0.6, -0.6, -0.2], 0.0)
+    signal[np.isnan(volume_ma) | (volume_ma == 0) | (counts < 10)] = 0
+    return signal
+
+
+def price_momentum(close, counts):
+    """价格动量信号：与 calculate_price_momentum 相同"""
+    return_3d = pct_change(close, 3)
+    return_5d = pct_change(close, 5)
+    signal = np.clip((return_3d * 0.6 + return_5d * 0.4) * 10, -1, 1)
+    signal[np.isnan(return_3d) | np.isnan(return_5d) | (counts < 5)] = 0
+    return signal
+
+
+def volatility(close):
+    """10日收益率标准差"""
+    return rolling_std(pct_change(close, 1), 10)
+
+
+def volatility_signal(close, counts, thresholds=DEFAULT_THRESHOLDS):
+    """波动率信号：与 calculate_volatility_signal 相同"""
+    return classify_volatility(volatility(close), counts, thresholds)
+
+
+def classify_volatility(values, counts, thresholds=DEFAULT_THRESHOLDS):
+    """按高/低波动阈值把波动率转换为信号"""
+    signal = np.select([values > thresholds['volatility_high'], values < thresholds['volatility_low']],
+                       [-0.4, 0.2], 0.1)
+    signal[np.isnan(values) | (counts < 10)] = 0
+    return signal
+
+
+def compute_signals(panel, thresholds=DEFAULT_THRESHOLDS):
+    """
+    一次计算面板中所有股票、所有时间点的五项信号
+    :return: {信号名称: 与面板同形状的数组}，信号名称与推荐引擎的权重键一致
+    """
+    close, volume, counts = panel["close"], panel["volume"], panel.counts
+    return {
+        'ma_signal': ma_signal(close, counts),
+        'rsi_signal': rsi_signal(close, counts, thresholds),
+        'volume_signal': volume_signal(close, volume, counts, thresholds),
+        'price_momentum': price_momentum(close, counts),
+        'volatility_signal': volatility_signal(close, counts, thresholds),
+    }
+
+
+def combine_signals(signals, weights):
+    """
+    按权重合成综合得分并转换为上涨概率（0-100），标量和数组都适用
+    :param weights: {信号名称: 权重}，只合成其中列出的信号
+    """
+    total_score = 0
+    for name, weight in weights.items():
+        total_score = total_score + signals[name] * weight
+    # 转换为概率（-1到1转换为0%到100%）
+    probability = (total_score + 1) * 50
+    return np.clip(probability, 0, 100)
@@ -0,0 +1,225 @@
+import os
+import json
+import atexit
+import threading
+from itertools import islice
+
+
+class TransactionJournal:
+    """
+    按用户划分的只追加交易日志（JSON Lines 格式）
+
+    每笔交易只追加一行，不再读出并重写整个交易列表；
+    旧版的 {username}_transactions.json 仍可读取，执行整理(compact)后合并进日志。
+    """
+
+    def __init__(self, transactions_dir, fsync_every=0):
+        """
+        :param transactions_dir: 交易日志目录
+        :param fsync_every: 每追加多少条记录执行一次fsync，0表示只在flush/退出时fsync
+        """
+        self.transactions_dir = transactions_dir
+        self.fsync_every = fsync_every
+        self.lock = threading.RLock()
+        self._fds = {}        # username -> 追加写入的文件描述符
+        self._pending = {}    # username -> 尚未fsync的记录数
+        self._counts = {}     # username -> (文件inode, 已统计到的字节位置, 有效记录数)
+        atexit.register(self.close)
+
+    def journal_file(self, username):
+        """交易日志文件路径"""
+        return os.path.join(self.transactions_dir, f"{username}_transactions.jsonl")
+
+    def legacy_file(self, username):
+        """旧版整文件JSON交易记录路径"""
+        return os.path.join(self.transactions_dir, f"{username}_transactions.json")
+
+    def _get_fd(self, username):
+        fd = self._fds.get(username)
+        if fd is None:
+            path = self.journal_file(username)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            # 上次写入中断留下的半行，补一个换行使其成为独立的坏行，读取时跳过
+            size = os.fstat(fd).st_size
+            if size > 0:
+                with open(path, "rb") as f:
+                    f.seek(size - 1)
+                    if f.read(1) != b"\n":
+                        os.write(fd, b"\n")
+            self._fds[username] = fd
+        return fd
+
+    def append(self, username, record):
+        """追加一条交易记录，整行通过一次write写入"""
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self.lock:
+            fd = self._get_fd(username)
+            os.write(fd, line)
+            self._pending[username] = self._pending.get(username, 0) + 1
+            if self.fsync_every and self._pending[username] >= self.fsync_every:
+                os.fsync(fd)
+                self._pending[username] = 0
+
+    def flush(self):
+        """将所有未fsync的记录刷到磁盘"""
+        with self.lock:
+            for username, count in list(self._pending.items()):
+                if count:
+                    os.fsync(self._fds[username])
+                    self._pending[username] = 0
+
+    def _close_fd(self, username):
+        fd = self._fds.pop(username, None)
+        if fd is not None:
+            if self._pending.pop(username, 0):
+                os.fsync(fd)
+            os.close(fd)
+
+    def close(self):
+        """关闭所有日志文件"""
+        with self.lock:
+            for username in list(self._fds):
+                self._close_fd(username)
+
+    def _read_legacy(self, username):
+        path = self.legacy_file(username)
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取旧版交易记录出错 ({path}): {e}")
+            return []
+
+    @staticmethod
+    def _parse_line(line):
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            # 写入中断产生的残缺行
+            return None
+
+    def _iter_forward(self, username):
+        """按时间顺序遍历交易记录"""
+        yield from self._read_legacy(username)
+        path = self.journal_file(username)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    record = self._parse_line(line)
+                    if record is not None:
+                        yield record
+
+    def _iter_backward(self, username, block_size=64 * 1024):
+        """从文件末尾按块向前读取，按时间倒序遍历交易记录"""
+        path = self.journal_file(username)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                position = f.tell()
+                tail = b""
+                while position > 0:
+                    read_size = min(block_size, position)
+                    position -= read_size
+                    f.seek(position)
+                    chunk = f.read(read_size) + tail
+                    lines = chunk.split(b"\n")
+                    # 第一段可能是不完整的行，留到下一块拼接
+                    tail = lines.pop(0)
+                    for line in reversed(lines):
+                        record = self._parse_line(line)
+                        if record is not None:
+                            yield record
+                record = self._parse_line(tail)
+                if record is not None:
+                    yield record
+        yield from reversed(self._read_legacy(username))
+
+    def read(self, username, offset=0, limit=None, newest_first=False):
+        """
+        分页读取交易记录
+        :param offset: 跳过的记录数
+        :param limit: 最多返回的记录数，None表示全部
+        :param newest_first: 为True时从最新的记录开始
+        :return: 交易记录列表
+        """
+        with self.lock:
+            records = self._iter_backward(username) if newest_first else self._iter_forward(username)
+            stop = offset + limit if limit is not None else None
+            return list(islice(records, offset, stop))
+
+    def contains(self, username, txn_id, depth=1000):
+        """在最近 depth 条记录中查找指定交易编号，用于预写日志重放时去重"""
+        with self.lock:
+            for record in islice(self._iter_backward(username), depth):
+                if record.get("txn_id") == txn_id:
+                    return True
+            return False
+
+    def count(self, username):
+        """
+        统计交易记录条数，与 read 读到的记录一致：跳过残缺行，末尾没有换行的半行不计入
+        已统计过的部分按字节位置缓存，之后只解析新追加的完整行
+        """
+        with self.lock:
+            total = len(self._read_legacy(username))
+            path = self.journal_file(username)
+            if not os.path.exists(path):
+                self._counts.pop(username, None)
+                return total
+            with open(path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                inode, position, count = self._counts.get(username, (stat.st_ino, 0, 0))
+                if inode != stat.st_ino or stat.st_size < position:
+                    position, count = 0, 0  # 文件被整理或替换过，重新统计
+                f.seek(position)
+                buffer = b""  # 跨块的行拼接完整后再统计
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    buffer += chunk
+                    end = buffer.rfind(b"\n") + 1
+                    if end:
+                        count += sum(1 for line in buffer[:end].split(b"\n") if self._parse_line(line) is not None)
+                        position += end
+                        buffer = buffer[end:]
+            self._counts[username] = (stat.st_ino, position, count)
+            return total + count
+
+    def compact(self, username):
+        """
+        整理单个用户的交易日志：合并旧版JSON记录、去掉残缺行，
+        写入临时文件后原子替换
+        :return: 整理后的记录数
+        """
+        with self.lock:
+            self._close_fd(username)
+            self._counts.pop(username, None)
+            records = list(self._iter_forward(username))
+            path = self.journal_file(username)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                for record in records:
+                    f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            legacy = self.legacy_file(username)
+            if os.path.exists(legacy):
+                os.remove(legacy)
+            return len(records)
+
+    def usernames(self):
+        """日志目录中有交易记录的用户"""
+        names = set()
+        for filename in os.listdir(self.transactions_dir):
+            for suffix in ("_transactions.jsonl", "_transactions.json"):
+                if filename.endswith(suffix):
+                    names.add(filename[:-len(suffix)])
+        return sorted(names)
+
+    def compact_all(self):
+        """整理所有用户的交易日志，返回 {username: 记录数}"""
+        return {username: self.compact(username) for username in self.usernames()}
@@ -0,0 +1,115 @@
+import time
+import threading
+from contextlib import contextmanager
+
+
+class LockStats:
+    """记录各类锁的等待次数和等待时间，用于排查锁竞争"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, wait_seconds):
+        with self._lock:
+            stat = self._stats.setdefault(name, {"count": 0, "total_wait": 0.0, "max_wait": 0.0})
+            stat["count"] += 1
+            stat["total_wait"] += wait_seconds
+            stat["max_wait"] = max(stat["max_wait"], wait_seconds)
+
+    def snapshot(self):
+        """返回 {锁名称: {count, total_wait, avg_wait, max_wait}}，时间单位为秒"""
+        with self._lock:
+            result = {}
+            for name, stat in self._stats.items():
+                result[name] = dict(stat, avg_wait=stat["total_wait"] / stat["count"] if stat["count"] else 0.0)
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class RWLock:
+    """
+    读写锁：允许多个读者并发，写者独占；有写者等待时新读者排队，避免写者饿死
+    """
+
+    def __init__(self, name="rw", stats=None):
+        self.name = name
+        self.stats = stats
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def _record(self, kind, start):
+        if self.stats is not None:
+            self.stats.record(f"{self.name}.{kind}", time.perf_counter() - start)
+
+    @contextmanager
+    def read_lock(self):
+        start = time.perf_counter()
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        self._record("read", start)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write_lock(self):
+        start = time.perf_counter()
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        self._record("write", start)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class KeyedLocks:
+    """按键（如用户名）划分的互斥锁集合"""
+
+    def __init__(self, name="key", stats=None):
+        self.name = name
+        self.stats = stats
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    def _get(self, key):
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.RLock()
+            return lock
+
+    @contextmanager
+    def hold(self, *keys):
+        """
+        同时持有多个键的锁，按排序后的顺序加锁以避免死锁
+        """
+        locks = [self._get(key) for key in sorted(set(keys))]
+        start = time.perf_counter()
+        for lock in locks:
+            lock.acquire()
+        if self.stats is not None:
+            self.stats.record(self.name, time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
@@ -4,10 +4,11 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import pandas as pd
 import threading
-import time
 from datetime import datetime, timedelta
 from .stock_data import stock_manager
 from .database import db
+from .market_gateway import gateway, poll, PRIORITY_CHART, PRIORITY_QUOTES
+from .config import get_config
 import ttkbootstrap as tb
 from ttkbootstrap import Style  # 显式导入Style
 import mplfinance as mpf
@@ -36,6 +37,14 @@ class MarketFrame(tb.Frame):  # 使用ttkbootstrap美化界面
         self.current_stock_name = None # 用于存储当前选中的股票名称
         self.current_chart_period = "daily" #新增：追踪当前图表周期，默认为日线
         self.current_chart_df = None # 新增：用于存储当前图表的数据
+        self.suspended = False # 页面隐藏时暂停自动刷新
+        self.missed_refresh = False # 隐藏期间是否跳过了自动刷新
+        self.loaded_stock_version = None # 列表当前显示的股票数据版本
+        self.refresh_stop = threading.Event() # 停止自动刷新时唤醒等待中的刷新线程
+        self.replay_clock = None # 自动刷新为回放模式时的回放时钟
+        self.replay_indicators = None # 回放使用的内存指标簿
+        self.replay_lock = threading.Lock() # 同一时间只运行一个回放
+        self.replay_reload_pending = False # 是否已安排重新加载列表，快速回放时合并为一次
         
         # 不使用background属性，使用bootstyle
         # self.configure(background=BACKGROUND_COLOR)
@@ -288,17 +297,16 @@ class MarketFrame(tb.Frame):  # 使用ttkbootstrap美化界面
         for item in self.stock_tree.get_children():
             self.stock_tree.delete(item)
         
-        # 获取股票数据
-        stocks = db.get_stocks()
+        # 获取共享的只读价格快照
+        snapshot = db.get_price_snapshot()
+        self.loaded_stock_version = snapshot.version
         
         # 扩大涨跌幅列，以便显示更多信息
         self.stock_tree.column('涨跌幅', width=100)
         
         # 添加到列表
-        for code, info in stocks.items():
-            name = info.get("name", "")
-            price = info.get("price", 0)
-            change = info.get("change", 0)
+        for code, name, price, change in zip(snapshot.codes, snapshot.names,
+                                             snapshot.price.tolist(), snapshot.change.tolist()):
             
             # 根据涨跌幅设置颜色标签
             if change > 0:
@@ -326,8 +334,17 @@ class MarketFrame(tb.Frame):  # 使用ttkbootstrap美化界面
         current_time = datetime.now().strftime("%H:%M:%S")
         self.last_refresh_var.set(current_time)
         
-        # 更新状态
-        self.status_label.config(text=f"状态: 数据加载完成，显示价格为实时价格", bootstyle="success")
+        # 更新状态，显示实时行情快照的数据延迟
+        quote_age = stock_manager.quotes.age()
+        if quote_age is None:
+            status = "状态: 数据加载完成，暂无实时行情，显示价格为最近收盘价"
+        else:
+            status = f"状态: 数据加载完成，显示价格为实时价格（行情获取于 {quote_age:.0f} 秒前）"
+        tiers = stock_manager.quote_tiers
+        if tiers.get("cache") or tiers.get("database"):
+            # 部分股票没有实时行情，显示各数据源提供的股票数量
+            status += f"；实时 {tiers['spot']} 只，K线缓存 {tiers['cache']} 只，数据库 {tiers['database']} 只"
+        self.status_label.config(text=status, bootstyle="success")
         self.refresh_indicator.config(text="●", bootstyle="success")
         
         # 3秒后恢复状态指示器
@@ -346,47 +363,143 @@ class MarketFrame(tb.Frame):  # 使用ttkbootstrap美化界面
             
             # 更新股票价格
             stock_manager.update_stock_prices()
-            
-            # 重新加载数据
-            self.load_market_data()
-            
-            # 如果有选中的股票，重新加载图表
-            selected_items = self.stock_tree.selection()
-            if selected_items:
-                item = selected_items[0]
-                values = self.stock_tree.item(item, 'values')
-                if values:
-                    code = values[0]
-                    name = values[1]
-                    self.update_chart(code, name)
-            
-            # 恢复按钮状态
-            self.refresh_btn.config(state=tk.NORMAL)
         
-        # 使用线程进行刷新，避免界面卡顿
-        threading.Thread(target=do_refresh, daemon=True).start()
+        # 通过请求网关在后台刷新，避免界面卡顿；手动刷新和自动刷新同时发生时只执行一次
+        # do_refresh 只等待同步和行情快照的网关子请求，以 fanout 提交，不占用执行名额
+        future = gateway.submit(("refresh_market",), do_refresh, priority=PRIORITY_QUOTES, fanout=True)
+        poll(self, future, self.on_market_refreshed)
+    
+    def on_market_refreshed(self, result, error):
+        """刷新完成（界面线程）：重新加载列表和选中股票的图表"""
+        if error is not None:
+            print(f"刷新市场数据出错: {error}")
+        
+        # 重新加载数据
+        self.load_market_data()
+        
+        # 如果有选中的股票，重新加载图表
+        self.reload_selected_chart()
+        
+        # 恢复按钮状态
+        self.refresh_btn.config(state=tk.NORMAL)
+        if hasattr(self, 'sync_btn'):
+            self.sync_btn.configure(state=tk.NORMAL)
+    
+    def reload_selected_chart(self):
+        """重新加载列表中选中股票的图表"""
+        selected_items = self.stock_tree.selection()
+        if selected_items:
+            item = selected_items[0]
+            values = self.stock_tree.item(item, 'values')
+            if values:
+                code = values[0]
+                name = values[1]
+                self.update_chart(code, name)
     
     def toggle_auto_refresh(self):
         """切换自动刷新状态"""
         if self.auto_refresh_var.get():
-            # 启动自动刷新
+            # 启动自动刷新，回放模式下由回放时钟推送录制的行情
             self.update_running = True
-            self.status_label.config(text="状态: 自动刷新已启动", bootstyle="success")
-            self.auto_refresh_thread = threading.Thread(target=self.auto_refresh_task)
+            self.refresh_stop = threading.Event()
+            replay = get_config()["auto_refresh_mode"] == "replay"
+            self.status_label.config(text="状态: 正在加载回放行情..." if replay else "状态: 自动刷新已启动",
+                                     bootstyle="success")
+            self.auto_refresh_thread = threading.Thread(target=self.replay_task if replay else self.auto_refresh_task)
             self.auto_refresh_thread.daemon = True
             self.auto_refresh_thread.start()
         else:
             # 停止自动刷新
             self.update_running = False
+            self.refresh_stop.set()  # 回放时钟使用同一个停止事件
             self.status_label.config(text="状态: 自动刷新已停止", bootstyle="secondary")
     
+    def on_hide(self):
+        """页面隐藏：暂停自动刷新"""
+        self.suspended = True
+    
+    def on_show(self):
+        """页面重新显示：恢复自动刷新，隐藏期间错过的刷新只补做一次"""
+        self.suspended = False
+        if self.missed_refresh:
+            self.missed_refresh = False
+            self.refresh_market()
+        elif db.get_price_snapshot().version != self.loaded_stock_version:
+            # 其他页面或后台任务更新了股价，重新加载列表
+            self.load_market_data()
+    
     def auto_refresh_task(self):
         """自动刷新任务"""
+        interval = get_config()["auto_refresh_interval"]
         while self.update_running:
-            # 刷新数据
-            self.after(0, self.refresh_market)
-            # 等待30秒（模拟实时行情的刷新间隔）
-            time.sleep(30)
+            if self.suspended:
+                # 页面隐藏时不刷新，记下来等显示时补做
+                self.missed_refresh = True
+            else:
+                # 刷新数据
+                self.after(0, self.refresh_market)
+            # 等待下一次刷新，停止自动刷新时立即返回
+            self.refresh_stop.wait(interval)
+    
+    def replay_task(self):
+        """
+        回放任务（后台线程）：按配置的速度推送录制的K线，价格与实时刷新经同一路径写入
+
+        回放的行情计入单独的内存指标簿，不会覆盖保存的指标状态；回放结束或停止后恢复回放前的价格。
+        """
+        from .replay import create_replay_clock
+        from .streaming import IndicatorBook
+        # 停止事件在创建时钟前就交给它，加载期间点击停止也不会丢失
+        stop = self.refresh_stop
+        with self.replay_lock:  # 上一次回放恢复完价格后才开始新的回放
+            try:
+                clock = create_replay_clock(list(db.get_stocks()), stop=stop)
+            except Exception as e:
+                message = f"状态: 加载回放行情出错: {e}"
+                print(message)
+                self.after(0, lambda m=message: self.on_replay_failed(stop, m))
+                return
+            self.replay_clock = clock
+            self.replay_indicators = IndicatorBook(None, get_config()["rsi_method"], persist=False)
+            saved = db.get_stocks()
+            try:
+                clock.run(self.on_replay_tick)
+            finally:
+                db.update_stocks(saved)
+            print(f"行情回放: {clock.stats()}")
+        self.after(0, self.on_replay_finished if clock.finished else self.load_market_data)
+    
+    def on_replay_tick(self, market_time, quotes):
+        """推送一根回放K线（回放线程）：写入价格，列表的重新加载交给界面线程并合并"""
+        stock_manager.apply_quotes(quotes, market_time, verbose=False, indicators=self.replay_indicators)
+        if not self.suspended and not self.replay_reload_pending:
+            self.replay_reload_pending = True
+            self.after(0, self.on_replay_reload)
+    
+    def on_replay_reload(self):
+        """回放中重新加载列表（界面线程）"""
+        self.replay_reload_pending = False
+        self.load_market_data()
+        clock = self.replay_clock
+        if clock is not None and clock.market_time is not None:
+            self.status_label.config(text=f"状态: 回放中，市场时间 {clock.market_time:%Y-%m-%d %H:%M}"
+                                          f"（{clock.position}/{len(clock)}，{clock.speed:g}x）", bootstyle="info")
+    
+    def on_replay_finished(self):
+        """回放结束（界面线程）"""
+        self.on_replay_reload()
+        self.auto_refresh_var.set(False)
+        self.update_running = False
+        self.replay_clock = None
+        self.status_label.config(text="状态: 行情回放结束，已恢复回放前的价格", bootstyle="secondary")
+    
+    def on_replay_failed(self, stop, message):
+        """回放加载失败（界面线程）：关闭自动刷新开关；用户已经重新切换过开关时只显示错误"""
+        if self.refresh_stop is stop:
+            self.auto_refresh_var.set(False)
+            self.update_running = False
+            self.replay_clock = None
+        self.status_label.config(text=message, bootstyle="danger")
     
     def search_stock(self):
         """搜索股票"""
@@ -458,19 +571,36 @@ class MarketFrame(tb.Frame):  # 使用ttkbootstrap美化界面
         self.update_chart(code, name) # update_chart会根据current_chart_period选择数据源
     
     def update_chart(self, code, name):
-        """根据当前选择的周期更新图表"""
-        self.ax.clear() # 清除旧图
-        df = pd.DataFrame()
-
-        if self.current_chart_period == "daily":
+        """根据当前选择的周期更新图表：数据以最高优先级经请求网关获取，返回后再绘制"""
+        period = self.current_chart_period
+        if period == "daily":
             self.chart_title_var.set(f"{name} ({code}) - 日K线")
             # 计算60天前的日期和今天的日期
             end_date_daily = datetime.now().strftime("%Y-%m-%d")
             start_date_daily = (datetime.now() - timedelta(days=60)).strftime("%Y-%m-%d")
-            df = stock_manager.get_stock_data(code, start_date=start_date_daily, end_date=end_date_daily)
-        elif self.current_chart_period == "hourly":
+            future = gateway.submit(("chart", code, period, start_date_daily, end_date_daily),
+                                    stock_manager.get_stock_data, code, priority=PRIORITY_CHART,
+                                    start_date=start_date_daily, end_date=end_date_daily)
+        elif period == "hourly":
             self.chart_title_var.set(f"{name} ({code}) - 近24小时")
-            df = stock_manager.get_stock_hourly_data(code, lookback_hours=24)
+            future = gateway.submit(("chart", code, period, datetime.now().strftime("%Y-%m-%d %H")),
+                                    stock_manager.get_stock_hourly_data, code, priority=PRIORITY_CHART,
+                                    lookback_hours=24)
+        else:
+            return
+        poll(self, future, lambda df, error: self.draw_chart(code, name, period, df, error))
+    
+    def draw_chart(self, code, name, period, df, error):
+        """绘制获取到的图表数据（界面线程）"""
+        if (self.current_stock_code is not None and code != self.current_stock_code) \
+                or period != self.current_chart_period:
+            # 等待数据期间用户已切换股票或周期，丢弃过期的结果
+            return
+        if error is not None:
+            print(f"获取 {code} 图表数据出错: {error}")
+        if df is None:
+            df = pd.DataFrame()
+        self.ax.clear() # 清除旧图
         
         # 保存当前图表数据供鼠标悬停功能使用
         self.current_chart_df = df.copy() if not df.empty else None
@@ -556,30 +686,10 @@ class MarketFrame(tb.Frame):  # 使用ttkbootstrap美化界面
         self.status_label.config(text="状态: 正在同步价格数据...", bootstyle="warning")
         self.refresh_indicator.config(text="●", bootstyle="warning")
         
-        def do_sync():
-            # 同步价格数据
-            stock_manager.sync_stock_prices()
-            
-            # 刷新市场数据
-            self.load_market_data()
-            
-            # 如果有选中的股票，重新加载图表
-            selected_items = self.stock_tree.selection()
-            if selected_items:
-                item = selected_items[0]
-                values = self.stock_tree.item(item, 'values')
-                if values:
-                    code = values[0]
-                    name = values[1]
-                    self.update_chart(code, name)
-            
-            # 恢复按钮状态
-            self.refresh_btn.configure(state=tk.NORMAL)
-            if hasattr(self, 'sync_btn'):
-                self.sync_btn.configure(state=tk.NORMAL)
-        
-        # 使用线程进行同步，避免界面卡顿
-        threading.Thread(target=do_sync, daemon=True).start()
+        # 通过请求网关在后台同步价格数据，避免界面卡顿
+        future = gateway.submit(("sync_prices",), stock_manager.sync_stock_prices, priority=PRIORITY_QUOTES,
+                                fanout=True)
+        poll(self, future, self.on_market_refreshed)
 
     def on_mouse_motion(self, event):
         """处理鼠标移动事件，显示垂直参考线和价格标记"""
@@ -0,0 +1,278 @@
+import asyncio
+import functools
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from .config import get_config
+
+# 请求优先级，数值越小越先执行
+PRIORITY_CHART = 0     # 当前显示的图表
+PRIORITY_QUOTES = 1    # 当前显示的行情列表
+PRIORITY_PREFETCH = 2  # 后台预取（推荐分析的历史数据等）
+
+# 界面轮询请求结果的间隔（毫秒）
+POLL_INTERVAL_MS = 50
+
+
+class _Request:
+    """排队或执行中的一个请求，相同键的请求共用它的 future，waiters 是仍在等待它的提交者数"""
+
+    __slots__ = ("key", "call", "priority", "future", "started", "waiters")
+
+    def __init__(self, key, call, priority):
+        self.key = key
+        self.call = call
+        self.priority = priority
+        self.future = Future()
+        self.started = False
+        self.waiters = 1
+
+
+class MarketGateway:
+    """
+    行情数据请求网关：所有联网获取行情的请求在一个专用的 asyncio 事件循环线程中统一调度
+
+    - 请求按优先级排队（图表 > 行情列表 > 后台预取），同一优先级先到先执行；
+    - 键相同的请求在完成前只执行一次，后来者得到同一个 future，优先级更高时把排队中的请求提前；
+    - 同时执行的请求数不超过 max_concurrency，rate > 0 时每秒开始执行的请求数不超过 rate；
+    - 请求函数本身是同步的（AKShare、K线缓存），在线程池中执行，不阻塞事件循环；
+    - 自己不联网、只等待其他网关请求的汇总请求（fanout=True）不占用执行名额，
+      它们发出的子请求照常排队、计入并发上限，不会因为等待子请求而占满名额导致死锁。
+
+    submit() 可以在任意线程调用，返回 concurrent.futures.Future；界面线程用 poll() 定时检查结果。
+    不再需要结果的提交者调用 release()，所有提交者都放弃后，尚未开始执行的请求才会被取消。
+    """
+
+    def __init__(self, max_concurrency=8, rate=0, burst=None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self._lock = threading.Lock()
+        self._pending = {}  # 键 → 排队或执行中的 _Request
+        self._seq = itertools.count()
+        self._loop = None
+        self._ready = None  # 事件循环线程准备好队列和线程池后置位
+        self._queue = None
+        self._executor = None
+        self._fanout_executor = None
+        self._workers = []
+        self._tokens = self.capacity
+        self._last_refill = 0.0
+        self.submitted = 0     # 实际执行的请求数
+        self.deduplicated = 0  # 与已有请求合并的次数
+        self.promoted = 0      # 因更高优先级的重复请求而提前的次数
+        self.failed = 0
+
+    def _ensure_started(self):
+        # 所有调用方都等待事件循环线程创建好队列和线程池，不只是启动它的那一个
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._ready = threading.Event()
+                threading.Thread(target=self._run, args=(self._ready,), name="market-gateway", daemon=True).start()
+            ready = self._ready
+        ready.wait()
+
+    def _run(self, ready):
+        loop = self._loop
+        asyncio.set_event_loop(loop)
+        self._queue = asyncio.PriorityQueue()
+        self._executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="gateway")
+        self._fanout_executor = ThreadPoolExecutor(thread_name_prefix="gateway-fanout")
+        self._last_refill = loop.time()
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.max_concurrency)]
+        ready.set()
+        loop.run_forever()
+        loop.close()
+
+    def submit(self, key, func, *args, priority=PRIORITY_QUOTES, fanout=False, **kwargs):
+        """
+        提交请求 func(*args, **kwargs)
+        :param key: 请求的唯一标识（可哈希），键相同的请求视为同一请求
+        :param fanout: func 只是汇总其他网关请求的结果（如并发同步全部股票），
+                       在单独的线程中立即执行，不占用执行名额；在请求中等待网关子请求时必须设置
+        :return: concurrent.futures.Future
+        """
+        self._ensure_started()
+        with self._lock:
+            request = self._pending.get(key)
+            if request is not None:
+                self.deduplicated += 1
+                request.waiters += 1
+                if priority < request.priority and not request.started:
+                    # 以更高的优先级重新入队，旧的队列项出队时会被跳过
+                    request.priority = priority
+                    self.promoted += 1
+                    self._loop.call_soon_threadsafe(self._queue.put_nowait, (priority, next(self._seq), request))
+                return request.future
+            request = self._pending[key] = _Request(key, functools.partial(func, *args, **kwargs), priority)
+            self.submitted += 1
+            if fanout:
+                request.started = True
+        if fanout:
+            self._fanout_executor.submit(self._run_fanout, request)
+        else:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, (priority, next(self._seq), request))
+        return request.future
+
+    def release(self, key, future):
+        """
+        提交者不再需要 submit(key, ...) 返回的 future 的结果
+        最后一个提交者放弃时，尚未开始执行的请求被取消；仍有其他提交者在等待的请求照常执行。
+        """
+        with self._lock:
+            request = self._pending.get(key)
+            if request is None or request.future is not future:
+                return  # 已完成
+            request.waiters -= 1
+            if request.waiters > 0 or request.started:
+                return
+            del self._pending[key]
+        future.cancel()
+
+    def imap(self, func, items, key=None, priority=PRIORITY_PREFETCH):
+        """
+        对每个 item 提交 func(item)，按完成的先后逐个产出 (item, 结果, 异常)
+
+        :param key: key(item) 返回请求的键，默认为 (func 名称, item)
+        调用方提前停止迭代时放弃这些请求，没有其他提交者在等待、尚未开始执行的请求会被取消。
+        """
+        key = key or (lambda item: (getattr(func, "__name__", "call"), item))
+        futures = {}
+        submitted = []
+        try:
+            for item in items:
+                item_key = key(item)
+                future = self.submit(item_key, func, item, priority=priority)
+                submitted.append((item_key, future))
+                futures.setdefault(future, []).append(item)
+            for future in as_completed(futures):
+                error = future.exception()
+                for item in futures[future]:
+                    yield item, None if error else future.result(), error
+        finally:
+            for item_key, future in submitted:
+                self.release(item_key, future)
+
+    async def _acquire(self):
+        """全局令牌桶限流，只在事件循环线程中调用"""
+        if self.rate <= 0:
+            return
+        while True:
+            now = asyncio.get_running_loop().time()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def _worker(self):
+        while True:
+            priority, _, request = await self._queue.get()
+            with self._lock:
+                if request.started or priority != request.priority:
+                    continue  # 已被提前执行的旧队列项
+                request.started = True
+            if not request.future.set_running_or_notify_cancel():
+                self._finish(request)
+                continue
+            await self._acquire()
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(self._executor, request.call)
+            except Exception as e:
+                self._settle(request, error=e)
+            else:
+                self._settle(request, result)
+
+    def _run_fanout(self, request):
+        """在汇总线程中执行 fanout 请求"""
+        if not request.future.set_running_or_notify_cancel():
+            self._finish(request)
+            return
+        try:
+            result = request.call()
+        except Exception as e:
+            self._settle(request, error=e)
+        else:
+            self._settle(request, result)
+
+    def _settle(self, request, result=None, error=None):
+        self._finish(request)
+        if error is not None:
+            self.failed += 1
+            request.future.set_exception(error)
+        else:
+            request.future.set_result(result)
+
+    def _finish(self, request):
+        # 先移出待执行表，结果返回后再提交的相同请求会重新执行
+        with self._lock:
+            if self._pending.get(request.key) is request:
+                del self._pending[request.key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "promoted": self.promoted,
+                "failed": self.failed,
+                "pending": len(self._pending),
+            }
+
+    def close(self):
+        """停止事件循环；排队中的请求被取消，执行中的请求在后台线程中继续完成"""
+        with self._lock:
+            loop = self._loop
+            if loop is None:
+                return
+            for request in self._pending.values():
+                if not request.started:
+                    request.future.cancel()
+        workers = self._workers
+
+        async def shutdown():
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._fanout_executor.shutdown(wait=False)
+        with self._lock:
+            self._loop = None
+            self._pending = {}
+
+
+def poll(widget, future, callback, interval_ms=POLL_INTERVAL_MS):
+    """
+    在界面线程中用 after 定时检查 future，完成后调用 callback(结果, 异常)；被取消的请求不回调
+    """
+    import tkinter as tk
+
+    def check():
+        if not future.done():
+            try:
+                widget.after(interval_ms, check)
+            except tk.TclError:
+                pass  # 控件已销毁
+            return
+        if future.cancelled():
+            return
+        error = future.exception()
+        callback(None if error else future.result(), error)
+
+    check()
+
+
+def create_gateway():
+    """按系统配置创建请求网关"""
+    config = get_config()
+    return MarketGateway(config["gateway_max_concurrency"], config["gateway_rate"], config["gateway_burst"])
+
+
+# 全局请求网关，事件循环线程在第一次提交请求时启动
+gateway = create_gateway()
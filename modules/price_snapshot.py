@@ -0,0 +1,70 @@
+import numpy as np
+
+
+class PriceSnapshot:
+    """
+    股票价格的列式快照：代码→行号索引，加上连续的 float64 价格/涨跌幅数组
+
+    快照创建后只读（数组不可写），可以在行情、账户和管理员页面之间共享；
+    股价变化时由 Database 生成新的快照，而不是修改旧快照。
+    """
+
+    def __init__(self, stocks, version=0):
+        """
+        :param stocks: {code: {"name", "price", "change"}} 字典
+        :param version: 生成快照时股票数据的版本号
+        """
+        self.version = version
+        self.codes = list(stocks.keys())
+        self.names = [info.get("name", "") for info in stocks.values()]
+        self.index = {code: row for row, code in enumerate(self.codes)}
+        self.price = np.fromiter((info.get("price", 0) or 0 for info in stocks.values()),
+                                 dtype=np.float64, count=len(self.codes))
+        self.change = np.fromiter((info.get("change", 0) or 0 for info in stocks.values()),
+                                  dtype=np.float64, count=len(self.codes))
+        self.price.flags.writeable = False
+        self.change.flags.writeable = False
+
+    def __len__(self):
+        return len(self.codes)
+
+    def rows(self, codes):
+        """代码列表对应的行号数组，不存在的代码为 -1"""
+        return np.fromiter((self.index.get(code, -1) for code in codes), dtype=np.int64, count=len(codes))
+
+    def prices(self, codes):
+        """代码列表对应的价格数组，不存在的代码价格为0"""
+        rows = self.rows(codes)
+        # 只用存在的行号取价格，空快照或不存在的代码不会越界
+        out = np.zeros(len(rows))
+        found = rows >= 0
+        out[found] = self.price[rows[found]]
+        return out
+
+    def value(self, holdings):
+        """
+        计算一个账户的持仓市值
+        :param holdings: {code: {"quantity": ...}} 持仓字典
+        """
+        if not holdings:
+            return 0.0
+        quantities = np.fromiter((h.get("quantity", 0) for h in holdings.values()),
+                                 dtype=np.float64, count=len(holdings))
+        return float(np.dot(self.prices(list(holdings.keys())), quantities))
+
+    def value_many(self, holdings_list):
+        """
+        一次计算多个账户的持仓市值：展开成 (账户序号, 行号, 数量) 三个数组后按账户求和
+        :param holdings_list: 持仓字典列表
+        :return: 与 holdings_list 等长的市值数组
+        """
+        owners, codes, quantities = [], [], []
+        for owner, holdings in enumerate(holdings_list):
+            for code, holding in holdings.items():
+                owners.append(owner)
+                codes.append(code)
+                quantities.append(holding.get("quantity", 0))
+        if not codes:
+            return np.zeros(len(holdings_list))
+        weights = self.prices(codes) * np.asarray(quantities, dtype=np.float64)
+        return np.bincount(np.asarray(owners), weights=weights, minlength=len(holdings_list))
@@ -0,0 +1,134 @@
+import time
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class SpotSnapshot:
+    """
+    一次获取的全市场实时行情快照：AKShare 代码 → {"price", "change", "volume"}
+
+    快照创建后只读，由所有实时行情的使用方共享。
+    """
+
+    def __init__(self, df, fetched_at=None):
+        """
+        :param df: stock_zh_a_spot_em() 返回的 DataFrame，需要包含 代码、最新价 列
+        :param fetched_at: 获取时间（time.time()），默认为当前时间
+        """
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        codes = df["代码"].astype(str).tolist()
+        price = pd.to_numeric(df["最新价"], errors="coerce").to_numpy(dtype=np.float64)
+        change = pd.to_numeric(df["涨跌幅"], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64) \
+            if "涨跌幅" in df.columns else np.zeros(len(df))
+        volume = df["成交量"].tolist() if "成交量" in df.columns else [None] * len(df)
+        # 停牌等没有最新价的股票不放进快照，由调用方改用备用数据源
+        self.quotes = {
+            code: {"price": float(p), "change": float(c), "volume": v}
+            for code, p, c, v in zip(codes, price.tolist(), change.tolist(), volume)
+            if not np.isnan(p)
+        }
+
+    def __len__(self):
+        return len(self.quotes)
+
+    def get(self, ak_code):
+        return self.quotes.get(ak_code)
+
+    def age(self, now=None):
+        """快照距今的秒数"""
+        return (now if now is not None else time.time()) - self.fetched_at
+
+
+class _Flight:
+    """一次进行中的获取，等待者共享它的结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.snapshot = None
+        self.error = None
+
+
+class QuoteService:
+    """
+    全市场实时行情快照服务：所有实时行情请求共用一份带时间戳的快照
+
+    快照在 max_age 秒内直接复用；过期后第一个请求负责联网获取，获取期间到达的请求
+    等待这一次获取的结果（single-flight），不会各自再下载一遍全市场行情。
+    """
+
+    def __init__(self, fetch, max_age=5.0):
+        """
+        :param fetch: 无参函数，返回全市场实时行情 DataFrame，失败时抛出异常
+        :param max_age: 快照的有效期（秒）
+        """
+        self.fetch = fetch
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._flight = None
+        self.fetches = 0    # 实际联网获取次数
+        self.hits = 0       # 直接使用有效快照的次数
+        self.coalesced = 0  # 等待进行中的获取、与其共用结果的次数
+        self.failures = 0
+
+    def snapshot(self, max_age=None, now=None):
+        """
+        获取不超过 max_age 秒的快照，获取失败时返回 None（等待者得到同一个结果）
+        :param max_age: 本次请求能接受的快照最大年龄，默认为服务的 max_age
+        """
+        max_age = self.max_age if max_age is None else max_age
+        now = now if now is not None else time.time()
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.age(now) <= max_age:
+                self.hits += 1
+                return snapshot
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            return flight.snapshot
+
+        try:
+            df = self.fetch()
+            if df is None or df.empty or "代码" not in df.columns or "最新价" not in df.columns:
+                raise ValueError("未返回有效数据或缺少'代码'/'最新价'列")
+            flight.snapshot = SpotSnapshot(df)
+        except Exception as e:
+            flight.error = e
+            print(f"行情快照: 获取全市场实时行情失败: {e}")
+        finally:
+            with self._lock:
+                self.fetches += 1
+                if flight.snapshot is not None:
+                    self._snapshot = flight.snapshot
+                else:
+                    self.failures += 1
+                self._flight = None
+            flight.done.set()
+        return flight.snapshot
+
+    def latest(self):
+        """最近一次成功获取的快照（不联网，可能已过期），没有时为 None"""
+        return self._snapshot
+
+    def age(self, now=None):
+        """最近一次成功获取的快照距今的秒数，没有快照时为 None"""
+        snapshot = self._snapshot
+        return snapshot.age(now) if snapshot is not None else None
+
+    def stats(self):
+        return {
+            "fetches": self.fetches,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "age": self.age(),
+        }
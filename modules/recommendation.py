@@ -4,8 +4,19 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import threading
+import heapq
+import queue
 from .stock_data import stock_manager
 from .database import db
+from .market_gateway import gateway, PRIORITY_PREFETCH
+from .indicators import BarPanel, DEFAULT_THRESHOLDS, combine_signals
+from .indicator_registry import (INDICATORS, DEFAULT_INDICATORS, compute_indicators, describe_signals, history_days,
+                                 required_fields, score_panel)
+from .streaming import previous_trading_day
+from .score_pool import ParallelScorer
+from .backtest import DatePanel, load_cached_frames, run_backtest, window_signals
+from .weight_optimizer import load_weight_config
+from .config import get_config
 from ttkbootstrap import Style
 
 # 定义颜色
@@ -15,17 +26,49 @@ TEXT_COLOR = "#ffffff"
 BACKGROUND_COLOR = "#0d1926"
 CHART_AREA_COLOR = "#142638"
 
+# 推荐结果逐批显示：每隔多少毫秒取一次队列，每次最多插入多少行
+RESULT_FLUSH_MS = 100
+RESULT_BATCH_SIZE = 500
+
+# 涨跌排行榜显示的股票数量
+RANKING_SIZE = 5
+
 class StockRecommendationEngine:
     """股票推荐引擎，使用技术分析指标"""
     
     def __init__(self):
-        self.indicators_weights = {
-            'ma_signal': 0.25,    # 移动平均线信号
-            'rsi_signal': 0.20,   # RSI信号
-            'volume_signal': 0.15, # 成交量信号
-            'price_momentum': 0.25, # 价格动量
-            'volatility_signal': 0.15  # 波动率信号
-        }
+        self.signal_thresholds = dict(DEFAULT_THRESHOLDS)
+        self.weights_version = None  # 使用的优化结果版本，None 表示默认权重
+        config = get_config()
+        
+        # 使用的指标，忽略未登记的名称
+        self.indicator_names = []
+        for name in config["recommend_indicators"]:
+            if name in INDICATORS:
+                self.indicator_names.append(name)
+            else:
+                print(f"推荐引擎: 未知的指标 {name}，已忽略")
+        if not self.indicator_names:
+            self.indicator_names = list(DEFAULT_INDICATORS)
+        weights = {name: INDICATORS[name].weight for name in self.indicator_names}
+        
+        # 有权重优化结果时使用优化后的权重和阈值（优化结果只包含原有五项信号的权重）
+        weight_config = load_weight_config(config["recommendation_weights_path"])
+        if weight_config is not None:
+            weights.update((name, weight) for name, weight in weight_config["weights"].items() if name in weights)
+            self.signal_thresholds = weight_config["thresholds"]
+            self.weights_version = weight_config.get("version")
+            print(f"推荐引擎: 使用第 {self.weights_version} 版优化权重")
+        # 权重之和不为1时按比例缩放，保证综合得分仍在 [-1, 1] 内
+        total = sum(weights.values())
+        if total > 0 and abs(total - 1) > 1e-9:
+            weights = {name: weight / total for name, weight in weights.items()}
+        self.indicators_weights = weights
+        # 只选了原有五项信号时可以使用流式指标状态
+        self.streaming = set(self.indicator_names) <= set(DEFAULT_INDICATORS)
+        self.scorer = None
+        if config["recommend_mode"] == "process":
+            self.scorer = ParallelScorer(config["recommend_workers"], config["recommend_shard_size"])
     
     def calculate_ma_signal(self, df):
         """计算移动平均线信号"""
@@ -33,12 +76,12 @@ class StockRecommendationEngine:
             return 0
         
         # 计算5日和20日移动平均
-        df['ma5'] = df['close'].rolling(window=5).mean()
-        df['ma20'] = df['close'].rolling(window=20).mean()
+        ma5 = df['close'].rolling(window=5).mean()
+        ma20 = df['close'].rolling(window=20).mean()
         
         current_price = df['close'].iloc[-1]
-        ma5_current = df['ma5'].iloc[-1]
-        ma20_current = df['ma20'].iloc[-1]
+        ma5_current = ma5.iloc[-1]
+        ma20_current = ma20.iloc[-1]
         
         # 信号计算
         if current_price > ma5_current > ma20_current:
@@ -70,9 +113,9 @@ class StockRecommendationEngine:
             return 0
         
         # RSI信号判断
-        if current_rsi < 30:
+        if current_rsi < self.signal_thresholds['rsi_oversold']:
             return 0.7  # 超卖，看涨
-        elif current_rsi > 70:
+        elif current_rsi > self.signal_thresholds['rsi_overbought']:
             return -0.7  # 超买，看跌
         elif current_rsi < 50:
             return 0.3  # 偏看涨
@@ -85,10 +128,8 @@ class StockRecommendationEngine:
             return 0
         
         # 计算成交量移动平均
-        df['volume_ma'] = df['volume'].rolling(window=10).mean()
-        
         current_volume = df['volume'].iloc[-1]
-        volume_ma = df['volume_ma'].iloc[-1]
+        volume_ma = df['volume'].rolling(window=10).mean().iloc[-1]
         
         if pd.isna(volume_ma) or volume_ma == 0:
             return 0
@@ -98,11 +139,12 @@ class StockRecommendationEngine:
         # 结合价格变化判断
         price_change = (df['close'].iloc[-1] - df['close'].iloc[-2]) / df['close'].iloc[-2]
         
-        if volume_ratio > 1.5 and price_change > 0:
+        surge = self.signal_thresholds['volume_surge']
+        if volume_ratio > surge and price_change > 0:
             return 0.6  # 放量上涨
-        elif volume_ratio > 1.5 and price_change < 0:
+        elif volume_ratio > surge and price_change < 0:
             return -0.6  # 放量下跌
-        elif volume_ratio < 0.8:
+        elif volume_ratio < self.signal_thresholds['volume_shrink']:
             return -0.2  # 缩量，较弱信号
         else:
             return 0
@@ -113,11 +155,8 @@ class StockRecommendationEngine:
             return 0
         
         # 计算3日和5日收益率
-        df['return_3d'] = df['close'].pct_change(3)
-        df['return_5d'] = df['close'].pct_change(5)
-        
-        return_3d = df['return_3d'].iloc[-1]
-        return_5d = df['return_5d'].iloc[-1]
+        return_3d = df['close'].pct_change(3).iloc[-1]
+        return_5d = df['close'].pct_change(5).iloc[-1]
         
         if pd.isna(return_3d) or pd.isna(return_5d):
             return 0
@@ -132,86 +171,193 @@ class StockRecommendationEngine:
             return 0
         
         # 计算10日波动率
-        df['returns'] = df['close'].pct_change()
-        volatility = df['returns'].rolling(window=10).std()
+        volatility = df['close'].pct_change().rolling(window=10).std()
         current_volatility = volatility.iloc[-1]
         
         if pd.isna(current_volatility):
             return 0
         
         # 波动率过高给予负分，适中给予正分
-        if current_volatility > 0.05:  # 5%以上波动率
+        if current_volatility > self.signal_thresholds['volatility_high']:  # 默认5%以上波动率
             return -0.4
-        elif current_volatility < 0.02:  # 2%以下波动率
+        elif current_volatility < self.signal_thresholds['volatility_low']:  # 默认2%以下波动率
             return 0.2
         else:
             return 0.1
     
+    def prefetch_history(self, codes):
+        """
+        经请求网关以后台预取的优先级并发获取历史数据，按完成的先后逐个产出 (code, DataFrame, 异常)
+
+        界面上的图表和行情请求会排在这些请求前面执行。
+        """
+        days = history_days(self.indicator_names)
+        return gateway.imap(self.load_history, codes, key=lambda code: ("history", code, days),
+                            priority=PRIORITY_PREFETCH)
+    
+    def load_history(self, code):
+        """获取推荐分析使用的历史数据，天数由所选指标需要的K线数决定（原有五项为30天）"""
+        end_date = datetime.now().strftime("%Y-%m-%d")
+        start_date = (datetime.now() - timedelta(days=history_days(self.indicator_names))).strftime("%Y-%m-%d")
+        return stock_manager.get_stock_data(code, start_date=start_date, end_date=end_date)
+    
     def analyze_stock(self, code):
         """分析单只股票，返回推荐信号"""
         try:
-            # 获取30天历史数据
-            end_date = datetime.now().strftime("%Y-%m-%d")
-            start_date = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
-            df = stock_manager.get_stock_data(code, start_date=start_date, end_date=end_date)
-            
-            if df.empty:
-                return 0, "数据不足"
-            
-            # 计算各项技术指标
-            ma_signal = self.calculate_ma_signal(df.copy())
-            rsi_signal = self.calculate_rsi_signal(df.copy())
-            volume_signal = self.calculate_volume_signal(df.copy())
-            momentum_signal = self.calculate_price_momentum(df.copy())
-            volatility_signal = self.calculate_volatility_signal(df.copy())
-            
-            # 计算综合得分
-            total_score = (
-                ma_signal * self.indicators_weights['ma_signal'] +
-                rsi_signal * self.indicators_weights['rsi_signal'] +
-                volume_signal * self.indicators_weights['volume_signal'] +
-                momentum_signal * self.indicators_weights['price_momentum'] +
-                volatility_signal * self.indicators_weights['volatility_signal']
-            )
-            
-            # 转换为概率（-1到1转换为0%到100%）
-            probability = (total_score + 1) * 50
-            probability = np.clip(probability, 0, 100)
-            
-            # 生成推荐理由
-            reasons = []
-            if abs(ma_signal) > 0.5:
-                reasons.append(f"均线{'看涨' if ma_signal > 0 else '看跌'}")
-            if abs(rsi_signal) > 0.5:
-                reasons.append(f"RSI{'超卖' if rsi_signal > 0 else '超买'}")
-            if abs(volume_signal) > 0.4:
-                reasons.append(f"成交量{'放大' if volume_signal > 0 else '萎缩'}")
-            
-            reason = ", ".join(reasons) if reasons else "综合技术指标分析"
-            
-            return probability, reason
-            
+            df = self.load_history(code)
+            return self.analyze_dataframe(df)
         except Exception as e:
             print(f"分析股票 {code} 时出错: {e}")
             return 50, "分析出错"
     
+    def analyze_dataframe(self, df):
+        """逐只分析：对一只股票的历史数据计算各项指标，返回 (上涨概率, 推荐理由)"""
+        if df.empty:
+            return 0, "数据不足"
+        
+        # 计算各项技术指标（calculate_* 不修改 df，不需要复制）
+        calculators = {
+            'ma_signal': self.calculate_ma_signal,
+            'rsi_signal': self.calculate_rsi_signal,
+            'volume_signal': self.calculate_volume_signal,
+            'price_momentum': self.calculate_price_momentum,
+            'volatility_signal': self.calculate_volatility_signal,
+        }
+        signals = {name: calculators[name](df) for name in self.indicator_names if name in calculators}
+        # 其他指标只有向量化实现，按单列面板计算
+        extra = [name for name in self.indicator_names if name not in calculators]
+        if extra:
+            panel = BarPanel({'': df}, required_fields(extra))
+            signals.update((name, values[-1, 0]) for name, values in
+                           compute_indicators(panel, extra, self.signal_thresholds).items())
+        signals = {name: signals[name] for name in self.indicator_names}
+        return combine_signals(signals, self.indicators_weights), describe_signals(signals)
+    
+    def analyze_frames(self, frames):
+        """
+        批量分析：把所有股票的K线放进一个二维面板，一次向量化计算所选的全部指标
+        :param frames: {code: DataFrame}
+        :return: {code: (上涨概率, 推荐理由)}，结果与逐只调用 analyze_dataframe 相同
+        """
+        results = {}
+        valid = {}
+        for code, df in frames.items():
+            if df is None or df.empty:
+                results[code] = (0, "数据不足")
+            else:
+                valid[code] = df
+        if not valid:
+            return results
+        
+        panel = BarPanel(valid, required_fields(self.indicator_names))
+        # 只需要每只股票最新一根K线上的信号
+        results.update(zip(panel.codes, score_panel(panel, self.indicators_weights, self.signal_thresholds)))
+        return results
+    
+    def iter_recommendations(self):
+        """
+        逐只产出推荐结果的生成器：每只股票打分完成后立即产出 (code, 推荐)，顺序为完成的先后
+        """
+        stocks = db.get_stocks()
+        if self.scorer is not None:
+            scores = self.iter_process_scores(stocks)
+        elif self.streaming:
+            scores = self.iter_state_scores(stocks)
+        else:
+            scores = self.iter_batch_scores(stocks)
+        for code, (probability, reason) in scores:
+            yield code, self.make_recommendation(stocks[code], probability, reason)
+    
     def get_all_recommendations(self):
         """获取所有股票的推荐"""
-        stocks = db.get_stocks()
-        recommendations = {}
-        
-        for code, stock_info in stocks.items():
-            probability, reason = self.analyze_stock(code)
-            recommendations[code] = {
-                'name': stock_info.get('name', ''),
-                'current_price': stock_info.get('price', 0),
-                'probability': probability,
-                'reason': reason,
-                'direction': 'up' if probability > 50 else 'down',
-                'confidence': abs(probability - 50) * 2  # 0-100的置信度
-            }
-        
-        return recommendations
+        return dict(self.iter_recommendations())
+    
+    def analyze_state(self, code, today):
+        """用流式指标状态给一只股票打分"""
+        try:
+            result = stock_manager.indicators.analyze(code, self.indicators_weights, today, self.signal_thresholds)
+        except Exception as e:
+            print(f"分析股票 {code} 时出错: {e}")
+            return 50, "分析出错"
+        return result if result is not None else (0, "数据不足")
+    
+    def iter_state_scores(self, stocks):
+        """
+        用流式指标状态打分：已有最新状态的股票立即产出，
+        没有状态（或状态已落后）的股票并发获取历史数据初始化，每获取完一只就产出一只
+        """
+        book = stock_manager.indicators
+        today = datetime.now()
+        latest_day = previous_trading_day(today.strftime("%Y-%m-%d"))
+        missing = [code for code in stocks if not book.is_current(code, latest_day)]
+        missing_set = set(missing)
+        for code in stocks:
+            if code not in missing_set:
+                yield code, self.analyze_state(code, today)
+        if not missing:
+            return
+        
+        try:
+            for code, df, error in self.prefetch_history(missing):
+                if error is not None:
+                    print(f"获取股票 {code} 历史数据时出错: {error}")
+                    yield code, (50, "分析出错")
+                elif df is None or df.empty:
+                    yield code, (0, "数据不足")
+                else:
+                    book.seed(code, df)
+                    yield code, self.analyze_state(code, today)
+        finally:
+            book.save()
+    
+    def iter_batch_scores(self, stocks):
+        """流式指标状态不支持所选指标时使用：并发获取历史数据，每获取完一只就向量化计算并产出一只"""
+        for code, df, error in self.prefetch_history(list(stocks.keys())):
+            if error is not None:
+                print(f"获取股票 {code} 历史数据时出错: {error}")
+                yield code, (50, "分析出错")
+            else:
+                yield code, self.analyze_frames({code: df})[code]
+    
+    def iter_process_scores(self, stocks):
+        """并发获取全部历史数据，放入共享内存面板后分片交给进程池打分，每个分片完成后产出该分片"""
+        frames = {}
+        for code, df, error in self.prefetch_history(list(stocks.keys())):
+            if error is not None:
+                yield code, (50, "分析出错")
+            else:
+                frames[code] = df
+        done = set()
+        try:
+            for shard in self.scorer.iter_scores(frames, self.indicators_weights, self.signal_thresholds):
+                done.update(shard)
+                yield from shard.items()
+        except Exception as e:
+            print(f"多进程打分出错，改为在本进程批量分析: {e}")
+            remaining = {code: df for code, df in frames.items() if code not in done}
+            yield from self.analyze_frames(remaining).items()
+    
+    def backtest(self, start_date, end_date, top_n=5, holding_period=5, fee_rate=0.0015, side="long_short"):
+        """
+        用本地缓存的日K线回测当前权重下的推荐信号（只回测原有五项信号，其他指标不参与）
+        :return: BacktestResult，汇总指标见 result.metrics(holding_period)
+        """
+        frames = load_cached_frames(stock_manager.bar_store, list(db.get_stocks().keys()), start_date, end_date)
+        panel = DatePanel(frames)
+        weights = {name: weight for name, weight in self.indicators_weights.items() if name in DEFAULT_INDICATORS}
+        return run_backtest(panel, weights, top_n, holding_period, fee_rate, side,
+                            window_signals(panel, self.signal_thresholds))
+    
+    def make_recommendation(self, stock_info, probability, reason):
+        """一只股票的推荐条目"""
+        return {
+            'name': stock_info.get('name', ''),
+            'current_price': stock_info.get('price', 0),
+            'probability': probability,
+            'reason': reason,
+            'direction': 'up' if probability > 50 else 'down',
+            'confidence': abs(probability - 50) * 2  # 0-100的置信度
+        }
 
 class RecommendationFrame(tb.Frame):
     """股票推荐页面框架"""
@@ -221,6 +367,8 @@ class RecommendationFrame(tb.Frame):
         self.username = username
         self.recommendation_engine = StockRecommendationEngine()
         self.recommendations = {}
+        self.up_heap = []    # 看涨前五 (概率, 代码) 的小顶堆
+        self.down_heap = []  # 看跌前五 (-概率, 代码) 的小顶堆
         
         # 创建标题
         self.title_label = tb.Label(self, text="股票推荐", font=("微软雅黑", 16, "bold"), 
@@ -293,6 +441,12 @@ class RecommendationFrame(tb.Frame):
                                     command=self.stock_tree.yview, bootstyle="round-dark")
         self.stock_tree.configure(yscrollcommand=scrollbar_left.set)
         
+        # 设置颜色
+        self.stock_tree.tag_configure('strong_up', foreground='#ff6b6b')
+        self.stock_tree.tag_configure('up', foreground='#ffa8a8')
+        self.stock_tree.tag_configure('strong_down', foreground='#51cf66')
+        self.stock_tree.tag_configure('down', foreground='#8ce99a')
+        
         # 布局
         self.stock_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar_left.pack(side=tk.RIGHT, fill=tk.Y)
@@ -355,94 +509,129 @@ class RecommendationFrame(tb.Frame):
         info_label.pack(anchor="w")
     
     def refresh_recommendations(self):
-        """刷新推荐数据"""
+        """刷新推荐数据：后台线程逐只产出结果放入队列，界面定时批量取出显示"""
         self.status_var.set("正在分析股票数据...")
         self.refresh_btn.config(state=tk.DISABLED)
         
+        # 清空列表和排行榜
+        for tree in (self.stock_tree, self.up_list, self.down_list):
+            for item in tree.get_children():
+                tree.delete(item)
+        self.recommendations = {}
+        self.up_heap = []
+        self.down_heap = []
+        self.analysis_error = None
+        result_queue = self.result_queue = queue.Queue()
+        
         def do_analysis():
             try:
-                # 获取推荐数据
-                self.recommendations = self.recommendation_engine.get_all_recommendations()
-                
-                # 更新界面
-                self.after(0, self.update_display)
-                
+                for item in self.recommendation_engine.iter_recommendations():
+                    result_queue.put(item)
             except Exception as e:
                 print(f"分析股票数据时出错: {e}")
-                self.after(0, lambda: self.status_var.set(f"分析失败: {e}"))
+                self.analysis_error = e
             finally:
-                self.after(0, lambda: self.refresh_btn.config(state=tk.NORMAL))
+                result_queue.put(None)  # 结束标记
         
         # 在后台线程中进行分析
         threading.Thread(target=do_analysis, daemon=True).start()
+        self.after(RESULT_FLUSH_MS, self.flush_results)
     
-    def update_display(self):
-        """更新显示"""
-        # 清空列表
-        for item in self.stock_tree.get_children():
-            self.stock_tree.delete(item)
-        for item in self.up_list.get_children():
-            self.up_list.delete(item)
-        for item in self.down_list.get_children():
-            self.down_list.delete(item)
-        
-        if not self.recommendations:
-            self.status_var.set("无推荐数据")
+    def flush_results(self):
+        """取出队列中已完成的结果，批量插入列表并增量更新排行榜"""
+        finished = False
+        rankings_changed = False
+        for _ in range(RESULT_BATCH_SIZE):
+            try:
+                item = self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                finished = True
+                break
+            code, rec = item
+            self.recommendations[code] = rec
+            self.insert_recommendation(code, rec)
+            rankings_changed |= self.push_ranking(code, rec)
+        
+        if rankings_changed:
+            self.update_rankings()
+        
+        if not finished:
+            self.status_var.set(f"正在分析股票数据... 已完成{len(self.recommendations)}只")
+            self.after(RESULT_FLUSH_MS, self.flush_results)
             return
         
-        # 更新主列表
-        for code, rec in self.recommendations.items():
-            probability = rec['probability']
-            confidence = rec['confidence']
-            
-            # 格式化显示
-            prob_text = f"{probability:.1f}%"
-            conf_text = f"{confidence:.1f}%"
-            price_text = f"{rec['current_price']:.2f}"
-            
-            # 设置颜色标签
-            if probability > 60:
-                tag = "strong_up"
-            elif probability > 50:
-                tag = "up"
-            elif probability < 40:
-                tag = "strong_down"
-            else:
-                tag = "down"
-            
-            self.stock_tree.insert('', tk.END, 
-                                 values=(code, rec['name'], price_text, prob_text, 
-                                        conf_text, rec['reason']), 
-                                 tags=(tag,))
-        
-        # 设置颜色
-        self.stock_tree.tag_configure('strong_up', foreground='#ff6b6b')
-        self.stock_tree.tag_configure('up', foreground='#ffa8a8')
-        self.stock_tree.tag_configure('strong_down', foreground='#51cf66')
-        self.stock_tree.tag_configure('down', foreground='#8ce99a')
-        
-        # 更新排行榜
-        self.update_rankings()
+        self.refresh_btn.config(state=tk.NORMAL)
+        if self.analysis_error is not None:
+            self.status_var.set(f"分析失败: {self.analysis_error}")
+        elif not self.recommendations:
+            self.status_var.set("无推荐数据")
+        else:
+            self.status_var.set(f"分析完成，共{len(self.recommendations)}只股票")
+    
+    def insert_recommendation(self, code, rec):
+        """在推荐列表中插入一行"""
+        probability = rec['probability']
+        confidence = rec['confidence']
+        
+        # 格式化显示
+        prob_text = f"{probability:.1f}%"
+        conf_text = f"{confidence:.1f}%"
+        price_text = f"{rec['current_price']:.2f}"
+        
+        # 设置颜色标签
+        if probability > 60:
+            tag = "strong_up"
+        elif probability > 50:
+            tag = "up"
+        elif probability < 40:
+            tag = "strong_down"
+        else:
+            tag = "down"
         
-        self.status_var.set(f"分析完成，共{len(self.recommendations)}只股票")
+        self.stock_tree.insert('', tk.END, 
+                             values=(code, rec['name'], price_text, prob_text, 
+                                    conf_text, rec['reason']), 
+                             tags=(tag,))
+    
+    def push_ranking(self, code, rec):
+        """
+        把一只股票放入看涨/看跌前五的小顶堆
+        :return: 前五是否发生变化
+        """
+        probability = float(rec['probability'])
+        if probability > 50:
+            heap, key = self.up_heap, (probability, code)
+        elif probability < 50:
+            # 看跌按概率从低到高排，取负后同样保留最大的五个
+            heap, key = self.down_heap, (-probability, code)
+        else:
+            return False
+        if len(heap) < RANKING_SIZE:
+            heapq.heappush(heap, key)
+            return True
+        if key > heap[0]:
+            heapq.heapreplace(heap, key)
+            return True
+        return False
     
     def update_rankings(self):
-        """更新排行榜"""
-        # 按涨跌概率排序
-        sorted_stocks = sorted(self.recommendations.items(), 
-                             key=lambda x: x[1]['probability'], reverse=True)
+        """按堆中的前五重绘排行榜"""
+        for tree in (self.up_list, self.down_list):
+            for item in tree.get_children():
+                tree.delete(item)
         
         # 看涨前五（概率最高的）
-        up_stocks = [stock for stock in sorted_stocks if stock[1]['probability'] > 50][:5]
-        for code, rec in up_stocks:
+        for _, code in sorted(self.up_heap, reverse=True):
+            rec = self.recommendations[code]
             stock_name = f"{rec['name']}({code})"
             prob_text = f"{rec['probability']:.1f}%"
             self.up_list.insert('', tk.END, values=(stock_name, prob_text))
         
         # 看跌前五（概率最低的）
-        down_stocks = sorted([stock for stock in sorted_stocks if stock[1]['probability'] < 50], 
-                           key=lambda x: x[1]['probability'])[:5]
-        for code, rec in down_stocks:
+        for _, code in sorted(self.down_heap, reverse=True):
+            rec = self.recommendations[code]
             stock_name = f"{rec['name']}({code})"
             prob_text = f"{100 - rec['probability']:.1f}%"  # 显示跌的概率
-            self.down_list.insert('', tk.END, values=(stock_name, prob_text)) 
\ No newline at end of file
+            self.down_list.insert('', tk.END, values=(stock_name, prob_text))
@@ -0,0 +1,162 @@
+import time
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .config import get_config
+
+# 一根K线代表的交易时长（秒）：60分钟线为1小时，日K线按一个交易日4小时的连续竞价计算
+BAR_SECONDS = {"60min": 3600, "d": 4 * 3600}
+
+# 日K线的行情时间取收盘时刻
+DAILY_CLOSE = (15, 0)
+
+
+class ReplayClock:
+    """
+    行情回放时钟：把录制在磁盘上的日K线或60分钟线按市场时间顺序逐根推送给模拟器
+
+    speed 是市场时间相对真实时间的倍数：1 表示与真实行情同速（60分钟线每小时推送一次），
+    60 表示一分钟走完一小时，0 表示不等待、尽快推送。K线之间的隔夜和周末不计时间。
+    每根K线的推送时刻从开始回放的时间起算，处理慢了会追赶，不会把延迟累积下去。
+    """
+
+    def __init__(self, provider, codes, start, end, interval="d", speed=1.0, stop=None):
+        """
+        :param provider: 提供录制行情的 MarketDataProvider（通常是 LocalFileProvider）
+        :param codes: 回放的股票代码
+        :param start: 开始时间（datetime），早于它的K线只用来计算第一根K线的涨跌幅
+        :param end: 结束时间（datetime）
+        :param interval: "d"（日K线）或 "60min"（60分钟线）
+        :param speed: 速度倍数，0 表示尽快推送
+        :param stop: 停止回放的 threading.Event，调用方可以在时钟创建之前就持有它，默认新建
+        """
+        if interval not in BAR_SECONDS:
+            raise ValueError(f"不支持的回放周期: {interval}")
+        self.provider = provider
+        self.interval = interval
+        self.speed = float(speed or 0)
+        self.timeline = self._load(list(codes), start, end)  # [(市场时间, {code: 行情})]
+        self.position = 0  # 已推送的K线数
+        self.market_time = None
+        self.elapsed = 0.0
+        self.max_lag = 0.0     # 推送时刻最多比计划晚了多少秒
+        self.latencies = []    # 每次推送的处理耗时（秒）
+        self._stop = stop if stop is not None else threading.Event()
+
+    def _load(self, codes, start, end):
+        """读取全部股票的K线，按时间合并成时间线"""
+        lookback = start - timedelta(days=10)
+        frames = []
+        for code in codes:
+            try:
+                if self.interval == "d":
+                    df = self.provider.fetch_daily_bars(code, lookback.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+                    times = pd.to_datetime(df["date"]) + pd.Timedelta(hours=DAILY_CLOSE[0], minutes=DAILY_CLOSE[1])
+                else:
+                    df = self.provider.fetch_hourly_bars(code, lookback, end)
+                    times = pd.to_datetime(df["date"])
+            except Exception as e:
+                print(f"行情回放: 读取 {code} 的K线失败: {e}")
+                continue
+            if df.empty:
+                continue
+            close = df["close"].to_numpy(dtype=np.float64)
+            if self.interval == "d":
+                prev_close = np.concatenate(([np.nan], close[:-1]))
+            else:
+                # 60分钟线的涨跌幅相对上一交易日最后一根K线的收盘价
+                days = times.dt.normalize().to_numpy()
+                day_close = pd.Series(close).groupby(days).last()
+                prev_close = day_close.shift(1).reindex(days).to_numpy()
+            frames.append(pd.DataFrame({"code": code, "time": times.to_numpy(), "close": close,
+                                        "prev_close": prev_close, "volume": df["volume"].to_numpy()}))
+        if not frames:
+            return []
+
+        bars = pd.concat(frames, ignore_index=True)
+        bars = bars[(bars["time"] >= start) & (bars["time"] <= end) & bars["close"].notna()]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = np.round((bars["close"].to_numpy() / bars["prev_close"].to_numpy() - 1) * 100, 2)
+        bars = bars.assign(change=np.nan_to_num(change, nan=0.0, posinf=0.0, neginf=0.0)).sort_values("time", kind="stable")
+
+        timeline = []
+        for market_time, group in bars.groupby("time", sort=True):
+            market_time = market_time.to_pydatetime()
+            time_str = market_time.strftime("%Y-%m-%d %H:%M:%S")
+            quotes = {
+                code: {"price": price, "change": change, "volume": volume, "source": "replay", "time": time_str}
+                for code, price, change, volume in zip(group["code"].tolist(), group["close"].tolist(),
+                                                       group["change"].tolist(), group["volume"].tolist())
+            }
+            timeline.append((market_time, quotes))
+        return timeline
+
+    def __len__(self):
+        return len(self.timeline)
+
+    def run(self, on_tick):
+        """
+        按速度逐根推送，直到回放结束或调用 stop()
+        :param on_tick: on_tick(市场时间, {code: 行情})，在调用 run 的线程中执行
+        :return: 本次推送的K线数
+        """
+        interval = BAR_SECONDS[self.interval] / self.speed if self.speed > 0 else 0.0
+        begin = time.perf_counter()
+        first = self.position
+        while self.position < len(self.timeline) and not self._stop.is_set():
+            if interval:
+                wait = begin + (self.position - first) * interval - time.perf_counter()
+                if wait > 0:
+                    if self._stop.wait(wait):
+                        break
+                else:
+                    self.max_lag = max(self.max_lag, -wait)
+            market_time, quotes = self.timeline[self.position]
+            tick_start = time.perf_counter()
+            on_tick(market_time, quotes)
+            self.latencies.append(time.perf_counter() - tick_start)
+            self.market_time = market_time
+            self.position += 1
+        self.elapsed += time.perf_counter() - begin
+        return self.position - first
+
+    def stop(self):
+        """停止回放（可在任意线程调用），已推送的进度保留"""
+        self._stop.set()
+
+    @property
+    def finished(self):
+        return self.position >= len(self.timeline)
+
+    def stats(self):
+        latencies = np.asarray(self.latencies) * 1000
+        return {
+            "ticks": self.position,
+            "total": len(self.timeline),
+            "market_time": self.market_time.strftime("%Y-%m-%d %H:%M") if self.market_time else None,
+            "elapsed": self.elapsed,
+            "max_lag": self.max_lag,
+            "tick_p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "tick_p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        }
+
+
+def create_replay_clock(codes, provider=None, speed=None, stop=None):
+    """
+    按系统配置创建回放时钟：默认回放 replay_dir（未设置时为 market_data_dir）中录制的K线
+    :param speed: 速度倍数，默认为 replay_speed
+    :param stop: 停止回放的 threading.Event
+    """
+    from .data_providers import LocalFileProvider
+
+    config = get_config()
+    provider = provider or LocalFileProvider(config["replay_dir"] or config["market_data_dir"])
+    end = datetime.strptime(config["replay_end"], "%Y-%m-%d") + timedelta(days=1) if config["replay_end"] \
+        else datetime.now()
+    start = datetime.strptime(config["replay_start"], "%Y-%m-%d") if config["replay_start"] else \
+        end - timedelta(days=config["replay_days"])
+    return ReplayClock(provider, codes, start, end, config["replay_interval"],
+                       config["replay_speed"] if speed is None else speed, stop)
@@ -0,0 +1,129 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .indicators import BarPanel, DEFAULT_THRESHOLDS
+from .indicator_registry import required_fields, score_panel
+
+
+def _attach(name):
+    """在子进程中按名称映射共享内存块，由父进程负责释放"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.13 之前没有 track 参数；进程池子进程与父进程共用资源跟踪器，重复登记不影响父进程释放
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedPanel:
+    """
+    放在共享内存中的K线面板：子进程按名称直接映射各字段（收盘价、成交量……）的数组，不需要序列化 DataFrame
+
+    由父进程创建和释放（close），子进程只通过 descriptor() 描述的名称和形状读取。
+    """
+
+    def __init__(self, panel):
+        self.codes = panel.codes
+        self.shape = next(iter(panel.fields.values())).shape
+        self._blocks = {}
+        try:
+            for field in tuple(panel.fields) + ("lengths",):
+                source = panel.lengths if field == "lengths" else panel[field]
+                block = shared_memory.SharedMemory(create=True, size=max(source.nbytes, 1))
+                self._blocks[field] = block
+                np.ndarray(source.shape, dtype=source.dtype, buffer=block.buf)[...] = source
+        except Exception:
+            self.close()
+            raise
+
+    def descriptor(self):
+        """子进程映射面板所需的信息（可被 pickle）"""
+        return {"shape": self.shape, "blocks": {field: block.name for field, block in self._blocks.items()}}
+
+    def close(self):
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+        self._blocks = {}
+
+
+def _score_shard(descriptor, start, stop, weights, thresholds):
+    """
+    子进程：对共享面板中第 start 到 stop 列的股票打分
+    :return: (start, [(上涨概率, 推荐理由)])
+    """
+    height, width = descriptor["shape"]
+    blocks = {field: _attach(name) for field, name in descriptor["blocks"].items()}
+    try:
+        lengths = np.ndarray((width,), dtype=np.int64, buffer=blocks["lengths"].buf)[start:stop].copy()
+        arrays = {field: np.ndarray((height, width), dtype=np.float64, buffer=block.buf)[:, start:stop]
+                  for field, block in blocks.items() if field != "lengths"}
+        # 只有最后 max(lengths) 行有数据
+        top = height - int(lengths.max())
+        panel = BarPanel.from_arrays(range(start, stop), {f: a[top:] for f, a in arrays.items()}, lengths)
+        scores = [(float(probability), reason) for probability, reason in score_panel(panel, weights, thresholds)]
+        del arrays, panel  # 释放对共享内存的引用后才能关闭映射
+        return start, scores
+    finally:
+        for block in blocks.values():
+            block.close()
+
+
+class ParallelScorer:
+    """
+    多进程推荐打分：把股票按列分片，每个分片在进程池中独立计算，分片完成后立即产出结果
+
+    进程池在第一次使用时创建并一直复用，避免每次刷新都重新启动子进程。
+    """
+
+    def __init__(self, max_workers=0, shard_size=500):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.shard_size = shard_size
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # 界面进程有多个线程，使用 spawn 启动子进程，避免 fork 复制线程持有的锁
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def iter_scores(self, frames, weights, thresholds=DEFAULT_THRESHOLDS):
+        """
+        :param frames: {code: DataFrame}，按日期升序
+        :return: 生成器，每个分片完成时产出该分片的 {code: (上涨概率, 推荐理由)}
+        """
+        empty = {code: (0, "数据不足") for code, df in frames.items() if df is None or df.empty}
+        if empty:
+            yield empty
+        valid = {code: df for code, df in frames.items() if code not in empty}
+        if not valid:
+            return
+
+        # 只把 weights 中的指标用到的字段放进共享内存
+        shared = SharedPanel(BarPanel(valid, required_fields(weights)))
+        try:
+            descriptor = shared.descriptor()
+            pool = self._get_pool()
+            futures = [pool.submit(_score_shard, descriptor, start, min(start + self.shard_size, len(valid)),
+                                   weights, thresholds)
+                       for start in range(0, len(valid), self.shard_size)]
+            for future in as_completed(futures):
+                start, scores = future.result()
+                yield dict(zip(shared.codes[start:start + len(scores)], scores))
+        finally:
+            shared.close()
+
+    def score(self, frames, weights, thresholds=DEFAULT_THRESHOLDS):
+        """全部分片完成后返回 {code: (上涨概率, 推荐理由)}"""
+        results = {}
+        for shard in self.iter_scores(frames, weights, thresholds):
+            results.update(shard)
+        return results
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
@@ -1,10 +1,19 @@
+import os
 import pandas as pd
 import random
 import time
+import threading
 import requests
 from datetime import datetime, timedelta
 from .database import db
-import akshare as ak
+from .bar_cache import BarStore
+from .frame_cache import DataFrameLRU
+from .fetch_engine import FetchReport, create_fetch_engine
+from .market_gateway import gateway, PRIORITY_QUOTES
+from .data_providers import create_provider, to_ak_code
+from .streaming import IndicatorBook
+from .quote_service import QuoteService
+from .config import get_config
 
 class StockDataManager:
     """股票数据管理类，用于获取和更新股票数据"""
@@ -13,9 +22,79 @@ class StockDataManager:
         """初始化股票数据管理器"""
         # self.logged_in = False  # AKShare 通常不需要登录状态
         # self.login() # AKShare 通常不需要显式登录
-        # 初始化时同步一次数据库中的股票价格
         self.hourly_period_minutes = 60 # 新增：初始化每小时图表的分钟数周期
-        self.sync_stock_prices()
+        config = get_config()
+        # 并发获取引擎，所有AKShare请求都经过它限流和重试
+        self.fetch_engine = create_fetch_engine()
+        # 行情数据提供者（AKShare/本地文件/模拟行情），由 market_data_provider 配置选择
+        self.provider = create_provider(self.fetch_engine, lambda: list(db.get_stocks()))
+        # 本地K线缓存，重复的历史数据请求直接从磁盘读取；离线数据与联网数据分开缓存，切换提供者后不会混用
+        bar_cache_path = config["bar_cache_path"]
+        if self.provider.name != "akshare":
+            root, ext = os.path.splitext(bar_cache_path)
+            bar_cache_path = f"{root}.{self.provider.name}{ext}"
+        self.bar_store = BarStore(bar_cache_path, config["bar_cache_today_ttl"])
+        # 最近查看过的图表数据，按 DataFrame 字节数限制内存占用
+        self.chart_cache = DataFrameLRU(int(config["chart_cache_max_mb"] * 1024 * 1024),
+                                        ttl=config["chart_cache_ttl"],
+                                        trading_ttl=config["chart_cache_trading_ttl"])
+        # 各股票的流式指标状态，随K线缓存持久化，新行情到达时增量更新
+        self.indicators = IndicatorBook(self.bar_store, config["rsi_method"])
+        # 全市场实时行情快照，手动刷新、自动刷新等并发请求共用一次下载
+        self.quotes = QuoteService(self._request_spot_board, config["spot_snapshot_max_age"])
+        # 最近一次和累计的实时行情来源统计 {"spot", "cache", "database", "missing": 股票数}
+        self.quote_tiers = {}
+        self.quote_tier_totals = {}
+        # 初始化时不再联网同步，由界面调用 start_warmup() 在后台同步股票价格
+        self._warmup_lock = threading.Lock()
+        self._warmup_thread = None
+        self._warmup_subscribers = []
+        self.warmup_done = threading.Event()
+        self.warmup_result = None  # (同步报告, 异常)
+
+    def start_warmup(self):
+        """在后台线程中同步一次数据库股票价格，重复调用不会重复启动"""
+        with self._warmup_lock:
+            if self._warmup_thread is not None:
+                return
+            self._warmup_thread = threading.Thread(target=self._run_warmup, name="stock-warmup", daemon=True)
+            self._warmup_thread.start()
+
+    def _run_warmup(self):
+        start = time.perf_counter()
+        report, error = None, None
+        try:
+            report = self.sync_stock_prices()
+        except Exception as e:
+            error = e
+            print(f"行情预热失败: {e}")
+        print(f"行情预热结束，耗时 {time.perf_counter() - start:.2f}s")
+
+        with self._warmup_lock:
+            self.warmup_result = (report, error)
+            self.warmup_done.set()
+            subscribers, self._warmup_subscribers = self._warmup_subscribers, []
+        for callback in subscribers:
+            self._notify_warmup(callback, report, error)
+
+    def _notify_warmup(self, callback, report, error):
+        try:
+            callback(report, error)
+        except Exception as e:
+            print(f"行情预热回调出错: {e}")
+
+    def subscribe_warmup(self, callback):
+        """
+        订阅后台预热完成事件
+        :param callback: callback(report, error)，在预热线程中调用，更新界面需切回主线程；
+                         订阅时预热已完成则立即调用
+        """
+        with self._warmup_lock:
+            if not self.warmup_done.is_set():
+                self._warmup_subscribers.append(callback)
+                return
+            report, error = self.warmup_result
+        self._notify_warmup(callback, report, error)
     
     # def login(self): # AKShare 通常不需要显式登录
     #     """登录BaoStock"""
@@ -36,12 +115,12 @@ class StockDataManager:
     #         self.logged_in = False
     
     def sync_stock_prices(self):
-        """使用 AKShare 同步数据库中的股票价格至最近的交易日收盘价，并计算涨跌幅"""
+        """使用 AKShare 并发同步数据库中的股票价格至最近的交易日收盘价，并计算涨跌幅"""
         print("AKShare: 正在同步数据库股票价格至最新收盘价...")
         all_db_stocks = db.get_stocks()
         if not all_db_stocks:
             print("AKShare: 数据库中没有股票数据可供同步")
-            return
+            return None
 
         # 获取今天和几天前的日期，用于查询历史数据
         today_dt = datetime.now()
@@ -51,148 +130,115 @@ class StockDataManager:
         today_str = today_dt.strftime("%Y-%m-%d")
         start_date_hist_str = start_date_hist_dt.strftime("%Y-%m-%d")
 
-        for bs_code, db_stock_info in all_db_stocks.items():
-            print(f"AKShare: 开始同步 {bs_code}...")
-            try:
-                # 使用 get_stock_data 获取最近的历史数据
-                # adjustflag="2" (hfq, 后复权) 通常用于计算准确的连续价格变化
-                # adjustflag="3" (不复权) 用于获取原始收盘价
-                # 这里我们用不复权价格来获取特定日期的收盘价
-                hist_df = self.get_stock_data(code=bs_code, 
-                                              start_date=start_date_hist_str, 
-                                              end_date=today_str,
-                                              frequency="d",
-                                              adjustflag="3")
-
-                if hist_df is not None and not hist_df.empty and len(hist_df) >= 1:
-                    # 获取最新的有效交易日数据作为 new_price
-                    latest_trade_day_data = hist_df.iloc[-1]
-                    new_price = float(latest_trade_day_data['close'])
-                    new_price_date = latest_trade_day_data['date']
-                    calculated_change = 0.0
-
-                    # 如果有至少两个交易日的数据，计算涨跌幅
-                    if len(hist_df) >= 2:
-                        prev_trade_day_data = hist_df.iloc[-2]
-                        prev_close = float(prev_trade_day_data['close'])
-                        if prev_close > 0:
-                            calculated_change = round(((new_price - prev_close) / prev_close) * 100, 2)
-                        print(f"AKShare: {bs_code} - 最新收盘价: {new_price} ({new_price_date}), 前一收盘价: {prev_close}, 计算涨跌幅: {calculated_change}%")
-                    else:
-                        # 只有一个交易日的数据，无法计算涨跌幅，尝试使用数据库旧值或设为0
-                        calculated_change = db_stock_info.get("change", 0.0)
-                        print(f"AKShare: {bs_code} - 仅有1条历史数据，最新收盘价: {new_price} ({new_price_date}), 使用旧涨跌幅: {calculated_change}%")
-
-                    stock_to_save = {
-                        "name": db_stock_info.get("name", ""),
-                        "price": new_price,
-                        "change": calculated_change
-                    }
-                    db.update_stock(bs_code, stock_to_save)
-                    print(f"AKShare: 已同步 {bs_code} 至数据库 - 价格: {new_price}, 涨跌幅: {calculated_change}%")
-                else:
-                    print(f"AKShare: 未能获取 {bs_code} 的有效历史数据进行同步，保留数据库原值。")
-            except Exception as e:
-                print(f"AKShare: 同步 {bs_code} 价格失败: {e}")
-                import traceback
-                traceback.print_exc()
-        
-        print("AKShare: 数据库股票价格同步完成 (基于最新收盘价)")
+        def sync_one(bs_code):
+            """获取一只股票的最新收盘价和涨跌幅，获取不到时返回None"""
+            db_stock_info = all_db_stocks[bs_code]
+            # 使用 get_stock_data 获取最近的历史数据
+            # adjustflag="2" (hfq, 后复权) 通常用于计算准确的连续价格变化
+            # adjustflag="3" (不复权) 用于获取原始收盘价
+            # 这里我们用不复权价格来获取特定日期的收盘价
+            hist_df = self.get_stock_data(code=bs_code, 
+                                          start_date=start_date_hist_str, 
+                                          end_date=today_str,
+                                          frequency="d",
+                                          adjustflag="3")
+
+            if hist_df is None or hist_df.empty:
+                print(f"AKShare: 未能获取 {bs_code} 的有效历史数据进行同步，保留数据库原值。")
+                return None
+
+            # 把新的日K线增量计入推荐指标
+            self.indicators.update_from_frame(bs_code, hist_df)
+
+            # 获取最新的有效交易日数据作为 new_price
+            latest_trade_day_data = hist_df.iloc[-1]
+            new_price = float(latest_trade_day_data['close'])
+            new_price_date = latest_trade_day_data['date']
+            calculated_change = 0.0
+
+            # 如果有至少两个交易日的数据，计算涨跌幅
+            if len(hist_df) >= 2:
+                prev_trade_day_data = hist_df.iloc[-2]
+                prev_close = float(prev_trade_day_data['close'])
+                if prev_close > 0:
+                    calculated_change = round(((new_price - prev_close) / prev_close) * 100, 2)
+                print(f"AKShare: {bs_code} - 最新收盘价: {new_price} ({new_price_date}), 前一收盘价: {prev_close}, 计算涨跌幅: {calculated_change}%")
+            else:
+                # 只有一个交易日的数据，无法计算涨跌幅，尝试使用数据库旧值或设为0
+                calculated_change = db_stock_info.get("change", 0.0)
+                print(f"AKShare: {bs_code} - 仅有1条历史数据，最新收盘价: {new_price} ({new_price_date}), 使用旧涨跌幅: {calculated_change}%")
+
+            return {
+                "name": db_stock_info.get("name", ""),
+                "price": new_price,
+                "change": calculated_change
+            }
+
+        def timed_sync(bs_code):
+            start = time.perf_counter()
+            return sync_one(bs_code), time.perf_counter() - start
+
+        # 通过请求网关并发获取，计入网关的全局并发上限；网络请求由获取引擎按上游限流和重试
+        results, errors, latencies = {}, {}, {}
+        batch_start = time.perf_counter()
+        for bs_code, result, error in gateway.imap(timed_sync, list(all_db_stocks.keys()),
+                                                   key=lambda code: ("sync", code), priority=PRIORITY_QUOTES):
+            if error is not None:
+                errors[bs_code] = error
+                latencies[bs_code] = time.perf_counter() - batch_start
+            else:
+                results[bs_code], latencies[bs_code] = result
+        report = FetchReport(results, errors, latencies, time.perf_counter() - batch_start)
+        for bs_code, e in report.errors.items():
+            print(f"AKShare: 同步 {bs_code} 价格失败: {e}")
+
+        # 收集所有股票的新价格，一次性写入数据库
+        stocks_to_save = {code: info for code, info in report.results.items() if info is not None}
+        db.update_stocks(stocks_to_save)
+        self.indicators.save()
+        print(f"AKShare: 数据库股票价格同步完成 (基于最新收盘价)，共更新 {len(stocks_to_save)} 只；{report.summary()}")
+        return report
     
     def get_stock_hourly_data(self, code, lookback_hours=24):
         """
-        获取股票或指数最近N个小时的60分钟线数据 (使用 AKShare)
+        获取股票或指数最近N个小时的60分钟线数据
         :param code: 股票或指数代码，如"sh.600000" 或 "sh.000001"
         :param lookback_hours: 希望回溯的小时数，将转换为数据点数量 (1小时1个点)
         :return: DataFrame格式的股票数据
         """
-        original_code_str = str(code) 
-        api_symbol_numeric = self._convert_bs_to_ak_code(original_code_str) 
-        
-        # 使用完整的代码（带前缀）来判断是否为我们关心的指数
-        # 例如: 上证指数 "sh.000001", 深证成指 "sz.399001", 沪深300 "sh.000300", 创业板指 "sz.399006"
-        known_full_index_codes = []
-        is_index = original_code_str in known_full_index_codes
+        original_code_str = str(code)
+        cache_key = (original_code_str, "60min", lookback_hours)
+        cached = self.chart_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
         end_date_dt = datetime.now()
-        ak_end_date_str = end_date_dt.strftime('%Y-%m-%d %H:%M:%S')
-        ak_start_date_str = (end_date_dt - timedelta(days=10)).strftime('%Y-%m-%d %H:%M:%S')
-
-        df = None
-        api_attempted_symbol = ""
         try:
-            if is_index:
-                api_attempted_symbol = original_code_str.replace('.', '')
-                print(f"AKShare (Index): 获取 {api_attempted_symbol} ({original_code_str}) 60分钟线数据, 从 {ak_start_date_str} 到 {ak_end_date_str}")
-                df = ak.index_zh_a_hist_min_em(symbol=api_attempted_symbol,
-                                                start_date=ak_start_date_str, 
-                                                end_date=ak_end_date_str, 
-                                                period='60')
-            else:
-                api_attempted_symbol = api_symbol_numeric
-                print(f"AKShare (Stock): 获取 {api_attempted_symbol} ({original_code_str}) 60分钟线数据, 从 {ak_start_date_str} 到 {ak_end_date_str}")
-                df = ak.stock_zh_a_hist_min_em(symbol=api_attempted_symbol,
-                                                start_date=ak_start_date_str, 
-                                                end_date=ak_end_date_str, 
-                                                period='60', 
-                                                adjust='qfq')
-            
-            if df is None or df.empty:
-                data_type = "指数" if is_index else "股票"
-                print(f"AKShare: 未获取到{data_type} {original_code_str} 的60分钟线数据 ({api_attempted_symbol})，或返回为空/None。")
-                return pd.DataFrame()
-
-            rename_map = {
-                "时间": "date", 
-                "开盘": "open",
-                "收盘": "close",
-                "最高": "high",
-                "最低": "low",
-                "成交量": "volume",
-                "成交额": "amount"
-            }
-            df.rename(columns=rename_map, inplace=True)
-
-            if 'date' not in df.columns:
-                print(f"AKShare: 60分钟数据缺少 '时间' ('date') 列 for {original_code_str} ({api_attempted_symbol})")
-                return pd.DataFrame()
-            df['date'] = pd.to_datetime(df['date'])
-            
-            required_plot_cols = ['date', 'open', 'high', 'low', 'close'] 
-            if not all(col in df.columns for col in required_plot_cols):
-                missing_cols = [col for col in required_plot_cols if col not in df.columns]
-                print(f"错误: {original_code_str} ({api_attempted_symbol}) 的60分钟K线数据缺少绘图必要列: {missing_cols}。拥有列: {df.columns}")
-                return pd.DataFrame()
-
-            df.sort_values(by='date', inplace=True)
-
-            if len(df) >= lookback_hours:
-                df_filtered = df.tail(lookback_hours).copy()
-            else:
-                df_filtered = df.copy()
-                print(f"AKShare: {original_code_str} ({api_attempted_symbol}) 60分钟数据不足 {lookback_hours} 条，返回实际获取的 {len(df_filtered)} 条")
-            
-            df_filtered.loc[:, 'code'] = original_code_str 
-
-            final_columns = ['date', 'code', 'open', 'high', 'low', 'close', 'volume', 'amount']
-            existing_final_columns = [col for col in final_columns if col in df_filtered.columns]
-            df_to_return = df_filtered[existing_final_columns]
-
-            print(f"AKShare: 成功获取并处理了 {original_code_str} 的 {len(df_to_return)} 条60分钟线数据")
-            return df_to_return
-
+            df = self.provider.fetch_hourly_bars(original_code_str, end_date_dt - timedelta(days=10), end_date_dt)
         except Exception as e:
-            data_type = "指数" if is_index else "股票"
-            print(f"AKShare: 获取{data_type}60分钟线数据 {original_code_str} ({api_attempted_symbol}) 异常: {e}")
+            print(f"{self.provider.name}: 获取60分钟线数据 {original_code_str} 异常: {e}")
             import traceback
             traceback.print_exc()
             return pd.DataFrame()
 
+        if df.empty:
+            print(f"{self.provider.name}: 未获取到 {original_code_str} 的60分钟线数据")
+            return pd.DataFrame()
+
+        if len(df) >= lookback_hours:
+            df_filtered = df.tail(lookback_hours).copy()
+        else:
+            df_filtered = df.copy()
+            print(f"{self.provider.name}: {original_code_str} 60分钟数据不足 {lookback_hours} 条，返回实际获取的 {len(df_filtered)} 条")
+        df_filtered.insert(1, 'code', original_code_str)
+
+        print(f"{self.provider.name}: 成功获取并处理了 {original_code_str} 的 {len(df_filtered)} 条60分钟线数据")
+        self.chart_cache.put(cache_key, df_filtered)
+        return df_filtered
+
     def _convert_bs_to_ak_code(self, bs_code):
         """将BaoStock的股票代码 (如 sh.600000) 转换为AKShare的6位代码 (如 600000)"""
-        if isinstance(bs_code, str) and '.' in bs_code:
-            return bs_code.split('.')[1]
-        return bs_code # 如果格式不符合预期，返回原值
+        return to_ak_code(bs_code)
 
     def _convert_ak_to_bs_code(self, ak_code, original_bs_code_prefix=None):
         """将AKShare的6位代码转换为BaoStock的股票代码，需要原始前缀辅助判断市场"""
@@ -208,7 +254,7 @@ class StockDataManager:
 
     def get_stock_data(self, code, start_date=None, end_date=None, frequency="d", adjustflag="3"):
         """
-        获取股票历史数据 (使用 AKShare)
+        获取股票历史数据，优先从本地K线缓存读取，只联网获取缓存中缺失的日期区间
         :param code: 股票代码，如"sh.600000"
         :param start_date: 开始日期，格式YYYY-MM-DD，默认为30天前
         :param end_date: 结束日期，格式YYYY-MM-DD，默认为今天
@@ -216,88 +262,51 @@ class StockDataManager:
         :param adjustflag: 复权类型，1=前复权，2=后复权，3=不复权，默认为3
         :return: DataFrame格式的股票数据
         """
-        ak_code = self._convert_bs_to_ak_code(code)
-        original_bs_prefix = code.split('.')[0] if '.' in code else None
-
-        # 设置默认日期
         if not end_date:
-            end_date_dt = datetime.now()
-            end_date = end_date_dt.strftime("%Y-%m-%d")
-        else:
-            end_date_dt = datetime.strptime(end_date, "%Y-%m-%d")
-        
+            end_date = datetime.now().strftime("%Y-%m-%d")
         if not start_date:
-            start_date_dt = datetime.now() - timedelta(days=30)
-            start_date = start_date_dt.strftime("%Y-%m-%d")
-        else:
-            start_date_dt = datetime.strptime(start_date, "%Y-%m-%d")
-
-        # AKShare 日期格式 YYYYMMDD
-        ak_start_date = start_date_dt.strftime("%Y%m%d")
-        ak_end_date = end_date_dt.strftime("%Y%m%d")
+            start_date = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
 
-        # 转换 frequency
-        ak_period_map = {"d": "daily", "w": "weekly", "m": "monthly"}
-        ak_period = ak_period_map.get(frequency, "daily")
+        cache_key = (code, frequency, str(adjustflag), start_date, end_date)
+        cached = self.chart_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-        # 转换 adjustflag
-        ak_adjust_map = {"1": "qfq", "2": "hfq", "3": ""}
-        ak_adjust = ak_adjust_map.get(str(adjustflag), "")
+        def fetch(range_start, range_end):
+            return self._fetch_stock_data(code, range_start, range_end, frequency, adjustflag)
 
         try:
-            print(f"AKShare: 获取 {ak_code} 从 {ak_start_date} 到 {ak_end_date}, period: {ak_period}, adjust: {ak_adjust}")
-            df = ak.stock_zh_a_hist(symbol=ak_code,
-                                     period=ak_period,
-                                     start_date=ak_start_date,
-                                     end_date=ak_end_date,
-                                     adjust=ak_adjust)
-            
-            if df.empty:
-                print(f"AKShare: 未获取到股票 {ak_code} 的数据")
-                return pd.DataFrame()
-
-            # 重命名列以匹配之前的格式 (baostock)
-            # AKShare 列名: 日期, 开盘, 收盘, 最高, 最低, 成交量, 成交额, 振幅, 涨跌幅, 涨跌额, 换手率
-            rename_map = {
-                "日期": "date",
-                "开盘": "open",
-                "收盘": "close",
-                "最高": "high",
-                "最低": "low",
-                "成交量": "volume",
-                "成交额": "amount",
-                # "涨跌幅": "pctChange", # baostock 没有直接的涨跌幅，通常是计算得到
-                # "换手率": "turnoverRatio"
-            }
-            df.rename(columns=rename_map, inplace=True)
-
-            # 添加原始的 'code' 和 'adjustflag' 列，保持与baostock输出的兼容性
-            df['code'] = self._convert_ak_to_bs_code(ak_code, original_bs_prefix) 
-            df['adjustflag'] = adjustflag 
-
-            # 筛选我们需要的列，并确保数据类型正确
-            required_columns = ['date', 'code', 'open', 'high', 'low', 'close', 'volume', 'amount', 'adjustflag']
-            # 有些数据可能不存在，例如刚上市的股票可能没有成交额
-            existing_required_columns = [col for col in required_columns if col in df.columns]
-            df = df[existing_required_columns]
-
-            for field in ['open', 'high', 'low', 'close', 'volume', 'amount']:
-                if field in df.columns:
-                    df[field] = pd.to_numeric(df[field], errors='coerce')
-            
-            # 将 'date' 列转换为 YYYY-MM-DD 格式
-            if 'date' in df.columns:
-                 df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
-
-            print(f"AKShare: 成功获取并处理了 {code} 的数据, 共 {len(df)} 条")
-            return df
-
+            df = self.bar_store.get_bars(code, frequency, adjustflag, start_date, end_date, fetch)
         except Exception as e:
-            print(f"AKShare: 获取股票数据 {code} ({ak_code}) 异常: {e}")
-            # 打印更详细的错误信息，比如AKShare可能的网络错误或API限制
+            print(f"{self.provider.name}: 获取股票数据 {code} 异常: {e}，使用本地缓存数据")
+            # 打印更详细的错误信息，比如网络错误或接口限制
             import traceback
             traceback.print_exc()
+            df = self.bar_store.read(code, frequency, adjustflag, start_date, end_date)
+
+        if df.empty:
+            print(f"K线缓存: 未获取到股票 {code} 的数据")
             return pd.DataFrame()
+
+        # 添加原始的 'code' 和 'adjustflag' 列，保持与baostock输出的兼容性
+        df.insert(1, 'code', code)
+        df['adjustflag'] = adjustflag
+        self.chart_cache.put(cache_key, df)
+        return df
+
+    def get_cache_stats(self):
+        """本地K线缓存和图表内存缓存的统计信息"""
+        return {
+            "bar_cache": self.bar_store.stats(),
+            "chart_cache": self.chart_cache.stats(),
+        }
+
+    def _fetch_stock_data(self, code, start_date, end_date, frequency="d", adjustflag="3"):
+        """
+        通过行情数据提供者获取股票历史数据，网络或接口异常时直接抛出
+        :return: 包含 date/open/high/low/close/volume/amount 列的 DataFrame
+        """
+        return self.provider.fetch_daily_bars(code, start_date, end_date, frequency, adjustflag)
     
     # def get_stock_basic_info(self, code):
     #     """
@@ -324,100 +333,83 @@ class StockDataManager:
     #     #     print(f"获取股票基本信息异常: {e}")
     #     #     return None
     
-    def get_realtime_quotes(self, codes):
+    def _request_spot_board(self):
+        """通过请求网关获取全市场行情快照，计入网关的并发上限"""
+        return gateway.submit(("spot_board",), self._fetch_spot_board, priority=PRIORITY_QUOTES).result()
+
+    def _fetch_spot_board(self):
+        """通过行情数据提供者获取全市场A股实时行情，由 self.quotes 调用"""
+        return self.provider.fetch_spot_board()
+
+    def get_realtime_quotes(self, codes, max_age=None):
         """
         获取实时行情数据 (使用 AKShare)
         :param codes: 股票代码列表，如["sh.600000", "sh.601398"]
-        :return: 实时行情数据字典
+        :param max_age: 能接受的全市场行情快照最大年龄（秒），默认为 spot_snapshot_max_age
+        :return: 实时行情数据字典，source 为提供价格的数据源（spot/cache/database），
+                 各数据源的股票数量记录在 self.quote_tiers
         """
         results = {}
-        ak_all_spot_df = None
-        try:
-            # 尝试获取所有A股的实时行情数据
-            ak_all_spot_df = ak.stock_zh_a_spot_em()
-            # 将代码列设置为索引以便快速查找
-            if ak_all_spot_df is not None and not ak_all_spot_df.empty and '代码' in ak_all_spot_df.columns:
-                ak_all_spot_df.set_index('代码', inplace=True)
-            else:
-                print("AKShare: stock_zh_a_spot_em 未返回有效数据或缺少'代码'列")
-                ak_all_spot_df = None # 确保后续不会使用无效的DataFrame
-        except Exception as e:
-            print(f"AKShare:调用 stock_zh_a_spot_em 获取所有股票实时行情失败: {e}")
-            ak_all_spot_df = None
+        # 全市场行情快照，有效期内的请求直接复用，并发请求共用一次下载
+        spot = self.quotes.snapshot(max_age)
+        spot_time = datetime.fromtimestamp(spot.fetched_at).strftime("%Y-%m-%d %H:%M:%S") if spot else None
 
+        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        missing = []
         for bs_code in codes:
-            price = None
-            change = 0.0 # 初始化为浮点数
             ak_code = self._convert_bs_to_ak_code(bs_code)
-
-            # 方法1: 从 ak.stock_zh_a_spot_em() 的结果中查找
-            if ak_all_spot_df is not None and ak_code in ak_all_spot_df.index:
-                try:
-                    stock_data = ak_all_spot_df.loc[ak_code]
-                    price = stock_data.get('最新价', None)
-                    change_pct = stock_data.get('涨跌幅', 0.0) # 直接获取百分比
-                    
-                    if price is not None:
-                        price = float(price)
-                        change = float(change_pct) # AKShare直接提供涨跌幅百分比
-                        print(f"AKShare: 从stock_zh_a_spot_em获取到 {bs_code}({ak_code}) - 价格: {price}, 涨跌幅: {change}%")
-                    else:
-                        print(f"AKShare: stock_zh_a_spot_em 中 {ak_code} 的'最新价'为空")
-
-                except Exception as e:
-                    print(f"AKShare: 处理 stock_zh_a_spot_em 数据时出错 ({bs_code}): {e}")
-            
-            # 方法2: 如果AKShare实时行情获取失败或未找到该股票，尝试从历史数据获取最近价格
-            # 注意：这通常不是"实时"的，但作为备用
-            if price is None:
-                print(f"AKShare: 无法从实时行情获取 {bs_code}, 尝试从历史数据获取最新收盘价")
-                try:
-                    # 获取最近一个交易日的数据
-                    end_date_dt = datetime.now()
-                    start_date_dt = end_date_dt - timedelta(days=5) # 查询最近5天的数据，确保能拿到一个交易日
-                    
-                    df_hist = self.get_stock_data(code=bs_code, 
-                                                  start_date=start_date_dt.strftime("%Y-%m-%d"), 
-                                                  end_date=end_date_dt.strftime("%Y-%m-%d"),
-                                                  frequency="d",
-                                                  adjustflag="3") # 通常用不复权看收盘价
-                    
-                    if not df_hist.empty:
-                        latest_record = df_hist.iloc[-1]
-                        price = float(latest_record['close'])
-                        # 计算涨跌幅 (相对于前一个交易日)
-                        if len(df_hist) > 1:
-                            prev_close = float(df_hist.iloc[-2]['close'])
-                            if prev_close > 0:
-                                change = round(((price - prev_close) / prev_close) * 100, 2)
-                        print(f"AKShare: 从历史数据获取到 {bs_code} - 价格: {price}, 计算涨跌幅: {change}%")
-                    else:
-                        print(f"AKShare: 历史数据也未找到 {bs_code}")
-                except Exception as e:
-                    print(f"AKShare: 从历史数据获取 {bs_code} 价格失败: {e}")
-
-            # 方法3: 如果以上都失败，获取数据库中的价格和涨跌幅
-            if price is None:
-                stock_info_db = db.get_stock(bs_code)
-                if stock_info_db:
-                    price = stock_info_db.get("price")
-                    change = stock_info_db.get("change", 0.0)
-                    if price is not None:
-                        print(f"AKShare: 使用数据库价格为 {bs_code} - 价格: {price}, 涨跌幅: {change}%")
-                    else:
-                         print(f"AKShare: 数据库中 {bs_code} 价格也为空")
-                else:
-                    print(f"AKShare: 数据库中未找到 {bs_code}")
-            
-            if price is not None:
-                results[bs_code] = {
-                    "price": float(price),
-                    "change": float(change),
-                    "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }
+            # 方法1: 从全市场行情快照中查找（快照中没有最新价为空的股票）
+            spot_quote = spot.get(ak_code) if spot is not None else None
+            if spot_quote is None:
+                missing.append(bs_code)
+                continue
+            results[bs_code] = {
+                "price": spot_quote["price"],
+                "change": spot_quote["change"],  # AKShare直接提供涨跌幅百分比
+                "volume": spot_quote["volume"],
+                "source": "spot",  # 价格来源：spot=实时行情，cache=本地K线缓存，database=数据库
+                # 实时行情的时间为快照的获取时间，据此可以看出数据延迟
+                "time": spot_time,
+            }
+            print(f"AKShare: 从stock_zh_a_spot_em获取到 {bs_code}({ak_code}) - 价格: {spot_quote['price']}, "
+                  f"涨跌幅: {spot_quote['change']}%")
+
+        # 方法2: 实时行情中没有的股票，一次性从本地K线缓存读取最近两根日K线的收盘价（不联网，
+        # 上游故障时不会变成逐只请求历史数据）；注意这不是"实时"价格，只作为备用
+        cached = self.bar_store.latest_closes(missing, "d", "3") if missing else {}
+        for bs_code in missing:
+            bars = cached.get(bs_code)
+            if bars:
+                date, price = bars[-1]
+                change = 0.0
+                # 计算涨跌幅 (相对于前一个交易日)
+                if len(bars) > 1 and bars[-2][1] > 0:
+                    change = round(((price - bars[-2][1]) / bars[-2][1]) * 100, 2)
+                results[bs_code] = {"price": float(price), "change": float(change), "volume": None,
+                                    "source": "cache", "time": date}
+                continue
+
+            # 方法3: 缓存中也没有时，使用数据库中的价格和涨跌幅
+            stock_info_db = db.get_stock(bs_code)
+            if stock_info_db and stock_info_db.get("price") is not None:
+                results[bs_code] = {"price": float(stock_info_db["price"]),
+                                    "change": float(stock_info_db.get("change", 0.0) or 0.0),
+                                    "volume": None, "source": "database", "time": now_str}
             else:
                 print(f"AKShare: 最终未能获取到 {bs_code} 的任何价格信息")
 
+        # 各数据源提供的股票数量
+        tiers = {"spot": 0, "cache": 0, "database": 0}
+        for quote in results.values():
+            tiers[quote["source"]] += 1
+        tiers["missing"] = len(codes) - len(results)
+        self.quote_tiers = tiers
+        for tier, count in tiers.items():
+            self.quote_tier_totals[tier] = self.quote_tier_totals.get(tier, 0) + count
+        if missing:
+            print(f"实时行情: 实时 {tiers['spot']} 只，K线缓存 {tiers['cache']} 只，"
+                  f"数据库 {tiers['database']} 只，缺失 {tiers['missing']} 只")
+
         return results
     
     def search_stocks(self, keyword):
@@ -441,23 +433,35 @@ class StockDataManager:
         return results
     
     def update_stock_prices(self):
-        """使用 AKShare 获取实时股票数据更新价格"""
+        """获取实时股票数据更新价格"""
         stocks = db.get_stocks()
         
         if not stocks:
             print("数据库中没有股票数据可供更新")
             return {}
         
-        codes_to_update = list(stocks.keys())
-        
         # 获取实时行情 (已经包含了备用逻辑)
-        realtime_data = self.get_realtime_quotes(codes_to_update)
-        
+        realtime_data = self.get_realtime_quotes(list(stocks.keys()))
+        return self.apply_quotes(realtime_data, stocks=stocks)
+    
+    def apply_quotes(self, quotes, now=None, stocks=None, verbose=True, indicators=None):
+        """
+        把一批行情写入数据库并增量更新推荐指标，实时刷新和行情回放（modules/replay.py）共用这一路径
+        :param quotes: {code: {"price", "change", "volume", "source"}}，source 为 spot/replay 的行情计入当日K线
+        :param now: 行情对应的时间，默认为当前时间；回放时为回放到的市场时间
+        :param stocks: 数据库中的股票，默认重新读取
+        :param verbose: 是否逐只打印更新日志（快速回放时关闭）
+        :param indicators: 计入行情的指标簿，默认为持久化的 self.indicators；回放使用自己的内存指标簿，
+                           历史行情不会覆盖保存的指标状态
+        :return: 更新后的全部股票信息 {code: info}
+        """
+        stocks = stocks if stocks is not None else db.get_stocks()
         updated_stocks_info = {}
+        stocks_to_save = {}
         
         for code, current_db_info in stocks.items():
-            if code in realtime_data:
-                live_info = realtime_data[code]
+            if code in quotes:
+                live_info = quotes[code]
                 new_price = live_info.get("price")
                 new_change = live_info.get("change") # AKShare 应该直接提供正确的涨跌幅
 
@@ -467,18 +471,27 @@ class StockDataManager:
                         "price": float(new_price),
                         "change": float(new_change)
                     }
-                    db.update_stock(code, stock_data_to_save)
+                    stocks_to_save[code] = stock_data_to_save
                     updated_stocks_info[code] = stock_data_to_save
-                    print(f"AKShare: 更新数据库 {code} - 价格: {new_price}, 涨跌幅: {new_change}%")
+                    if verbose:
+                        print(f"AKShare: 更新 {code} - 价格: {new_price}, 涨跌幅: {new_change}%")
                 else:
                     # 未能从get_realtime_quotes获取有效价格或涨跌幅，保留数据库原样
                     updated_stocks_info[code] = current_db_info
-                    print(f"AKShare: 未能获取 {code} 的有效实时数据，保留数据库原值")
+                    if verbose:
+                        print(f"AKShare: 未能获取 {code} 的有效实时数据，保留数据库原值")
             else:
                 # get_realtime_quotes 未返回该股票信息，保留数据库原样
                 updated_stocks_info[code] = current_db_info
-                print(f"AKShare: get_realtime_quotes 未返回 {code} 的信息，保留数据库原值")
+                if verbose:
+                    print(f"AKShare: get_realtime_quotes 未返回 {code} 的信息，保留数据库原值")
+        
+        # 整批写入数据库
+        db.update_stocks(stocks_to_save)
         
+        # 实时行情计入当日K线，增量更新推荐指标
+        live_quotes = {code: quote for code, quote in quotes.items() if quote.get("source") in ("spot", "replay")}
+        (indicators or self.indicators).on_ticks(live_quotes, now)
         return updated_stocks_info
     
     def get_index_data(self, index_code="sh.000001", days=7):
@@ -509,5 +522,25 @@ class StockDataManager:
         
         return df
 
-# 创建股票数据管理器实例
-stock_manager = StockDataManager() 
\ No newline at end of file
+# 全局股票数据管理器在第一次访问 stock_manager 时才创建（PEP 562），
+# 导入本模块不会打开K线缓存、加载指标状态或创建行情数据提供者
+_stock_manager_lock = threading.Lock()
+
+
+def get_stock_manager():
+    """返回全局股票数据管理器，第一次调用时创建"""
+    manager = globals().get("stock_manager")
+    if manager is None:
+        with _stock_manager_lock:
+            manager = globals().get("stock_manager")
+            if manager is None:
+                manager = StockDataManager()
+                # 缓存到模块命名空间，之后的访问不再经过 __getattr__
+                globals()["stock_manager"] = manager
+    return manager
+
+
+def __getattr__(name):
+    if name == "stock_manager":
+        return get_stock_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
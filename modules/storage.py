@@ -0,0 +1,343 @@
+import os
+import json
+import sqlite3
+import threading
+
+
+def atomic_write_json(path, data):
+    """先写临时文件并fsync，再原子替换目标文件，写入中断不会损坏原文件"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# 用户表中有独立列的字段，其余字段序列化到 extra 列中
+USER_COLUMNS = ("password", "type", "balance", "created_at")
+
+
+class UserStorage:
+    """用户数据存储后端接口，Database 通过它读写用户与持仓"""
+
+    def load_users(self):
+        """读取所有用户信息，返回 {username: user} 字典，读取失败时抛出异常"""
+        raise NotImplementedError
+
+    def get_users(self):
+        """获取所有用户信息，返回 {username: user} 字典，读取失败时返回空字典"""
+        try:
+            return self.load_users()
+        except Exception as e:
+            print(f"获取用户信息出错: {e}")
+            return {}
+
+    def get_user(self, username):
+        """获取指定用户信息（含持仓），不存在时返回None"""
+        raise NotImplementedError
+
+    def user_exists(self, username):
+        """检查用户是否存在"""
+        return self.get_user(username) is not None
+
+    def add_user(self, username, user):
+        """新增用户"""
+        raise NotImplementedError
+
+    def update_user(self, username, data):
+        """更新用户的部分字段，data 中包含 holdings 时整体替换持仓"""
+        raise NotImplementedError
+
+    def delete_user(self, username):
+        """删除用户及其持仓"""
+        raise NotImplementedError
+
+    def save_trade(self, username, balance, stock_code, holding):
+        """保存一笔交易后的余额和单只股票持仓，holding 为None表示清仓"""
+        self.save_trades([(username, balance, stock_code, holding)])
+
+    def save_trades(self, trades):
+        """在一次写入中保存多笔交易，trades 为 (username, balance, stock_code, holding) 列表"""
+        raise NotImplementedError
+
+    def version(self):
+        """数据版本标识，其他进程修改数据后会发生变化，用于缓存失效判断"""
+        return None
+
+    def close(self):
+        """关闭存储"""
+        pass
+
+
+class JsonUserStorage(UserStorage):
+    """基于 users.json 的存储后端，每次写入都会重写整个文件"""
+
+    def __init__(self, users_file):
+        self.users_file = users_file
+
+    def _load(self):
+        with open(self.users_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _dump(self, users):
+        atomic_write_json(self.users_file, users)
+
+    def version(self):
+        try:
+            return os.stat(self.users_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def load_users(self):
+        return self._load()
+
+    def get_user(self, username):
+        return self.get_users().get(username)
+
+    # 写入前读取失败时抛出异常，不能把空字典写回文件覆盖所有用户
+    def add_user(self, username, user):
+        users = self._load()
+        users[username] = user
+        self._dump(users)
+
+    def update_user(self, username, data):
+        users = self._load()
+        for key, value in data.items():
+            users[username][key] = value
+        self._dump(users)
+
+    def delete_user(self, username):
+        users = self._load()
+        del users[username]
+        self._dump(users)
+
+    def save_trades(self, trades):
+        users = self._load()
+        for username, balance, stock_code, holding in trades:
+            user = users[username]
+            user["balance"] = balance
+            if holding is None:
+                user["holdings"].pop(stock_code, None)
+            else:
+                user["holdings"][stock_code] = holding
+        self._dump(users)
+
+
+class SQLiteUserStorage(UserStorage):
+    """基于SQLite的存储后端，用户和持仓分表存储，只更新变化的行"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # 连接会被UI线程和后台刷新线程共用，由 self.lock 串行化访问
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+        self._create_tables()
+
+    def _create_tables(self):
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            # 提交即落盘，交易预写日志依赖这一点判断交易已完成
+            self.conn.execute("PRAGMA synchronous=FULL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS users (
+                    username   TEXT PRIMARY KEY,
+                    password   TEXT NOT NULL,
+                    type       TEXT NOT NULL DEFAULT 'user',
+                    balance    REAL NOT NULL DEFAULT 0,
+                    created_at TEXT,
+                    extra      TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_users_type ON users(type);
+
+                CREATE TABLE IF NOT EXISTS holdings (
+                    username TEXT NOT NULL,
+                    code     TEXT NOT NULL,
+                    name     TEXT,
+                    quantity INTEGER NOT NULL DEFAULT 0,
+                    cost     REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (username, code)
+                );
+                CREATE INDEX IF NOT EXISTS idx_holdings_code ON holdings(code);
+
+                CREATE TABLE IF NOT EXISTS meta (
+                    key   TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+
+    def _row_to_user(self, row, holdings):
+        user = {
+            "password": row["password"],
+            "type": row["type"],
+            "balance": row["balance"],
+            "holdings": holdings,
+            "created_at": row["created_at"],
+        }
+        if row["extra"]:
+            user.update(json.loads(row["extra"]))
+        return user
+
+    def _holdings_of(self, username):
+        rows = self.conn.execute(
+            "SELECT code, name, quantity, cost FROM holdings WHERE username = ?", (username,)
+        ).fetchall()
+        return {r["code"]: {"name": r["name"], "quantity": r["quantity"], "cost": r["cost"]} for r in rows}
+
+    def load_users(self):
+        with self.lock:
+            holdings = {}
+            for r in self.conn.execute("SELECT username, code, name, quantity, cost FROM holdings"):
+                holdings.setdefault(r["username"], {})[r["code"]] = {
+                    "name": r["name"], "quantity": r["quantity"], "cost": r["cost"]
+                }
+            rows = self.conn.execute("SELECT * FROM users ORDER BY rowid").fetchall()
+            return {r["username"]: self._row_to_user(r, holdings.get(r["username"], {})) for r in rows}
+
+    def get_user(self, username):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return None
+            return self._row_to_user(row, self._holdings_of(username))
+
+    def user_exists(self, username):
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone()
+            return row is not None
+
+    def _split_extra(self, user):
+        """拆出没有独立列的字段，存入 extra 列"""
+        extra = {k: v for k, v in user.items() if k not in USER_COLUMNS and k != "holdings"}
+        return json.dumps(extra, ensure_ascii=False) if extra else None
+
+    def _insert_user(self, username, user):
+        self.conn.execute(
+            "INSERT INTO users (username, password, type, balance, created_at, extra) VALUES (?, ?, ?, ?, ?, ?)",
+            (username, user.get("password", ""), user.get("type", "user"), user.get("balance", 0.0),
+             user.get("created_at"), self._split_extra(user))
+        )
+        self._replace_holdings(username, user.get("holdings", {}))
+
+    def _replace_holdings(self, username, holdings):
+        self.conn.execute("DELETE FROM holdings WHERE username = ?", (username,))
+        self.conn.executemany(
+            "INSERT INTO holdings (username, code, name, quantity, cost) VALUES (?, ?, ?, ?, ?)",
+            [(username, code, h.get("name", ""), h.get("quantity", 0), h.get("cost", 0))
+             for code, h in holdings.items()]
+        )
+
+    def _upsert_holding(self, username, code, holding):
+        if holding is None:
+            self.conn.execute("DELETE FROM holdings WHERE username = ? AND code = ?", (username, code))
+        else:
+            self.conn.execute(
+                "INSERT INTO holdings (username, code, name, quantity, cost) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(username, code) DO UPDATE SET "
+                "name = excluded.name, quantity = excluded.quantity, cost = excluded.cost",
+                (username, code, holding.get("name", ""), holding.get("quantity", 0), holding.get("cost", 0))
+            )
+
+    def add_user(self, username, user):
+        with self.lock, self.conn:
+            self._insert_user(username, user)
+
+    def update_user(self, username, data):
+        with self.lock, self.conn:
+            columns = [k for k in data if k in USER_COLUMNS]
+            if columns:
+                assignments = ", ".join(f"{k} = ?" for k in columns)
+                self.conn.execute(f"UPDATE users SET {assignments} WHERE username = ?",
+                                  [data[k] for k in columns] + [username])
+
+            extra_keys = [k for k in data if k not in USER_COLUMNS and k != "holdings"]
+            if extra_keys:
+                row = self.conn.execute("SELECT extra FROM users WHERE username = ?", (username,)).fetchone()
+                extra = json.loads(row["extra"]) if row and row["extra"] else {}
+                extra.update({k: data[k] for k in extra_keys})
+                self.conn.execute("UPDATE users SET extra = ? WHERE username = ?",
+                                  (json.dumps(extra, ensure_ascii=False), username))
+
+            if "holdings" in data:
+                # 只写入有变化的持仓行
+                old_holdings = self._holdings_of(username)
+                new_holdings = data["holdings"] or {}
+                for code in old_holdings.keys() - new_holdings.keys():
+                    self._upsert_holding(username, code, None)
+                for code, holding in new_holdings.items():
+                    if old_holdings.get(code) != holding:
+                        self._upsert_holding(username, code, holding)
+
+    def delete_user(self, username):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM holdings WHERE username = ?", (username,))
+            self.conn.execute("DELETE FROM users WHERE username = ?", (username,))
+
+    def save_trades(self, trades):
+        with self.lock, self.conn:
+            for username, balance, stock_code, holding in trades:
+                self.conn.execute("UPDATE users SET balance = ? WHERE username = ?", (balance, username))
+                self._upsert_holding(username, stock_code, holding)
+
+    def version(self):
+        # data_version 只在其他连接提交修改后变化
+        with self.lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def get_meta(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            return row["value"] if row else None
+
+    def set_meta(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def migrate_json_to_sqlite(users_file, storage):
+    """
+    一次性将 users.json 中的用户和持仓导入SQLite
+    :param users_file: 旧的 users.json 路径
+    :param storage: SQLiteUserStorage 实例
+    :return: (是否成功, 信息)
+    """
+    if storage.get_meta("migrated_from_json"):
+        return False, "已迁移过，跳过"
+    if not os.path.exists(users_file):
+        return False, f"未找到 {users_file}"
+
+    try:
+        with open(users_file, "r", encoding="utf-8") as f:
+            users = json.load(f)
+    except Exception as e:
+        return False, f"读取 {users_file} 出错: {e}"
+
+    imported = 0
+    with storage.lock, storage.conn:
+        for username, user in users.items():
+            exists = storage.conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone()
+            if exists:
+                continue
+            storage._insert_user(username, user)
+            imported += 1
+        storage.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             ("migrated_from_json", users_file))
+    return True, f"已从 {users_file} 导入 {imported} 个用户"
+
+
+def create_user_storage(backend, users_file, sqlite_path):
+    """根据配置创建用户存储后端"""
+    if backend == "json":
+        return JsonUserStorage(users_file)
+    if backend == "sqlite":
+        storage = SQLiteUserStorage(sqlite_path)
+        success, message = migrate_json_to_sqlite(users_file, storage)
+        if success:
+            print(f"用户数据迁移: {message}")
+        return storage
+    raise ValueError(f"未知的存储后端: {backend}")
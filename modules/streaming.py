@@ -0,0 +1,413 @@
+import math
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from .bar_cache import is_trading_day
+from .indicators import DEFAULT_THRESHOLDS, combine_signals
+from .indicator_registry import describe_signals
+
+# 推荐分析使用的历史窗口（自然日），与 StockRecommendationEngine.load_history 一致
+LOOKBACK_DAYS = 30
+
+# 计算全部信号最多需要的K线数量（20日均线 + 1）
+MAX_BARS = 21
+
+
+class RollingWindow:
+    """
+    定长环形缓冲区：入窗/出窗/替换最后一个值都是 O(1)
+
+    均值和标准差按时间顺序对窗口内（固定个数）的值求和得到，与批量面板计算的舍入完全一致，
+    不会像增减累计和那样逐渐积累误差；窗口内数值全部相同时均值直接返回该值、标准差为0，与 pandas 一致。
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = [math.nan] * size
+        self.pos = 0        # 下一个写入位置
+        self.filled = 0
+        self.nan_count = 0
+
+    def push(self, value):
+        if self.filled == self.size:
+            self.nan_count -= math.isnan(self.values[self.pos])
+        else:
+            self.filled += 1
+        self.values[self.pos] = value
+        self.nan_count += math.isnan(value)
+        self.pos = (self.pos + 1) % self.size
+
+    def replace_last(self, value):
+        """替换最新的值（同一根K线盘中更新）"""
+        if not self.filled:
+            self.push(value)
+            return
+        index = (self.pos - 1) % self.size
+        self.nan_count += math.isnan(value) - math.isnan(self.values[index])
+        self.values[index] = value
+
+    def last(self, back=0):
+        """倒数第 back+1 个值，不存在时为 NaN"""
+        if back >= self.filled:
+            return math.nan
+        return self.values[(self.pos - 1 - back) % self.size]
+
+    def is_full(self):
+        return self.filled == self.size and not self.nan_count
+
+    def ordered(self):
+        """窗口内的值，按时间从早到晚"""
+        return np.array(self.values[self.pos:] + self.values[:self.pos])
+
+    def mean(self):
+        if not self.is_full():
+            return math.nan
+        window = self.ordered()
+        if window.max() == window.min():
+            return float(window[-1])
+        return float(window.mean())
+
+    def std(self):
+        if not self.is_full():
+            return math.nan
+        window = self.ordered()
+        if window.max() == window.min():
+            return 0.0
+        return float(np.sqrt(max(window.var(ddof=1), 0.0)))
+
+
+class WilderAverage:
+    """Wilder 平滑均值：前 period 个值取简单平均，之后 avg = (avg * (period - 1) + x) / period"""
+
+    def __init__(self, period):
+        self.period = period
+        self.value = math.nan
+        self.count = 0
+        self._warmup_sum = 0.0
+        self._prev = (math.nan, 0, 0.0)  # 最后一次更新前的状态，用于替换最新值
+
+    def push(self, x):
+        self._prev = (self.value, self.count, self._warmup_sum)
+        self._apply(x)
+
+    def replace_last(self, x):
+        self.value, self.count, self._warmup_sum = self._prev
+        self._apply(x)
+
+    def _apply(self, x):
+        self.count += 1
+        if self.count <= self.period:
+            self._warmup_sum += x
+            self.value = self._warmup_sum / self.period if self.count == self.period else math.nan
+        else:
+            self.value = (self.value * (self.period - 1) + x) / self.period
+
+    def to_dict(self):
+        return {"value": self.value, "count": self.count, "warmup_sum": self._warmup_sum,
+                "prev": list(self._prev)}
+
+    def load(self, data):
+        self.value, self.count, self._warmup_sum = data["value"], data["count"], data["warmup_sum"]
+        self._prev = tuple(data["prev"])
+
+
+def _divide(a, b):
+    """按 NumPy 浮点语义相除（除以0得到 inf/NaN 而不是抛异常）"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return float(np.float64(a) / np.float64(b))
+
+
+class IndicatorState:
+    """
+    单只股票的流式指标状态：5/20日均线、14日RSI、10日收益率标准差、10日均量
+
+    新K线或盘中行情到达时 O(1) 更新；signals() 给出与 analyze_dataframe 相同规则的五项信号。
+    """
+
+    def __init__(self, rsi_method="sma"):
+        self.rsi_method = rsi_method
+        self.dates = deque(maxlen=MAX_BARS)
+        self.bars = deque(maxlen=MAX_BARS)  # (close, volume)，用于持久化
+        self.ma5 = RollingWindow(5)
+        self.closes = RollingWindow(20)
+        self.gains = RollingWindow(14)
+        self.losses = RollingWindow(14)
+        self.returns = RollingWindow(10)
+        self.volumes = RollingWindow(10)
+        self.wilder_gain = WilderAverage(14)
+        self.wilder_loss = WilderAverage(14)
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if self.dates else None
+
+    def update(self, date, close, volume=math.nan):
+        """
+        加入一根K线；日期与最新K线相同时视为盘中更新，替换最新K线
+        :return: 是否已应用（早于最新K线的数据会被忽略）
+        """
+        close = float(close)
+        volume = math.nan if volume is None else float(volume)
+        if self.dates and date < self.dates[-1]:
+            return False
+        replace = bool(self.dates) and date == self.dates[-1]
+        prev_close = self.closes.last(1 if replace else 0)
+        delta = close - prev_close
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        ret = _divide(close, prev_close) - 1
+
+        for window, value in ((self.ma5, close), (self.closes, close), (self.gains, gain),
+                              (self.losses, loss), (self.returns, ret), (self.volumes, volume),
+                              (self.wilder_gain, gain), (self.wilder_loss, loss)):
+            if replace:
+                window.replace_last(value)
+            else:
+                window.push(value)
+        if replace:
+            self.bars[-1] = (close, volume)
+        else:
+            self.dates.append(date)
+            self.bars.append((close, volume))
+        return True
+
+    def bar_count(self, today):
+        """分析窗口（最近 LOOKBACK_DAYS 天）内的K线数量，最多 MAX_BARS"""
+        cutoff = (today - timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+        return sum(1 for date in self.dates if date >= cutoff)
+
+    def rsi(self):
+        if self.rsi_method == "wilder":
+            gain, loss = self.wilder_gain.value, self.wilder_loss.value
+        else:
+            gain, loss = self.gains.mean(), self.losses.mean()
+        return 100 - _divide(100, 1 + _divide(gain, loss))
+
+    def signals(self, today=None, thresholds=DEFAULT_THRESHOLDS):
+        """
+        按当前状态计算五项信号，规则与逐只分析（calculate_*_signal）相同
+        窗口内K线不足时信号为0：逐只分析在窗口首根K线上没有前收盘价，所以动量需要6根、波动率需要11根
+        """
+        count = self.bar_count(today or datetime.now())
+        close = self.closes.last()
+        signals = dict.fromkeys(('ma_signal', 'rsi_signal', 'volume_signal',
+                                 'price_momentum', 'volatility_signal'), 0)
+
+        if count >= 20:
+            ma5, ma20 = self.ma5.mean(), self.closes.mean()
+            if close > ma5 > ma20:
+                signals['ma_signal'] = 0.8
+            elif close > ma5:
+                signals['ma_signal'] = 0.6
+            elif close < ma5 < ma20:
+                signals['ma_signal'] = -0.8
+            elif close < ma5:
+                signals['ma_signal'] = -0.6
+
+        if count >= 15:
+            rsi = self.rsi()
+            if not math.isnan(rsi):
+                signals['rsi_signal'] = (0.7 if rsi < thresholds['rsi_oversold'] else
+                                         -0.7 if rsi > thresholds['rsi_overbought'] else
+                                         0.3 if rsi < 50 else -0.3)
+
+        if count >= 10:
+            volume_ma = self.volumes.mean()
+            if not math.isnan(volume_ma) and volume_ma != 0:
+                volume_ratio = _divide(self.volumes.last(), volume_ma)
+                prev_close = self.closes.last(1)
+                price_change = _divide(close - prev_close, prev_close)
+                surge = volume_ratio > thresholds['volume_surge']
+                if surge and price_change > 0:
+                    signals['volume_signal'] = 0.6
+                elif surge and price_change < 0:
+                    signals['volume_signal'] = -0.6
+                elif volume_ratio < thresholds['volume_shrink']:
+                    signals['volume_signal'] = -0.2
+
+        if count >= 6:
+            return_3d = _divide(close, self.closes.last(3)) - 1
+            return_5d = _divide(close, self.closes.last(5)) - 1
+            if not (math.isnan(return_3d) or math.isnan(return_5d)):
+                signals['price_momentum'] = np.clip((return_3d * 0.6 + return_5d * 0.4) * 10, -1, 1)
+
+        if count >= 11:
+            volatility = self.returns.std()
+            if not math.isnan(volatility):
+                signals['volatility_signal'] = (-0.4 if volatility > thresholds['volatility_high'] else
+                                                0.2 if volatility < thresholds['volatility_low'] else 0.1)
+        return signals
+
+    def to_dict(self):
+        return {
+            "rsi_method": self.rsi_method,
+            "bars": [[date, close, None if math.isnan(volume) else volume]
+                     for date, (close, volume) in zip(self.dates, self.bars)],
+            "wilder": [self.wilder_gain.to_dict(), self.wilder_loss.to_dict()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data.get("rsi_method", "sma"))
+        for date, close, volume in data["bars"]:
+            state.update(date, close, volume)
+        # Wilder 均值依赖全部历史，单独恢复
+        state.wilder_gain.load(data["wilder"][0])
+        state.wilder_loss.load(data["wilder"][1])
+        return state
+
+    @classmethod
+    def from_frame(cls, df, rsi_method="sma"):
+        """用按日期升序的历史K线初始化"""
+        state = cls(rsi_method)
+        volumes = df["volume"] if "volume" in df.columns else [math.nan] * len(df)
+        for date, close, volume in zip(df["date"], df["close"], volumes):
+            state.update(str(date), close, volume)
+        return state
+
+
+def previous_trading_day(date_str):
+    """前一个交易日（只跳过周末）"""
+    day = datetime.strptime(date_str, "%Y-%m-%d") - timedelta(days=1)
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day.strftime("%Y-%m-%d")
+
+
+def _extend(state, date, close, volume):
+    """
+    把一根K线接到状态末尾
+    :return: 是否已应用；与最新K线之间缺了交易日时返回 None，状态不变
+    """
+    last = state.last_date
+    if date > last and previous_trading_day(date) > last:
+        return None
+    return state.update(date, close, volume)
+
+
+class IndicatorBook:
+    """
+    所有股票的流式指标状态，状态随本地K线缓存一起持久化，重启后不必重新计算
+
+    行情/K线按日期连续到达时增量更新；出现缺口（中间漏了交易日）时丢弃该股票的状态，
+    下次推荐分析时用历史数据重新初始化。
+    """
+
+    def __init__(self, bar_store, rsi_method="sma", period="d", adjust="3", persist=True):
+        """
+        :param persist: False 时为只在内存中的指标簿（行情回放使用）：不读写K线缓存，
+                        没有状态的股票从收到的第一根行情开始建立状态
+        """
+        self.bar_store = bar_store
+        self.rsi_method = rsi_method
+        self.period = period
+        self.adjust = adjust
+        self.persist = persist
+        self.states = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        if persist:
+            self.load()
+
+    def load(self):
+        """从K线缓存读取保存的状态，并用缓存中更新的K线补齐"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        for code, data in self.bar_store.load_indicator_states().items():
+            try:
+                state = IndicatorState.from_dict(data)
+            except Exception as e:
+                print(f"指标状态: 恢复 {code} 失败，将重新计算: {e}")
+                continue
+            if state.rsi_method != self.rsi_method or state.last_date is None:
+                continue
+            newer = self.bar_store.read(code, self.period, self.adjust, state.last_date, today)
+            if all(_extend(state, date, close, volume) is not None
+                   for date, close, volume in zip(newer["date"], newer["close"], newer["volume"])):
+                self.states[code] = state
+
+    def is_current(self, code, latest_day):
+        """状态是否存在且已包含 latest_day（上一交易日）及之后的K线"""
+        with self._lock:
+            state = self.states.get(code)
+            return state is not None and state.last_date >= latest_day
+
+    def seed(self, code, df):
+        """用完整的分析窗口历史数据（重新）初始化一只股票的状态"""
+        with self._lock:
+            self.states[code] = IndicatorState.from_frame(df, self.rsi_method)
+            self._dirty.add(code)
+
+    def update(self, code, date, close, volume=None):
+        """
+        一只股票的新K线或盘中行情；与已有状态不连续时丢弃状态
+        :return: 是否已更新
+        """
+        with self._lock:
+            state = self.states.get(code)
+            if state is None:
+                if self.persist:
+                    return False
+                state = self.states[code] = IndicatorState(self.rsi_method)
+                return state.update(date, close, volume)
+            applied = _extend(state, date, close, volume)
+            if applied is None:
+                # 中间缺了K线，增量状态已不可信
+                del self.states[code]
+                self._dirty.discard(code)
+                return False
+            if applied:
+                self._dirty.add(code)
+            return applied
+
+    def update_from_frame(self, code, df):
+        """用一段最近的历史K线更新（只应用不早于状态最新K线的部分）"""
+        with self._lock:
+            state = self.states.get(code)
+            last = state.last_date if state is not None else None
+        if last is None or df.empty or last not in set(df["date"]):
+            return
+        newer = df[df["date"] >= last]
+        volumes = newer["volume"] if "volume" in newer.columns else [None] * len(newer)
+        for date, close, volume in zip(newer["date"], newer["close"], volumes):
+            self.update(code, date, close, volume)
+
+    def on_ticks(self, quotes, now=None):
+        """
+        用 update_stock_prices 获取的实时行情更新当日K线
+        :param quotes: {code: {"price", "volume"}}
+        """
+        now = now or datetime.now()
+        # 非交易日或开盘前的行情仍是上一交易日的价格，不能当作当日K线
+        if not is_trading_day(now) or now.hour * 100 + now.minute < 930:
+            return 0
+        today = now.strftime("%Y-%m-%d")
+        updated = sum(1 for code, quote in quotes.items()
+                      if self.update(code, today, quote["price"], quote.get("volume")))
+        self.save()
+        return updated
+
+    def signals(self, code, today=None, thresholds=DEFAULT_THRESHOLDS):
+        with self._lock:
+            state = self.states.get(code)
+            return state.signals(today, thresholds) if state is not None else None
+
+    def analyze(self, code, weights, today=None, thresholds=DEFAULT_THRESHOLDS):
+        """返回 (上涨概率, 推荐理由)，只使用 weights 中列出的信号，没有状态时返回 None"""
+        signals = self.signals(code, today, thresholds)
+        if signals is None:
+            return None
+        signals = {name: signals[name] for name in weights}
+        return combine_signals(signals, weights), describe_signals(signals)
+
+    def save(self):
+        """把有变化的状态写入K线缓存（内存中的指标簿不保存）"""
+        if not self.persist:
+            return
+        with self._lock:
+            dirty = {code: self.states[code].to_dict() for code in self._dirty if code in self.states}
+            self._dirty.clear()
+        if dirty:
+            self.bar_store.save_indicator_states(dirty)
@@ -5,12 +5,17 @@ import pandas as pd
 from .database import db
 from .stock_data import stock_manager
 
+# 交易记录每页加载条数
+TRANSACTION_PAGE_SIZE = 50
+
 class TradingFrame(tb.Frame):
     """交易操作页面框架"""
     
     def __init__(self, parent, username):
         super().__init__(parent)
         self.username = username
+        self.transaction_offset = 0  # 已加载的交易记录条数
+        self.data_version = None  # 页面隐藏时的数据版本
         
         # 创建标题
         self.title_label = tb.Label(self, text="交易操作", style="Title.TLabel")
@@ -197,6 +202,10 @@ class TradingFrame(tb.Frame):
         scrollbar = tb.Scrollbar(self.transaction_frame, orient=tk.VERTICAL, command=self.transaction_tree.yview)
         self.transaction_tree.configure(yscrollcommand=scrollbar.set)
         
+        # 加载更多按钮（放在列表下方）
+        self.more_btn = tb.Button(self.right_frame, text="加载更多", command=self.load_more_transactions)
+        self.more_btn.pack(side=tk.BOTTOM, pady=5, before=self.transaction_frame)
+        
         # 布局
         self.transaction_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -233,21 +242,32 @@ class TradingFrame(tb.Frame):
         self.stock_tree.tag_configure('flat', foreground='black')
     
     def load_transactions(self):
-        """加载交易记录"""
+        """加载交易记录（最新的一页）"""
         # 清空列表
         for item in self.transaction_tree.get_children():
             self.transaction_tree.delete(item)
         
-        # 获取交易记录
-        transactions = db.get_user_transactions(self.username)
+        self.transaction_offset = 0
+        self.load_more_transactions()
         
-        # 添加到列表
+        # 设置颜色
+        self.transaction_tree.tag_configure('buy', foreground='red')
+        self.transaction_tree.tag_configure('sell', foreground='green')
+    
+    def load_more_transactions(self):
+        """按时间倒序加载下一页交易记录"""
+        transactions = db.get_user_transactions(self.username, offset=self.transaction_offset,
+                                                limit=TRANSACTION_PAGE_SIZE, newest_first=True)
+        self.transaction_offset += len(transactions)
+        
+        # 添加到列表末尾（越往下越早）
         for transaction in transactions:
             # 交易类型
             trade_type = "买入" if transaction.get("type") == "buy" else "卖出"
             # 交易时间
             timestamp = transaction.get("timestamp", "")
-            # 股票名称
+            # 股票代码和名称
+            stock_code = transaction.get("stock_code", "")
             stock_name = transaction.get("stock_name", "")
             # 价格
             price = transaction.get("price", 0)
@@ -260,11 +280,10 @@ class TradingFrame(tb.Frame):
             tag = "buy" if trade_type == "买入" else "sell"
             
             # 插入数据
-            self.transaction_tree.insert('', 0, values=(timestamp, trade_type, stock_name, f"{price:.2f}", quantity, f"{amount:.2f}"), tags=(tag,))
+            self.transaction_tree.insert('', tk.END, values=(timestamp, trade_type, stock_code, stock_name, f"{price:.2f}", quantity, f"{amount:.2f}"), tags=(tag,))
         
-        # 设置颜色
-        self.transaction_tree.tag_configure('buy', foreground='red')
-        self.transaction_tree.tag_configure('sell', foreground='green')
+        # 没有更多记录时禁用按钮
+        self.more_btn.config(state=tk.NORMAL if len(transactions) == TRANSACTION_PAGE_SIZE else tk.DISABLED)
     
     def search_stock(self):
         """搜索股票"""
@@ -330,6 +349,22 @@ class TradingFrame(tb.Frame):
         # 启用提交按钮
         self.submit_btn.config(state=tk.NORMAL)
     
+    def on_hide(self):
+        """页面隐藏：记录当前数据版本"""
+        self.data_version = db.get_data_version()
+    
+    def on_show(self):
+        """页面重新显示：隐藏期间股价或账户有变化时刷新一次"""
+        if db.get_data_version() == self.data_version:
+            return
+        self.load_data()
+        self.update_user_info()
+        code = self.code_var.get()
+        if code:
+            self.update_holding_quantity(code)
+        if self.transaction_offset:
+            self.load_transactions()
+    
     def update_user_info(self):
         """更新用户账户信息"""
         user = db.get_user(self.username)
@@ -0,0 +1,110 @@
+import os
+import json
+import threading
+
+
+class WriteAheadLog:
+    """
+    交易预写日志(WAL)
+
+    一笔（或一批）交易先以 {"seq": n, ...} 记录追加并fsync，这一步就是提交点；
+    随后再更新用户存储和交易日志，完成后追加 {"done": n} 标记。
+    启动时没有 done 标记的记录会被重放，重放操作必须是幂等的。
+    """
+
+    # 没有未完成记录且文件超过该大小时截断
+    TRUNCATE_SIZE = 1024 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._pending = set()   # 本进程已提交但尚未标记完成的序号
+        self._seq = self._max_seq()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # 末尾的残缺行补上换行，避免和下一条记录拼在一起
+        size = os.fstat(self._fd).st_size
+        if size > 0:
+            with open(self.path, "rb") as f:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    os.write(self._fd, b"\n")
+
+    def _read_lines(self):
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # 提交时被中断的残缺行，对应的交易未提交
+                    continue
+        return records
+
+    def _max_seq(self):
+        seqs = [r.get("seq", r.get("done", 0)) for r in self._read_lines()]
+        return max(seqs, default=0)
+
+    def pending(self):
+        """返回已提交但未完成的记录（按序号排序）"""
+        entries = {}
+        for record in self._read_lines():
+            if "done" in record:
+                entries.pop(record["done"], None)
+            elif "seq" in record:
+                entries[record["seq"]] = record
+        return [entries[seq] for seq in sorted(entries)]
+
+    def recovery(self):
+        """
+        返回启动时需要处理的 (待重放记录, 已被取代的记录)，均按序号排序
+
+        记录保存的是交易后的绝对余额和持仓。同一用户在这条记录之后还有已完成的记录时，
+        后者是在没有应用这笔交易的状态上计算的，重放旧记录会覆盖更新的余额和持仓，因此不再重放。
+        """
+        records = self._read_lines()
+        entries = {r["seq"]: r for r in records if "seq" in r}
+        done = {r["done"] for r in records if "done" in r}
+        completed = {}  # 用户 → 已完成记录的最大序号
+        for seq in done:
+            username = entries.get(seq, {}).get("username")
+            if username is not None:
+                completed[username] = max(completed.get(username, 0), seq)
+        replay, superseded = [], []
+        for seq in sorted(set(entries) - done):
+            entry = entries[seq]
+            (superseded if completed.get(entry.get("username"), 0) > seq else replay).append(entry)
+        return replay, superseded
+
+    def commit(self, entries):
+        """
+        追加一批记录并fsync，一次fsync提交整批交易（组提交）
+        :return: 分配给这批记录的序号列表
+        """
+        with self.lock:
+            seqs = []
+            lines = []
+            for entry in entries:
+                self._seq += 1
+                seqs.append(self._seq)
+                lines.append(json.dumps(dict(entry, seq=self._seq), ensure_ascii=False) + "\n")
+            os.write(self._fd, "".join(lines).encode("utf-8"))
+            os.fsync(self._fd)
+            self._pending.update(seqs)
+            return seqs
+
+    def mark_done(self, seqs):
+        """标记记录已应用到存储中，不需要fsync：丢失标记只会导致一次幂等重放"""
+        with self.lock:
+            lines = "".join(json.dumps({"done": seq}) + "\n" for seq in seqs)
+            os.write(self._fd, lines.encode("utf-8"))
+            self._pending.difference_update(seqs)
+            if not self._pending and os.fstat(self._fd).st_size > self.TRUNCATE_SIZE:
+                os.ftruncate(self._fd, 0)
+
+    def close(self):
+        with self.lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
@@ -0,0 +1,386 @@
+import os
+import json
+import time
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+
+from .indicators import (DEFAULT_THRESHOLDS, DEFAULT_WEIGHTS, ma_signal, rsi, classify_rsi, volume_features, classify_volume,
+                         price_momentum, volatility, classify_volatility)
+from .backtest import DatePanel, rebalance_rows, simulate
+from .storage import atomic_write_json
+
+# 权重向量中各信号的顺序
+SIGNAL_KEYS = ('ma_signal', 'rsi_signal', 'volume_signal', 'price_momentum', 'volatility_signal')
+
+# 随机搜索和交叉熵搜索中各阈值的取值范围
+THRESHOLD_RANGES = {
+    'rsi_oversold': (20, 40),
+    'rsi_overbought': (60, 80),
+    'volume_surge': (1.2, 2.5),
+    'volume_shrink': (0.5, 0.95),
+    'volatility_high': (0.03, 0.08),
+    'volatility_low': (0.01, 0.03),
+}
+
+# 网格搜索的阈值候选：成对的阈值一起变化
+THRESHOLD_GRID = {
+    ('rsi_oversold', 'rsi_overbought'): [(25, 75), (30, 70), (35, 65)],
+    ('volume_surge', 'volume_shrink'): [(1.3, 0.8), (1.5, 0.8), (2.0, 0.7)],
+    ('volatility_high', 'volatility_low'): [(0.04, 0.02), (0.05, 0.02), (0.06, 0.03)],
+}
+
+# 优化结果文件的格式版本，格式不兼容时递增
+WEIGHT_CONFIG_SCHEMA = 1
+
+# 可选的优化目标（BacktestResult.metrics 中的键）
+OBJECTIVES = ("sharpe", "annual_return", "hit_rate", "mean_period_return")
+
+
+class SignalFeatures:
+    """
+    调仓日上各项信号的原始量（只计算一次）
+
+    与阈值无关的均线信号和动量信号直接保存；RSI、量比、波动率保存原始值，
+    换一组阈值时只需要重新分类，不必重新做滚动计算。
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    @classmethod
+    def from_panel(cls, panel, holding_period):
+        close, volume = panel["close"], panel["volume"]
+        counts = panel.window_counts()
+        rows, forward = rebalance_rows(panel, holding_period)
+        volume_ratio, price_change, volume_ma = volume_features(close, volume)
+        full = {
+            'ma_signal': ma_signal(close, counts),
+            'price_momentum': price_momentum(close, counts - 1),
+            'rsi': rsi(close),
+            'volume_ratio': volume_ratio,
+            'price_change': price_change,
+            'volume_ma': volume_ma,
+            'volatility': volatility(close),
+            'counts': counts,
+        }
+        arrays = {name: values[rows] for name, values in full.items()}
+        arrays['forward'] = forward
+        arrays['dates'] = panel.dates[rows]
+        return cls(arrays)
+
+    def split(self, fraction):
+        """按调仓日先后切分为训练段和检验段"""
+        cut = int(len(self.arrays['dates']) * fraction)
+        return (SignalFeatures({name: values[:cut] for name, values in self.arrays.items()}),
+                SignalFeatures({name: values[cut:] for name, values in self.arrays.items()}))
+
+    def signal_stack(self, thresholds):
+        """按一组阈值得到五项信号，形状为 (5, 调仓日数 × 股票数)，顺序同 SIGNAL_KEYS"""
+        a = self.arrays
+        counts = a['counts']
+        signals = {
+            'ma_signal': a['ma_signal'],
+            'rsi_signal': classify_rsi(a['rsi'], counts, thresholds),
+            'volume_signal': classify_volume(a['volume_ratio'], a['price_change'], a['volume_ma'], counts, thresholds),
+            'price_momentum': a['price_momentum'],
+            'volatility_signal': classify_volatility(a['volatility'], counts - 1, thresholds),
+        }
+        return np.stack([signals[key].ravel() for key in SIGNAL_KEYS])
+
+    def evaluate(self, thresholds, weight_matrix, settings):
+        """
+        用同一组阈值评估多组权重：概率矩阵由一次矩阵乘法得到
+        :param weight_matrix: (候选数, 5)
+        :return: [(目标值, 指标字典)]
+        """
+        forward, dates = self.arrays['forward'], self.arrays['dates']
+        shape = forward.shape
+        stack = self.signal_stack(thresholds)
+        results = []
+        # 分块做矩阵乘法，限制 (候选数 × 调仓日 × 股票数) 的内存占用
+        chunk = max(1, int(2e7 // max(stack.shape[1], 1)))
+        for start in range(0, len(weight_matrix), chunk):
+            probabilities = np.clip((weight_matrix[start:start + chunk] @ stack + 1) * 50, 0, 100)
+            for probability in probabilities:
+                result = simulate(probability.reshape(shape), forward, dates,
+                                  settings["top_n"], settings["fee_rate"], settings["side"])
+                metrics = result.metrics(settings["holding_period"])
+                results.append((metrics.get(settings["objective"], 0.0), metrics))
+        return results
+
+
+# 进程池子进程中的特征数据，由 _init_worker 在子进程启动时设置一次
+_worker_features = None
+
+
+def _init_worker(arrays):
+    global _worker_features
+    _worker_features = SignalFeatures(arrays)
+
+
+def _evaluate_task(thresholds, weight_matrix, settings):
+    return thresholds, weight_matrix, _worker_features.evaluate(thresholds, weight_matrix, settings)
+
+
+def simplex_grid(step):
+    """所有分量为 step 的整数倍且和为1的权重向量"""
+    units = int(round(1 / step))
+    grid = [combo for combo in itertools.product(range(units + 1), repeat=len(SIGNAL_KEYS)) if sum(combo) == units]
+    return np.array(grid, dtype=np.float64) / units
+
+
+def threshold_grid():
+    """THRESHOLD_GRID 中各组阈值的全部组合"""
+    grid = []
+    for choice in itertools.product(*THRESHOLD_GRID.values()):
+        thresholds = {}
+        for keys, values in zip(THRESHOLD_GRID, choice):
+            thresholds.update(zip(keys, values))
+        grid.append(thresholds)
+    return grid
+
+
+def sample_thresholds(rng, mean=None, scale=None):
+    """在 THRESHOLD_RANGES 内随机取一组阈值；给出 mean/scale 时按正态分布在其附近取值"""
+    thresholds = {}
+    for key, (low, high) in THRESHOLD_RANGES.items():
+        if mean is None:
+            value = rng.uniform(low, high)
+        else:
+            value = rng.normal(mean[key], scale[key])
+        thresholds[key] = float(np.clip(value, low, high))
+    return thresholds
+
+
+def weights_to_dict(vector):
+    return {key: float(round(value, 6)) for key, value in zip(SIGNAL_KEYS, vector)}
+
+
+class WeightOptimizer:
+    """
+    推荐权重与信号阈值的搜索
+
+    先在历史K线上把信号原始量算好，每组阈值只重新分类一次，再用一次矩阵乘法得到该阈值下所有候选权重的概率矩阵；
+    不同的阈值组合分给进程池并行评估。支持网格搜索（grid）、随机搜索（random）和交叉熵迭代搜索（cem）。
+    """
+
+    def __init__(self, features, top_n=5, holding_period=5, fee_rate=0.0015, side="long_short",
+                 objective="sharpe", max_workers=0):
+        if objective not in OBJECTIVES:
+            raise ValueError(f"未知的优化目标: {objective}")
+        self.features = features
+        self.settings = {"top_n": top_n, "holding_period": holding_period, "fee_rate": fee_rate,
+                         "side": side, "objective": objective}
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.evaluated = 0
+
+    def evaluate(self, candidates, pool=None):
+        """
+        :param candidates: [(阈值字典, 权重矩阵)]
+        :return: [(目标值, 权重字典, 阈值字典, 指标字典)]
+        """
+        results = []
+
+        def collect(thresholds, weight_matrix, scores):
+            for vector, (score, metrics) in zip(weight_matrix, scores):
+                results.append((score, weights_to_dict(vector), thresholds, metrics))
+
+        if pool is None:
+            for thresholds, weight_matrix in candidates:
+                collect(thresholds, weight_matrix, self.features.evaluate(thresholds, weight_matrix, self.settings))
+        else:
+            futures = [pool.submit(_evaluate_task, thresholds, weight_matrix, self.settings)
+                       for thresholds, weight_matrix in candidates]
+            for future in as_completed(futures):
+                collect(*future.result())
+        self.evaluated += len(results)
+        return results
+
+    def _pool(self):
+        if self.max_workers <= 1:
+            return None
+        # 子进程启动时接收一次特征数据，之后每个任务只传阈值和权重
+        return ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(self.features.arrays,))
+
+    def search(self, method="grid", step=0.1, samples=200, threshold_samples=8, rounds=5, elite=0.1, seed=0):
+        """
+        :param method: grid / random / cem
+        :param step: 网格搜索的权重步长
+        :param samples: 随机搜索和每轮交叉熵搜索的权重候选数
+        :param threshold_samples: 随机搜索和每轮交叉熵搜索的阈值候选数
+        :return: 按目标值从高到低排序的 [(目标值, 权重字典, 阈值字典, 指标字典)]
+        """
+        rng = np.random.default_rng(seed)
+        baseline = np.array([[DEFAULT_WEIGHTS[key] for key in SIGNAL_KEYS]])
+        pool = self._pool()
+        try:
+            results = self.evaluate([(dict(DEFAULT_THRESHOLDS), baseline)], pool)
+            if method == "grid":
+                weights = simplex_grid(step)
+                results += self.evaluate([(thresholds, weights) for thresholds in threshold_grid()], pool)
+            elif method == "random":
+                weights = rng.dirichlet(np.ones(len(SIGNAL_KEYS)), samples)
+                candidates = [(dict(DEFAULT_THRESHOLDS), weights)]
+                candidates += [(sample_thresholds(rng), weights) for _ in range(threshold_samples)]
+                results += self.evaluate(candidates, pool)
+            elif method == "cem":
+                results += self._cross_entropy(rng, pool, samples, threshold_samples, rounds, elite)
+            else:
+                raise ValueError(f"未知的搜索方式: {method}")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        results.sort(key=lambda item: item[0], reverse=True)
+        return results
+
+    def _cross_entropy(self, rng, pool, samples, threshold_samples, rounds, elite):
+        """交叉熵方法：每轮在当前分布下采样，用表现最好的一部分候选更新权重和阈值的分布"""
+        weight_mean = np.array([DEFAULT_WEIGHTS[key] for key in SIGNAL_KEYS])
+        concentration = 20.0
+        threshold_mean = dict(DEFAULT_THRESHOLDS)
+        threshold_scale = {key: (high - low) / 4 for key, (low, high) in THRESHOLD_RANGES.items()}
+        results = []
+        for _ in range(rounds):
+            weights = rng.dirichlet(np.maximum(weight_mean * concentration, 0.05), samples)
+            candidates = [(sample_thresholds(rng, threshold_mean, threshold_scale), weights)
+                          for _ in range(threshold_samples)]
+            batch = self.evaluate(candidates, pool)
+            results += batch
+            batch.sort(key=lambda item: item[0], reverse=True)
+            best = batch[:max(1, int(len(batch) * elite))]
+            weight_mean = np.mean([[w[key] for key in SIGNAL_KEYS] for _, w, _, _ in best], axis=0)
+            for key in THRESHOLD_RANGES:
+                values = [t[key] for _, _, t, _ in best]
+                threshold_mean[key] = float(np.mean(values))
+                threshold_scale[key] = max(float(np.std(values)), 1e-3 * threshold_mean[key])
+            concentration *= 1.5
+        return results
+
+
+def load_weight_config(path):
+    """
+    读取优化后的推荐配置
+    :return: {"version", "weights", "thresholds", ...}，文件不存在或内容无效时返回 None
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("schema") != WEIGHT_CONFIG_SCHEMA:
+            print(f"推荐权重: {path} 格式版本 {data.get('schema')} 不受支持，使用默认权重")
+            return None
+        weights = {key: float(data["weights"][key]) for key in SIGNAL_KEYS}
+        thresholds = dict(DEFAULT_THRESHOLDS)
+        thresholds.update({key: float(value) for key, value in data.get("thresholds", {}).items()
+                           if key in DEFAULT_THRESHOLDS})
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"推荐权重: 读取 {path} 失败，使用默认权重: {e}")
+        return None
+    data["weights"], data["thresholds"] = weights, thresholds
+    return data
+
+
+def save_weight_config(path, weights, thresholds, info):
+    """
+    写入优化后的推荐配置，版本号在原文件基础上加1，旧版本的摘要保留在 history 中
+    :return: 新的版本号
+    """
+    previous = load_weight_config(path)
+    history = []
+    version = 1
+    if previous is not None:
+        version = int(previous.get("version", 0)) + 1
+        history = previous.get("history", [])
+        history.append({key: previous.get(key) for key in ("version", "created_at", "weights", "thresholds", "objective")})
+    data = {
+        "schema": WEIGHT_CONFIG_SCHEMA,
+        "version": version,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "weights": weights,
+        "thresholds": thresholds,
+        **info,
+        "history": history[-20:],
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    atomic_write_json(path, data)
+    return version
+
+
+def optimize(frames, method="grid", holding_period=5, top_n=5, fee_rate=0.0015, side="long_short",
+             objective="sharpe", train_fraction=0.7, max_workers=0, **search_args):
+    """
+    在历史K线上搜索权重和阈值：前 train_fraction 的调仓日用于搜索，其余用于检验最优结果
+    :return: (最优结果, 检验段指标, 默认配置在检验段的指标, 评估的候选数, 耗时)
+    """
+    start = time.perf_counter()
+    features = SignalFeatures.from_panel(DatePanel(frames), holding_period)
+    train, test = features.split(train_fraction)
+    optimizer = WeightOptimizer(train, top_n, holding_period, fee_rate, side, objective, max_workers)
+    results = optimizer.search(method, **search_args)
+    best = results[0]
+    _, weights, thresholds, _ = best
+    checker = WeightOptimizer(test, top_n, holding_period, fee_rate, side, objective, max_workers=1)
+    vector = np.array([[weights[key] for key in SIGNAL_KEYS]])
+    baseline = np.array([[DEFAULT_WEIGHTS[key] for key in SIGNAL_KEYS]])
+    test_metrics = checker.evaluate([(thresholds, vector)])[0][3]
+    baseline_metrics = checker.evaluate([(dict(DEFAULT_THRESHOLDS), baseline)])[0][3]
+    return best, test_metrics, baseline_metrics, optimizer.evaluated, time.perf_counter() - start
+
+
+def main():
+    """用本地K线缓存优化推荐权重并写入配置文件：python -m modules.weight_optimizer"""
+    import argparse
+    from .bar_cache import BarStore
+    from .backtest import load_cached_frames
+    from .config import get_config
+    from .database import db
+
+    parser = argparse.ArgumentParser(description="推荐权重与信号阈值优化")
+    parser.add_argument("--start", default="2020-01-01", help="历史数据开始日期")
+    parser.add_argument("--end", default=datetime.now().strftime("%Y-%m-%d"), help="历史数据结束日期")
+    parser.add_argument("--method", choices=("grid", "random", "cem"), default="cem", help="搜索方式")
+    parser.add_argument("--objective", choices=OBJECTIVES, default="sharpe", help="优化目标")
+    parser.add_argument("--holding", type=int, default=5, help="持有期（交易日）")
+    parser.add_argument("--top-n", type=int, default=5, help="每期做多/做空的股票数量")
+    parser.add_argument("--fee", type=float, default=0.0015, help="单边手续费率")
+    parser.add_argument("--side", choices=("long", "short", "long_short"), default="long_short", help="持仓方向")
+    parser.add_argument("--workers", type=int, default=0, help="进程数，0 表示使用全部CPU核心")
+    parser.add_argument("--dry-run", action="store_true", help="只显示结果，不写入配置文件")
+    args = parser.parse_args()
+
+    config = get_config()
+    store = BarStore(config["bar_cache_path"], config["bar_cache_today_ttl"])
+    frames = load_cached_frames(store, list(db.get_stocks().keys()), args.start, args.end)
+    if not frames:
+        print("推荐权重: 本地K线缓存中没有历史数据")
+        return 1
+    best, test_metrics, baseline_metrics, evaluated, elapsed = optimize(
+        frames, args.method, args.holding, args.top_n, args.fee, args.side, args.objective, max_workers=args.workers)
+    score, weights, thresholds, train_metrics = best
+    print(f"推荐权重: 评估 {evaluated} 组候选，耗时 {elapsed:.1f}s")
+    print(f"最优权重: {weights}")
+    print(f"最优阈值: {thresholds}")
+    print(f"训练段 {args.objective}={score:.4f}，检验段 {args.objective}={test_metrics.get(args.objective, 0):.4f}"
+          f"（默认配置 {baseline_metrics.get(args.objective, 0):.4f}）")
+    if args.dry_run:
+        return 0
+    version = save_weight_config(config["recommendation_weights_path"], weights, thresholds, {
+        "objective": args.objective,
+        "train": train_metrics,
+        "test": test_metrics,
+        "baseline_test": baseline_metrics,
+        "search": {"method": args.method, "start": args.start, "end": args.end, "holding_period": args.holding,
+                   "top_n": args.top_n, "fee_rate": args.fee, "side": args.side, "symbols": len(frames)},
+    })
+    print(f"推荐权重: 已写入 {config['recommendation_weights_path']}（版本 {version}）")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
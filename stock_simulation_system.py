@@ -1,14 +1,43 @@
+import time
+
+# 启动计时起点，用于统计登录界面出现前的耗时
+STARTUP_TIME = time.perf_counter()
+
 import tkinter as tk
 import ttkbootstrap as tb
 from ttkbootstrap import Style
 from ttkbootstrap.dialogs import Messagebox
 import sys
 import os
+import importlib
+import threading
+from collections import Counter
 from modules.login import LoginFrame
-from modules.market import MarketFrame
-from modules.trading import TradingFrame
-from modules.news import NewsFrame
-from modules.account import AccountFrame
+from modules.config import get_config
+
+# 页面注册表：页面名称 -> (模块, 类名, 构造时是否传入用户名)
+# 页面模块在第一次使用时才导入，登录界面出现前不会加载 matplotlib、akshare 等依赖
+FRAME_REGISTRY = {
+    "market": ("modules.market", "MarketFrame", True),
+    "trading": ("modules.trading", "TradingFrame", True),
+    "recommendation": ("modules.recommendation", "RecommendationFrame", True),
+    "news": ("modules.news", "NewsFrame", False),
+    "account": ("modules.account", "AccountFrame", True),
+    "admin": ("modules.admin", "AdminFrame", False),
+}
+
+
+# 导航栏中的页面顺序，没有历史导航记录时预取下一个页面
+NAVIGATION_ORDER = ["market", "trading", "recommendation", "news", "account", "admin"]
+
+# 显示页面后延迟多久（毫秒）在空闲时预取下一个页面
+PREFETCH_DELAY_MS = 500
+
+
+def load_frame_class(frame_name):
+    """导入并返回页面类"""
+    module_name, class_name, _ = FRAME_REGISTRY[frame_name]
+    return getattr(importlib.import_module(module_name), class_name)
 
 
 class StockSimulationApp:
@@ -40,8 +69,35 @@ class StockSimulationApp:
         self.content_frame = tb.Frame(self.main_frame, bootstyle="dark")
         self.content_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        # 存储各个页面框架
+        # 存储各个页面框架（第一次显示时才创建）
         self.frames = {}
+        self.current_frame = None
+        # 页面跳转次数 {来源页面: Counter(目标页面)}，用于预测下一个页面
+        self.page_transitions = {}
+        
+        # 登录界面显示后再在后台同步行情，同步完成后刷新行情页面
+        self.root.after_idle(self.on_login_shown)
+    
+    def on_login_shown(self):
+        """登录界面已显示：记录启动耗时，在后台线程中导入行情模块并开始预热"""
+        print(f"登录界面已显示，启动耗时 {time.perf_counter() - STARTUP_TIME:.2f}s")
+        threading.Thread(target=self.start_warmup, daemon=True).start()
+    
+    def start_warmup(self):
+        """导入行情数据模块（含pandas等依赖）并启动后台预热"""
+        from modules.stock_data import stock_manager
+        stock_manager.subscribe_warmup(self.on_warmup_finished)
+        stock_manager.start_warmup()
+    
+    def on_warmup_finished(self, report, error):
+        """后台预热完成（在预热线程中调用），切回主线程刷新界面"""
+        self.root.after(0, self.refresh_after_warmup)
+    
+    def refresh_after_warmup(self):
+        """用同步后的价格刷新已创建的行情页面"""
+        market = self.frames.get("market")
+        if market is not None:
+            market.load_market_data()
         
     def handle_login_success(self, user):
         """登录回调函数"""
@@ -96,36 +152,88 @@ class StockSimulationApp:
         logout_btn.pack(fill=tk.X, pady=5, padx=10, side=tk.BOTTOM)
     
     def initialize_frames(self):
-        """初始化各个页面框架"""
-        # 市场信息页面
-        self.frames["market"] = MarketFrame(self.content_frame, self.current_user)
-        
-        # 交易操作页面
-        self.frames["trading"] = TradingFrame(self.content_frame, self.current_user)
-        
-        # 股票推荐页面
-        from modules.recommendation import RecommendationFrame
-        self.frames["recommendation"] = RecommendationFrame(self.content_frame, self.current_user)
-        
-        # 新闻资讯页面
-        self.frames["news"] = NewsFrame(self.content_frame)
-        
-        # 账户信息页面
-        self.frames["account"] = AccountFrame(self.content_frame, self.current_user)
-        
-        # 如果是管理员，创建管理员页面
-        if self.user_type == "admin":
-            from modules.admin import AdminFrame
-            self.frames["admin"] = AdminFrame(self.content_frame)
+        """初始化页面状态，各页面在第一次显示时才创建"""
+        self.frames = {}
+        self.current_frame = None
+    
+    def available_frames(self):
+        """当前用户可以访问的页面"""
+        return [name for name in NAVIGATION_ORDER if name != "admin" or self.user_type == "admin"]
+    
+    def create_frame(self, frame_name):
+        """通过页面注册表导入并创建页面"""
+        frame_class = load_frame_class(frame_name)
+        _, _, needs_user = FRAME_REGISTRY[frame_name]
+        args = (self.current_user,) if needs_user else ()
+        return frame_class(self.content_frame, *args)
     
     def show_frame(self, frame_name):
-        """显示指定的页面"""
-        # 隐藏所有页面
+        """显示指定的页面，页面不存在时先创建"""
+        if frame_name == self.current_frame:
+            return
+        
+        resumed = frame_name in self.frames
+        if not resumed:
+            self.frames[frame_name] = self.create_frame(frame_name)
+        
+        # 隐藏所有页面，通知之前显示的页面暂停周期性任务
         for frame in self.frames.values():
             frame.pack_forget()
+        previous = self.current_frame
+        if previous in self.frames:
+            self.call_frame_hook(previous, "on_hide")
         
-        # 显示指定页面
+        # 显示指定页面；之前创建过的页面补做一次刷新
         self.frames[frame_name].pack(fill=tk.BOTH, expand=True)
+        self.current_frame = frame_name
+        if resumed:
+            self.call_frame_hook(frame_name, "on_show")
+        
+        if previous is not None:
+            self.page_transitions.setdefault(previous, Counter())[frame_name] += 1
+        self.schedule_prefetch(frame_name)
+    
+    def call_frame_hook(self, frame_name, hook):
+        """调用页面的 on_show/on_hide 钩子（页面未定义时忽略）"""
+        method = getattr(self.frames[frame_name], hook, None)
+        if method is not None:
+            try:
+                method()
+            except Exception as e:
+                print(f"页面 {frame_name} 的 {hook} 出错: {e}")
+    
+    def predict_next_frame(self, frame_name):
+        """预测下一个最可能访问的页面：优先按历史跳转次数，否则取导航栏中的下一个"""
+        available = self.available_frames()
+        transitions = self.page_transitions.get(frame_name)
+        if transitions:
+            for name, _ in transitions.most_common():
+                if name in available and name not in self.frames:
+                    return name
+        index = available.index(frame_name) if frame_name in available else -1
+        for name in available[index + 1:] + available[:index + 1]:
+            if name not in self.frames:
+                return name
+        return None
+    
+    def schedule_prefetch(self, frame_name):
+        """在空闲时预先创建下一个可能访问的页面"""
+        if not get_config()["prefetch_frames"]:
+            return
+        next_frame = self.predict_next_frame(frame_name)
+        if next_frame is not None:
+            self.root.after(PREFETCH_DELAY_MS, lambda: self.root.after_idle(self.prefetch_frame, next_frame))
+    
+    def prefetch_frame(self, frame_name):
+        """预先创建页面但不显示"""
+        # 已退出登录或页面已被创建时跳过
+        if self.current_user is None or frame_name in self.frames:
+            return
+        if frame_name not in self.available_frames():
+            return
+        self.frames[frame_name] = self.create_frame(frame_name)
+        # 预取的页面处于隐藏状态，显示时按需补做刷新
+        self.call_frame_hook(frame_name, "on_hide")
     
     def show_market(self):
         """显示市场信息页面"""
@@ -150,7 +258,7 @@ class StockSimulationApp:
     #此部分代码仅仅执行了显示admin的工作，没有处理其他页面，暂定，先看admin结果
     def show_admin(self):
         """显示管理员页面"""
-        if self.user_type == "admin" and "admin" in self.frames:
+        if self.user_type == "admin":
             self.show_frame("admin")
         
     
@@ -163,6 +271,7 @@ class StockSimulationApp:
                 if self.frames[frame_name] is not None:
                     self.frames[frame_name].destroy()
             self.frames.clear() # 清空框架字典
+            self.current_frame = None
 
             # 额外确保content_frame被清空
             for widget in self.content_frame.winfo_children():
@@ -0,0 +1,59 @@
+"""
+回测测试：向量化滚动计算的每日信号与推荐引擎在当天窗口上的逐只分析一致
+
+运行: python -m pytest -q tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import make_bar_frames
+
+
+class BacktestSignalTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cwd = os.getcwd()
+        cls.tmp_dir = tempfile.mkdtemp(prefix="stock_test_")
+        os.chdir(cls.tmp_dir)
+        from modules.recommendation import StockRecommendationEngine
+        cls.engine = StockRecommendationEngine()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+
+    def test_daily_signals_match_per_stock_analysis(self):
+        import numpy as np
+        import pandas as pd
+        from modules.backtest import DatePanel, window_signals
+        from modules.indicators import combine_signals
+        from modules.streaming import LOOKBACK_DAYS
+
+        frames = make_bar_frames(20, 120)
+        panel = DatePanel(frames)
+        probability = combine_signals(window_signals(panel), self.engine.indicators_weights)
+
+        checked, mismatches = 0, []
+        for col, code in enumerate(panel.codes):
+            df = frames[code]
+            for i in range(len(df)):
+                today = pd.Timestamp(df["date"].iloc[i])
+                cutoff = (today - pd.Timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+                window = df.iloc[:i + 1]
+                expected, _ = self.engine.analyze_dataframe(window[window["date"] >= cutoff])
+                row = int(np.searchsorted(panel.dates, np.datetime64(df["date"].iloc[i])))
+                checked += 1
+                if abs(float(expected) - float(probability[row, col])) > 1e-9:
+                    mismatches.append((code, df["date"].iloc[i], float(expected), float(probability[row, col])))
+        self.assertGreater(checked, 0)
+        self.assertEqual(mismatches, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
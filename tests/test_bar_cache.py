@@ -0,0 +1,88 @@
+"""
+K线缓存测试：空结果不删除已缓存的K线，上市日之前的空区间只获取一次
+
+运行: python -m pytest -q tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from modules.bar_cache import BarStore
+
+LISTING_DATE = "2026-03-10"
+NOW = datetime(2026, 5, 2, 12, 0)  # 周六，当日K线不会过期
+
+
+class FakeUpstream:
+    """从上市日开始每个工作日一根K线；empty 为 True 时模拟上游暂时返回空结果"""
+
+    def __init__(self):
+        self.calls = []
+        self.empty = False
+
+    def __call__(self, start, end):
+        self.calls.append((start, end))
+        if self.empty:
+            return pd.DataFrame(columns=["date", "open", "high", "low", "close", "volume", "amount"])
+        dates = pd.bdate_range(max(start, LISTING_DATE), end)
+        close = [10.0 + i * 0.1 for i in range(len(dates))]
+        return pd.DataFrame({"date": dates.strftime("%Y-%m-%d"), "open": close, "high": close, "low": close,
+                             "close": close, "volume": 1000, "amount": 10000.0})
+
+
+class BarStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="stock_test_")
+        self.store = BarStore(os.path.join(self.tmp_dir, "bars.db"))
+        self.fetch = FakeUpstream()
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def get(self, start, end="2026-04-30", adjust="3"):
+        return self.store.get_bars("sh.600000", "d", adjust, start, end, self.fetch, now=NOW)
+
+    def test_empty_range_before_listing_is_fetched_once(self):
+        cached = self.get(LISTING_DATE)
+        # 请求上市日之前的数据：头部区间只有已缓存的第一根K线
+        df = self.get("2026-01-01")
+        pd.testing.assert_frame_equal(df, cached)
+        calls = len(self.fetch.calls)
+        for start in ("2026-01-01", "2026-02-01"):
+            pd.testing.assert_frame_equal(self.get(start), cached)
+        self.assertEqual(len(self.fetch.calls), calls)
+
+    def test_head_range_fills_bars_after_listing(self):
+        self.get("2026-03-20")
+        df = self.get("2026-01-01")
+        self.assertEqual(df["date"].iloc[0], LISTING_DATE)
+        self.assertEqual(len(df), len(pd.bdate_range(LISTING_DATE, "2026-04-30")))
+
+    def test_transient_empty_head_range_is_retried(self):
+        self.get("2026-03-20")
+        cached = self.get("2026-03-20")
+        self.fetch.empty = True
+        self.assertEqual(len(self.get("2026-01-01")), len(cached))
+        calls = len(self.fetch.calls)
+        self.fetch.empty = False
+        df = self.get("2026-01-01")
+        self.assertEqual(len(self.fetch.calls), calls + 1)
+        self.assertEqual(df["date"].iloc[0], LISTING_DATE)
+
+    def test_empty_tail_refetch_keeps_cached_bars(self):
+        cached = self.get("2026-03-20", "2026-04-20")
+        self.fetch.empty = True
+        df = self.get("2026-03-20", "2026-04-30")
+        pd.testing.assert_frame_equal(df, cached)
+
+
+if __name__ == "__main__":
+    unittest.main()
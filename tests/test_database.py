@@ -0,0 +1,69 @@
+"""
+数据库测试：用户缓存在存储读取失败时不被清空
+
+运行: python -m pytest -q tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class UserCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp(prefix="stock_test_")
+        os.chdir(self.tmp_dir)
+        from modules.database import Database
+        self.db = Database()
+        self.assertTrue(self.db.add_user("alice", "pwd", "user", 1000000.0)[0])
+
+    def tearDown(self):
+        self.db.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def fail_next_loads(self, count):
+        """让接下来 count 次读取失败，并让存储版本号变化以触发重新加载"""
+        storage = self.db.storage
+        load, version = storage.load_users, storage.version
+        state = {"failures": count}
+
+        def flaky_load():
+            if state["failures"] > 0:
+                state["failures"] -= 1
+                raise OSError("模拟读取失败")
+            return load()
+
+        def changed_version():
+            return ("changed", version())
+
+        storage.load_users = flaky_load
+        storage.version = changed_version
+        return state
+
+    def test_failed_reload_keeps_cached_users(self):
+        self.fail_next_loads(2)
+        self.assertIsNotNone(self.db.get_user("alice"))
+        self.assertTrue(self.db.user_exists("alice"))
+        ok, message = self.db.execute_trade("alice", "buy", next(iter(self.db.get_stocks())), 1)
+        self.assertTrue(ok, message)
+        # 读取恢复后重新加载，交易结果已写入存储
+        user = self.db.get_user("alice")
+        self.assertLess(user["balance"], 1000000.0)
+        self.assertEqual(sum(h["quantity"] for h in user["holdings"].values()), 1)
+
+    def test_failed_first_load_is_retried(self):
+        self.db._users_cache = None
+        state = self.fail_next_loads(1)
+        self.assertEqual(self.db.get_users(), {})
+        self.assertIsNone(self.db._users_cache)
+        self.assertEqual(state["failures"], 0)
+        self.assertIn("alice", self.db.get_users())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+数据库并发测试：多线程交易后余额和持仓与交易日志守恒，用户增删改在用户锁内检查存在性
+
+运行: python -m pytest -q tests
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class DatabaseConcurrencyTest(unittest.TestCase):
+    THREADS = 8
+    USERS = 4
+    TRADES = 100
+    INITIAL_BALANCE = 1000000.0
+
+    def setUp(self):
+        # 数据库在当前目录下创建 data/，每个测试使用独立的临时目录
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp(prefix="stock_test_")
+        os.chdir(self.tmp_dir)
+        from modules.database import Database
+        self.db = Database()
+
+    def tearDown(self):
+        self.db.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def run_threads(self, target, count):
+        errors = []
+
+        def run(i):
+            try:
+                target(i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_trades_conserve_balance_and_holdings(self):
+        db = self.db
+        usernames = [f"stress{i}" for i in range(self.USERS)]
+        for username in usernames:
+            self.assertTrue(db.add_user(username, "pwd", "user", self.INITIAL_BALANCE)[0])
+        codes = list(db.get_stocks().keys())
+        stop = threading.Event()
+
+        def trader(seed):
+            rng = random.Random(seed)
+            for _ in range(self.TRADES):
+                db.execute_trade(rng.choice(usernames), rng.choice(["buy", "sell"]),
+                                 rng.choice(codes), rng.randint(1, 10))
+
+        def price_writer():
+            rng = random.Random(-1)
+            while not stop.is_set():
+                code = rng.choice(codes)
+                db.update_stock(code, {"price": round(db.get_stock(code)["price"] * rng.uniform(0.98, 1.02), 2)})
+
+        writer = threading.Thread(target=price_writer)
+        writer.start()
+        try:
+            self.run_threads(trader, self.THREADS)
+        finally:
+            stop.set()
+            writer.join()
+        db.flush()
+
+        # 用交易日志重新计算余额和持仓
+        total_trades = 0
+        for username in usernames:
+            balance = self.INITIAL_BALANCE
+            quantities = {}
+            transactions = db.get_user_transactions(username)
+            total_trades += len(transactions)
+            for t in transactions:
+                sign = 1 if t["type"] == "buy" else -1
+                balance -= sign * t["amount"]
+                quantities[t["stock_code"]] = quantities.get(t["stock_code"], 0) + sign * t["quantity"]
+            user = db.get_user(username)
+            self.assertAlmostEqual(user["balance"], balance, places=6, msg=username)
+            self.assertEqual({code: h["quantity"] for code, h in user["holdings"].items()},
+                             {code: q for code, q in quantities.items() if q}, msg=username)
+            self.assertGreaterEqual(user["balance"], 0)
+        self.assertGreater(total_trades, 0)
+
+    def test_concurrent_add_same_user_succeeds_once(self):
+        results = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def add(i):
+            barrier.wait()
+            results.append(self.db.add_user("racer", f"pwd{i}", "user", 1000.0 + i))
+
+        self.run_threads(add, self.THREADS)
+        self.assertEqual(sum(ok for ok, _ in results), 1)
+        self.assertTrue(all(message == "用户名已存在" for ok, message in results if not ok))
+        self.assertIn("racer", self.db.get_users())
+
+    def test_update_racing_delete_does_not_resurrect_user(self):
+        db = self.db
+        self.assertTrue(db.add_user("victim", "pwd", "user", 1000.0)[0])
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def worker(i):
+            barrier.wait()
+            if i == 0:
+                results.append(db.delete_user("victim"))
+                return
+            for n in range(20):
+                results.append(db.update_user("victim", {"balance": 1000.0 + i * 100 + n}))
+
+        self.run_threads(worker, self.THREADS)
+        for ok, message in results:
+            self.assertTrue(ok or message == "用户不存在", message)
+        self.assertNotIn("victim", db.get_users())
+        self.assertIsNone(db.get_user("victim"))
+        self.assertFalse(db.delete_user("victim")[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
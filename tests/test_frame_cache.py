@@ -0,0 +1,79 @@
+"""
+图表数据缓存测试：盘中使用较短的有效期，盘后写入的数据最晚在下一个交易时段开始时过期
+
+运行: python -m pytest -q tests
+"""
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from modules.frame_cache import DataFrameLRU
+
+
+class FakeClock:
+    """同时替换 datetime.now() 和 time.monotonic() 的可控时钟"""
+
+    def __init__(self, now):
+        self.now = now
+        self.monotonic_value = 1000.0
+
+    def advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+        self.monotonic_value += seconds
+
+    def patch(self):
+        clock = self
+
+        class FakeDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return clock.now
+
+        fake_time = mock.Mock(monotonic=lambda: clock.monotonic_value)
+        return mock.patch.multiple("modules.frame_cache", datetime=FakeDatetime, time=fake_time)
+
+
+class DataFrameLRUTest(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({"close": [1.0, 2.0, 3.0]})
+        self.cache = DataFrameLRU(1 << 20, ttl=3600, trading_ttl=60)
+
+    def test_off_hours_entry_expires_at_session_open(self):
+        clock = FakeClock(datetime(2026, 10, 16, 9, 0))  # 周五开盘前
+        with clock.patch():
+            self.cache.put("k", self.df)
+            clock.advance(29 * 60)
+            self.assertIsNotNone(self.cache.get("k"))
+            clock.advance(60)  # 9:30 开盘
+            self.assertIsNone(self.cache.get("k"))
+
+    def test_lunch_break_entry_expires_at_afternoon_open(self):
+        clock = FakeClock(datetime(2026, 10, 16, 12, 45))
+        with clock.patch():
+            self.cache.put("k", self.df)
+            clock.advance(15 * 60)
+            self.assertIsNone(self.cache.get("k"))
+
+    def test_trading_and_weekend_ttl(self):
+        clock = FakeClock(datetime(2026, 10, 16, 10, 0))
+        with clock.patch():
+            self.cache.put("k", self.df)
+            clock.advance(61)
+            self.assertIsNone(self.cache.get("k"))
+        clock = FakeClock(datetime(2026, 10, 17, 10, 0))  # 周六使用完整的 ttl
+        with clock.patch():
+            self.cache.put("k", self.df)
+            clock.advance(3599)
+            self.assertIsNotNone(self.cache.get("k"))
+            clock.advance(2)
+            self.assertIsNone(self.cache.get("k"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+指标登记表测试：原有五项信号与 compute_signals 逐元素一致，全部指标下批量分析与逐只分析一致
+
+运行: python -m pytest -q tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import make_bar_frames, add_high_low
+
+
+class IndicatorRegistryTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cwd = os.getcwd()
+        cls.tmp_dir = tempfile.mkdtemp(prefix="stock_test_")
+        os.chdir(cls.tmp_dir)
+        cls.frames = add_high_low(make_bar_frames(200, 60))
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+
+    def test_default_indicators_match_compute_signals(self):
+        import numpy as np
+        from modules.indicators import BarPanel, compute_signals
+        from modules.indicator_registry import INDICATORS, DEFAULT_INDICATORS, compute_indicators, required_fields
+
+        panel = BarPanel(self.frames, required_fields(list(INDICATORS)))
+        expected = compute_signals(panel)
+        actual = compute_indicators(panel, DEFAULT_INDICATORS)
+        for name in DEFAULT_INDICATORS:
+            self.assertTrue(np.array_equal(expected[name], actual[name]), name)
+
+    def test_all_indicators_batch_matches_per_stock(self):
+        from modules.config import get_config
+        from modules.indicator_registry import INDICATORS
+        from modules.recommendation import StockRecommendationEngine
+
+        config = get_config()
+        saved = config["recommend_indicators"]
+        config["recommend_indicators"] = list(INDICATORS)
+        try:
+            engine = StockRecommendationEngine()
+        finally:
+            config["recommend_indicators"] = saved
+        self.assertEqual(engine.indicator_names, list(INDICATORS))
+
+        batch = engine.analyze_frames(self.frames)
+        for code, df in self.frames.items():
+            probability, reason = engine.analyze_dataframe(df)
+            self.assertAlmostEqual(float(batch[code][0]), float(probability), delta=1e-9, msg=code)
+            self.assertEqual(batch[code][1], reason, msg=code)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+交易日志测试：记录条数与读出的记录一致，残缺行和未写完的半行不计入
+
+运行: python -m pytest -q tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.journal import TransactionJournal
+
+
+class TransactionJournalCountTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="stock_test_")
+        self.journal = TransactionJournal(self.tmp_dir)
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def append(self, count, start=0):
+        for i in range(start, start + count):
+            self.journal.append("alice", {"txn_id": str(i), "type": "buy", "quantity": i})
+
+    def assertCountMatchesRead(self, expected):
+        self.assertEqual(self.journal.count("alice"), expected)
+        self.assertEqual(len(self.journal.read("alice")), expected)
+        self.assertEqual(len(self.journal.read("alice", newest_first=True)), expected)
+
+    def test_count_skips_torn_lines(self):
+        self.append(5)
+        self.assertCountMatchesRead(5)
+        # 模拟写入中断：末尾留下没有换行的半行
+        self.journal.close()
+        with open(self.journal.journal_file("alice"), "ab") as f:
+            f.write(b'{"txn_id": "torn", "ty')
+        self.assertCountMatchesRead(5)
+        # 重新打开时补换行，残缺行成为独立的坏行，之后的记录照常计入
+        self.append(3, start=5)
+        self.assertCountMatchesRead(8)
+
+    def test_count_is_incremental_and_reset_by_compact(self):
+        self.append(10)
+        self.assertEqual(self.journal.count("alice"), 10)
+        self.append(1, start=10)
+        self.assertEqual(self.journal.count("alice"), 11)
+        with open(self.journal.journal_file("alice"), "ab") as f:
+            f.write(b"not json\n")
+        self.assertEqual(self.journal.compact("alice"), 11)
+        self.assertCountMatchesRead(11)
+
+    def test_count_during_concurrent_appends(self):
+        stop = threading.Event()
+        counts = []
+
+        def counter():
+            while not stop.is_set():
+                counts.append(self.journal.count("alice"))
+
+        thread = threading.Thread(target=counter)
+        thread.start()
+        try:
+            self.append(2000)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(counts, sorted(counts))
+        self.assertTrue(all(0 <= c <= 2000 for c in counts))
+        self.assertCountMatchesRead(2000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+行情请求网关测试：并发启动、合并请求的放弃与 fanout 请求的并发上限
+
+运行: python -m pytest -q tests
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.market_gateway import MarketGateway, PRIORITY_CHART, PRIORITY_PREFETCH
+
+
+class MarketGatewayTest(unittest.TestCase):
+    def setUp(self):
+        self.gateway = MarketGateway(1, 0)
+
+    def tearDown(self):
+        self.gateway.close()
+
+    def test_concurrent_first_submits_wait_for_startup(self):
+        gateway = self.gateway
+        run = gateway._run
+
+        def slow_run(ready):
+            time.sleep(0.2)  # 事件循环线程准备队列较慢
+            run(ready)
+
+        gateway._run = slow_run
+        results, errors = [], []
+
+        def submit(i):
+            try:
+                results.append(gateway.submit(("start", i), lambda: i).result(timeout=10))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(results), list(range(5)))
+
+    def test_abandoned_imap_keeps_shared_request(self):
+        gateway = self.gateway
+        release = threading.Event()
+        blocker = gateway.submit(("blocker",), release.wait, 10, priority=PRIORITY_CHART)
+        shared = gateway.submit(("item", 1), lambda: "shared", priority=PRIORITY_PREFETCH)
+        # 第一个完成的是与 blocker 合并的请求，此时 ("item", 1) 还在排队，提前停止迭代只放弃 imap 自己的等待
+        items = gateway.imap(lambda item: item, ["blocker", 1, 2],
+                             key=lambda item: ("blocker",) if item == "blocker" else ("item", item))
+        threading.Timer(0.1, release.set).start()
+        self.assertEqual(next(items)[0], "blocker")
+        items.close()
+        blocker.result(timeout=10)
+        self.assertEqual(shared.result(timeout=10), "shared")
+
+    def test_fanout_children_count_against_limit(self):
+        gateway = self.gateway
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def child(item):
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return item
+
+        def fan_out():
+            return sorted(item for item, _, _ in gateway.imap(child, range(6)))
+
+        futures = [gateway.submit(("fanout",), fan_out, fanout=True) for _ in range(3)]
+        self.assertEqual([f.result(timeout=10) for f in futures], [list(range(6))] * 3)
+        self.assertEqual(running[1], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""
+推荐引擎测试：面板批量分析与逐只分析的概率和推荐理由一致
+
+运行: python -m pytest -q tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import make_bar_frames
+
+
+class RecommendationEquivalenceTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # 导入推荐模块会在当前目录下创建 data/，在临时目录中运行
+        cls.cwd = os.getcwd()
+        cls.tmp_dir = tempfile.mkdtemp(prefix="stock_test_")
+        os.chdir(cls.tmp_dir)
+        from modules.recommendation import StockRecommendationEngine
+        cls.engine = StockRecommendationEngine()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+
+    def test_panel_matches_per_stock(self):
+        frames = make_bar_frames(200, 40)
+        first = next(iter(frames))
+        frames[first] = frames[first].iloc[0:0]  # 一只没有数据的股票
+
+        actual = self.engine.analyze_frames(frames)
+        self.assertEqual(set(actual), set(frames))
+        for code, df in frames.items():
+            probability, reason = self.engine.analyze_dataframe(df)
+            self.assertAlmostEqual(float(actual[code][0]), float(probability), delta=1e-9, msg=code)
+            self.assertEqual(actual[code][1], reason, msg=code)
+
+    def test_single_bar_and_flat_prices(self):
+        frames = make_bar_frames(60, 3, seed=2)  # 只有1～3根K线，包含价格不变和零成交量的股票
+        actual = self.engine.analyze_frames(frames)
+        for code, df in frames.items():
+            probability, reason = self.engine.analyze_dataframe(df)
+            self.assertAlmostEqual(float(actual[code][0]), float(probability), delta=1e-9, msg=code)
+            self.assertEqual(actual[code][1], reason, msg=code)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+流式指标测试：逐根K线（含盘中替换）增量更新后与对分析窗口重新批量计算一致，保存后恢复结果不变
+
+运行: python -m pytest -q tests
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import make_bar_frames
+
+SEED_BARS = 25
+
+
+class StreamingIndicatorTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp(prefix="stock_test_")
+        os.chdir(self.tmp_dir)
+        from modules.bar_cache import BarStore
+        from modules.recommendation import StockRecommendationEngine
+        self.engine = StockRecommendationEngine()
+        self.store = BarStore(os.path.join(self.tmp_dir, "bars.db"))
+
+    def tearDown(self):
+        self.store.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def expected(self, df, upto):
+        """对截至第 upto 根K线的分析窗口重新批量计算：(当天, 结果)"""
+        from modules.streaming import LOOKBACK_DAYS
+        today = datetime.strptime(df["date"].iloc[upto - 1], "%Y-%m-%d")
+        cutoff = (today - timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+        window = df.iloc[:upto]
+        window = window[window["date"] >= cutoff]
+        return today, self.engine.analyze_frames({"": window})[""]
+
+    def assertSameResult(self, got, want, msg):
+        self.assertAlmostEqual(float(got[0]), float(want[0]), delta=1e-9, msg=msg)
+        self.assertEqual(got[1], want[1], msg=msg)
+
+    def test_incremental_updates_match_batch(self):
+        from modules.streaming import IndicatorBook
+        frames = {code: df for code, df in make_bar_frames(30, 70).items() if len(df) > SEED_BARS}
+        self.assertTrue(frames)
+        book = IndicatorBook(self.store, "sma")
+        for code, df in frames.items():
+            book.seed(code, df.iloc[:SEED_BARS])
+
+        rng = random.Random(0)
+        weights = self.engine.indicators_weights
+        for code, df in frames.items():
+            for i in range(SEED_BARS, len(df)):
+                date, close, volume = df["date"].iloc[i], float(df["close"].iloc[i]), float(df["volume"].iloc[i])
+                if rng.random() < 0.3:
+                    # 盘中先收到一个不同的价格，随后被收盘数据替换
+                    book.update(code, date, round(close * rng.uniform(0.95, 1.05), 2), volume / 2)
+                book.update(code, date, close, volume)
+                today, want = self.expected(df, i + 1)
+                self.assertSameResult(book.analyze(code, weights, today), want, f"{code} {date}")
+
+        # 保存后重新加载，结果不变
+        book.save()
+        restored = IndicatorBook(self.store, "sma")
+        for code, df in frames.items():
+            today = datetime.strptime(df["date"].iloc[-1], "%Y-%m-%d")
+            self.assertSameResult(restored.analyze(code, weights, today), book.analyze(code, weights, today), code)
+
+
+if __name__ == "__main__":
+    unittest.main()